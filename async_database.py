@@ -0,0 +1,399 @@
+import asyncio
+import inspect
+import json
+import logging
+from contextlib import asynccontextmanager
+from datetime import datetime, timezone
+
+import aiosqlite
+
+from database import (Database, CLAIM_TRANSFORM_JOB_SQL, CLAIM_UPLOAD_JOB_SQL, COMPLETE_TRANSFORM_JOB_SQL,
+                      COMPLETE_UPLOAD_JOB_SQL, DELETE_MESSAGE_SQL, DELETE_PROMPT_SQL, FAIL_TRANSFORM_JOB_SQL,
+                      FAIL_UPLOAD_JOB_SQL, FIND_MESSAGE_ROW_ID_SQL, INSERT_PROMPT_SQL, INSERT_TRANSFORMED_LIBRARY_SQL,
+                      INSERT_UPLOAD_JOB_SQL, LAST_SCAN_DATE_SQL, LAST_SCAN_ID_SQL, LAST_SCAN_MESSAGES_SQL,
+                      NEXT_TRANSFORM_JOB_SQL, NEXT_UPLOAD_JOB_SQL, PROMPTS_SQL, RESET_RUNNING_TRANSFORM_JOBS_SQL,
+                      RETRY_FAILED_TRANSFORM_JOBS_SQL, SENDING_UPLOAD_JOBS_SQL, TRANSFORMED_LIBRARIES_PAGE_SQL,
+                      TRANSFORMED_LIBRARIES_SQL, TRANSFORMED_LIBRARY_SQL, TRANSFORM_JOB_COUNTS_SQL, UPDATE_PROMPT_SQL,
+                      UPLOAD_JOB_COUNTS_SQL, UPLOAD_JOB_SQL, UPSERT_LAST_SCAN_SQL, UPSERT_MESSAGE_SQL,
+                      enqueue_transform_query, messages_page_cursor, messages_page_query, messages_query,
+                      search_query)
+
+
+async def resolve(result):
+    """
+    Возвращает результат вызова базы данных, дожидаясь его, если база асинхронная.
+    Позволяет сканированию и очередям работать и с Database, и с AsyncDatabase.
+    """
+    if inspect.isawaitable(result):
+        return await result
+    return result
+
+
+class AsyncDatabase:
+    """
+    Асинхронный доступ к базе данных на aiosqlite с теми же операциями, что и у Database.
+
+    Запись идет через одно соединение, транзакции на нем выполняются по очереди под
+    асинхронной блокировкой. Чтение — через пул из readers отдельных соединений, поэтому
+    долгий запрос истории не задерживает запись пачки сканирования или задачу выгрузки.
+    Каждое соединение aiosqlite работает в своем потоке, так что цикл событий, на котором
+    работает Telethon, не ждет диска. База работает в режиме WAL, где чтение не
+    блокирует запись. Таблицы создаются синхронным Database при открытии.
+    """
+
+    def __init__(self, db_name='telegram_parser.db', readers=3, cache_size_kb=20000):
+        self.db_name = db_name
+        self.reader_count = readers
+        self.cache_size_kb = cache_size_kb
+        self.fts_enabled = False
+        self.writer = None
+        self._readers = None
+        self._connections = []
+        self._write_lock = asyncio.Lock()
+
+    @classmethod
+    async def open(cls, db_name='telegram_parser.db', readers=3, cache_size_kb=20000):
+        db = cls(db_name, readers, cache_size_kb)
+        await db.connect()
+        return db
+
+    async def __aenter__(self):
+        await self.connect()
+        return self
+
+    async def __aexit__(self, exc_type, exc, traceback):
+        await self.close()
+
+    async def connect(self):
+        # Схема, миграции и включение WAL (сохраняется в файле базы) — в синхронном Database
+        self.fts_enabled = await asyncio.to_thread(self._prepare_schema)
+
+        self.writer = await aiosqlite.connect(self.db_name)
+        await self.writer.execute('PRAGMA synchronous=NORMAL')
+        await self.writer.execute(f'PRAGMA cache_size=-{int(self.cache_size_kb)}')
+        await self.writer.execute('PRAGMA temp_store=MEMORY')
+        self._connections.append(self.writer)
+
+        self._readers = asyncio.Queue()
+        for _ in range(self.reader_count):
+            reader = await aiosqlite.connect(self.db_name)
+            await reader.execute('PRAGMA query_only=ON')
+            await reader.execute(f'PRAGMA cache_size=-{int(self.cache_size_kb)}')
+            self._connections.append(reader)
+            self._readers.put_nowait(reader)
+        logging.info(f"Асинхронная база данных открыта: 1 соединение записи, {self.reader_count} чтения.")
+
+    def _prepare_schema(self):
+        db = Database(self.db_name, wal=True, cache_size_kb=self.cache_size_kb)
+        try:
+            return db.fts_enabled
+        finally:
+            db.close()
+
+    @asynccontextmanager
+    async def _writing(self):
+        """
+        Выдает соединение записи на время одной транзакции: коммит в конце, откат при ошибке.
+        """
+        async with self._write_lock:
+            try:
+                yield self.writer
+                await self.writer.commit()
+            except BaseException:
+                await self.writer.rollback()
+                raise
+
+    @asynccontextmanager
+    async def _reading(self):
+        reader = await self._readers.get()
+        try:
+            yield reader
+        finally:
+            self._readers.put_nowait(reader)
+
+    async def _fetchall(self, sql, params=()):
+        async with self._reading() as reader:
+            return list(await reader.execute_fetchall(sql, params))
+
+    async def _fetchone(self, sql, params=()):
+        async with self._reading() as reader:
+            async with reader.execute(sql, params) as cursor:
+                return await cursor.fetchone()
+
+    async def save_message(self, channel_name, message_text, message_date, channel_id=None, message_id=None):
+        try:
+            async with self._writing() as conn:
+                await conn.execute(UPSERT_MESSAGE_SQL, (channel_name, message_text, message_date, channel_id,
+                                                        message_id))
+            logging.info(f"Сообщение сохранено: {message_text[:50]}...")
+        except Exception as e:
+            logging.error(f"Ошибка при сохранении сообщения: {e}")
+
+    async def save_messages(self, channel_name, messages, last_message_date=None, last_message_id=None):
+        """
+        Сохраняет пачку сообщений и контрольную точку канала одной транзакцией (см. Database.save_messages).
+        """
+        try:
+            async with self._writing() as conn:
+                cursor = await conn.executemany(UPSERT_MESSAGE_SQL, [
+                    (channel_name,) + (tuple(message) + (None, None))[:4] for message in messages
+                ])
+                saved = cursor.rowcount
+                if last_message_date is not None:
+                    await conn.execute(UPSERT_LAST_SCAN_SQL, (channel_name, last_message_date, last_message_id))
+            logging.info(f"Сохранено {saved} сообщений канала {channel_name}.")
+            return saved
+        except Exception as e:
+            logging.error(f"Ошибка при сохранении сообщений: {e}")
+            raise
+
+    async def find_message_row_id(self, channel_id, message_id):
+        row = await self._fetchone(FIND_MESSAGE_ROW_ID_SQL, (channel_id, message_id))
+        return row[0] if row else None
+
+    async def delete_message(self, message_id):
+        try:
+            async with self._writing() as conn:
+                await conn.execute(DELETE_MESSAGE_SQL, (message_id,))
+            logging.info(f"Сообщение с ID {message_id} удалено.")
+        except Exception as e:
+            logging.error(f"Ошибка при удалении сообщения: {e}")
+
+    async def get_last_scan_date(self, channel_name):
+        row = await self._fetchone(LAST_SCAN_DATE_SQL, (channel_name,))
+        if row:
+            return datetime.fromisoformat(row[0])
+        logging.info(f"Для канала {channel_name} последняя дата сканирования не найдена.")
+        return None
+
+    async def get_last_scan_id(self, channel_name):
+        row = await self._fetchone(LAST_SCAN_ID_SQL, (channel_name,))
+        return row[0] if row else None
+
+    async def update_last_scan_date(self, channel_name, last_message_date, last_message_id=None):
+        async with self._writing() as conn:
+            await conn.execute(UPSERT_LAST_SCAN_SQL, (channel_name, last_message_date, last_message_id))
+
+    async def save_transformed_library(self, library_name, original_description, transformed_description,
+                                       image_path):
+        try:
+            async with self._writing() as conn:
+                cursor = await conn.execute(INSERT_TRANSFORMED_LIBRARY_SQL, (library_name, original_description,
+                                                                         transformed_description, image_path))
+            logging.info(f"Преобразованная библиотека сохранена")
+            return cursor.lastrowid
+        except Exception as e:
+            logging.error(f"Ошибка при сохранении преобразованной библиотеки: {e}")
+            return None
+
+    # Методы для очереди пакетного преобразования
+    async def enqueue_transform_jobs(self, message_ids=None, prompt=None, channel_name=None, date_from=None,
+                                     date_to=None):
+        built = enqueue_transform_query(message_ids, prompt, channel_name, date_from, date_to)
+        if built is None:
+            return 0
+        query, params = built
+        try:
+            async with self._writing() as conn:
+                cursor = await conn.execute(query, params)
+            logging.info(f"В очередь преобразования добавлено {cursor.rowcount} задач.")
+            return cursor.rowcount
+        except Exception as e:
+            logging.error(f"Ошибка при постановке задач преобразования: {e}")
+            raise
+
+    async def claim_transform_job(self):
+        now = datetime.now()
+        async with self._writing() as conn:
+            async with conn.execute(NEXT_TRANSFORM_JOB_SQL, (now,)) as cursor:
+                row = await cursor.fetchone()
+            if row is None:
+                return None
+            cursor = await conn.execute(CLAIM_TRANSFORM_JOB_SQL, (now, row[0]))
+            if cursor.rowcount == 0:
+                return None
+        return tuple(row[:6]) + (row[6] + 1,)
+
+    async def complete_transform_job(self, job_id, library_id):
+        async with self._writing() as conn:
+            await conn.execute(COMPLETE_TRANSFORM_JOB_SQL, (library_id, datetime.now(), job_id))
+
+    async def fail_transform_job(self, job_id, error, retry_at=None):
+        async with self._writing() as conn:
+            await conn.execute(FAIL_TRANSFORM_JOB_SQL, ('pending' if retry_at else 'failed', str(error), retry_at,
+                                                datetime.now(), job_id))
+
+    async def reset_running_transform_jobs(self):
+        async with self._writing() as conn:
+            cursor = await conn.execute(RESET_RUNNING_TRANSFORM_JOBS_SQL, (datetime.now(),))
+        if cursor.rowcount:
+            logging.info(f"Возвращено в очередь {cursor.rowcount} прерванных задач преобразования.")
+        return cursor.rowcount
+
+    async def retry_failed_transform_jobs(self):
+        async with self._writing() as conn:
+            cursor = await conn.execute(RETRY_FAILED_TRANSFORM_JOBS_SQL, (datetime.now(), datetime.now()))
+        return cursor.rowcount
+
+    async def get_transform_job_counts(self):
+        rows = await self._fetchall(TRANSFORM_JOB_COUNTS_SQL)
+        counts = {'pending': 0, 'running': 0, 'done': 0, 'failed': 0}
+        counts.update(dict(rows))
+        return counts
+
+    # Методы для чтения истории
+    async def get_messages(self, limit=None):
+        try:
+            history = await self._fetchall(*messages_query(limit))
+            logging.info(f"Получено {len(history)} записей истории сканирования.")
+            return history
+        except Exception as e:
+            logging.error(f"Ошибка при получении истории сканирования: {e}")
+            return []
+
+    async def get_messages_page(self, channel_name=None, date_from=None, date_to=None, cursor=None, page_size=50,
+                                order='date'):
+        query, params = messages_page_query(channel_name, date_from, date_to, cursor, page_size, order)
+        try:
+            rows = await self._fetchall(query, params)
+            return rows, messages_page_cursor(rows, page_size, order)
+        except Exception as e:
+            logging.error(f"Ошибка при получении страницы истории: {e}")
+            return [], None
+
+    async def search_messages(self, query, channel_name=None, date_from=None, date_to=None, limit=50, prefix=True):
+        if not self.fts_enabled:
+            logging.error("Полнотекстовый поиск недоступен.")
+            return []
+
+        built = search_query(query, channel_name, date_from, date_to, limit, prefix)
+        if built is None:
+            return []
+        sql, params = built
+        try:
+            results = await self._fetchall(sql, params)
+            logging.info(f"По запросу '{query}' найдено {len(results)} сообщений.")
+            return results
+        except Exception as e:
+            logging.error(f"Ошибка при поиске сообщений: {e}")
+            return []
+
+    async def get_last_scan_messages(self):
+        try:
+            messages = await self._fetchall(LAST_SCAN_MESSAGES_SQL)
+            logging.info(f"Получено {len(messages)} сообщений для канала.")
+            return messages
+        except Exception as e:
+            logging.error(f"Ошибка при получении сообщений: {e}")
+            return []
+
+    async def get_transformed_libraries(self):
+        try:
+            libraries = await self._fetchall(TRANSFORMED_LIBRARIES_SQL)
+            logging.info(f"Получено {len(libraries)} преобразованных библиотек.")
+            return libraries
+        except Exception as e:
+            logging.error(f"Ошибка при получении преобразованных библиотек: {e}")
+            return []
+
+    async def get_transformed_libraries_page(self, cursor=None, page_size=50):
+        try:
+            rows = await self._fetchall(TRANSFORMED_LIBRARIES_PAGE_SQL, (cursor or 0, page_size))
+            next_cursor = rows[-1][0] if len(rows) == page_size else None
+            return rows, next_cursor
+        except Exception as e:
+            logging.error(f"Ошибка при получении страницы преобразованных библиотек: {e}")
+            return [], None
+
+    async def get_transformed_library(self, library_id):
+        return await self._fetchone(TRANSFORMED_LIBRARY_SQL, (library_id,))
+
+    # Методы для очереди выгрузки в Telegram
+    async def enqueue_upload_job(self, channel_name, captions, image_paths, library_ids=None):
+        now = datetime.now()
+        async with self._writing() as conn:
+            cursor = await conn.execute(INSERT_UPLOAD_JOB_SQL, (channel_name, json.dumps(list(captions), ensure_ascii=False),
+                                                                json.dumps(list(image_paths)),
+                                                                json.dumps(list(library_ids or [])), now, now, now))
+        logging.info(f"Выгрузка в канал {channel_name} поставлена в очередь ({len(image_paths)} изображений).")
+        return cursor.lastrowid
+
+    async def claim_upload_job(self):
+        now = datetime.now()
+        async with self._writing() as conn:
+            async with conn.execute(NEXT_UPLOAD_JOB_SQL, (now,)) as cursor:
+                row = await cursor.fetchone()
+            if row is None:
+                return None
+            cursor = await conn.execute(CLAIM_UPLOAD_JOB_SQL, (datetime.now(timezone.utc), now, row[0]))
+            if cursor.rowcount == 0:
+                return None
+        return row[0], row[1], json.loads(row[2]), json.loads(row[3]), row[4] + 1
+
+    async def get_sending_upload_jobs(self):
+        rows = await self._fetchall(SENDING_UPLOAD_JOBS_SQL)
+        return [(row[0], row[1], json.loads(row[2]), json.loads(row[3]),
+                 datetime.fromisoformat(row[4]) if row[4] else None) for row in rows]
+
+    async def complete_upload_job(self, job_id, message_ids):
+        async with self._writing() as conn:
+            await conn.execute(COMPLETE_UPLOAD_JOB_SQL, (json.dumps(list(message_ids)), datetime.now(), job_id))
+
+    async def fail_upload_job(self, job_id, error, retry_at=None):
+        async with self._writing() as conn:
+            await conn.execute(FAIL_UPLOAD_JOB_SQL, ('pending' if retry_at else 'failed', str(error) if error else None,
+                                             retry_at, datetime.now(), job_id))
+
+    async def get_upload_job(self, job_id):
+        row = await self._fetchone(UPLOAD_JOB_SQL, (job_id,))
+        if row is None:
+            return None
+        return row[0], json.loads(row[1]) if row[1] else [], row[2]
+
+    async def get_upload_job_counts(self):
+        rows = await self._fetchall(UPLOAD_JOB_COUNTS_SQL)
+        counts = {'pending': 0, 'sending': 0, 'sent': 0, 'failed': 0}
+        counts.update(dict(rows))
+        return counts
+
+    # Методы для работы с промтами
+    async def save_prompt(self, name, message_prompt, image_prompt, name_prompt):
+        try:
+            async with self._writing() as conn:
+                await conn.execute(INSERT_PROMPT_SQL, (name, message_prompt, image_prompt, name_prompt))
+            logging.info(f"Промт '{name}' сохранен.")
+        except Exception as e:
+            logging.error(f"Ошибка при сохранении промта: {e}")
+
+    async def get_prompts(self):
+        try:
+            prompts = await self._fetchall(PROMPTS_SQL)
+            logging.info(f"Получено {len(prompts)} промтов.")
+            return prompts
+        except Exception as e:
+            logging.error(f"Ошибка при получении промтов: {e}")
+            return []
+
+    async def update_prompt(self, prompt_id, message_prompt, image_prompt, name_prompt):
+        try:
+            async with self._writing() as conn:
+                await conn.execute(UPDATE_PROMPT_SQL, (message_prompt, image_prompt, name_prompt, prompt_id))
+            logging.info(f"Промт с ID {prompt_id} обновлен.")
+        except Exception as e:
+            logging.error(f"Ошибка при обновлении промта: {e}")
+
+    async def delete_prompt(self, prompt_id):
+        try:
+            async with self._writing() as conn:
+                await conn.execute(DELETE_PROMPT_SQL, (prompt_id,))
+            logging.info(f"Промт с ID {prompt_id} удален.")
+        except Exception as e:
+            logging.error(f"Ошибка при удалении промта: {e}")
+
+    async def close(self):
+        # Запись, начатая до закрытия, должна завершиться
+        async with self._write_lock:
+            for conn in self._connections:
+                await conn.close()
+            self._connections = []
+        logging.info("Асинхронное соединение с базой данных закрыто.")
@@ -0,0 +1,4 @@
+"""
+Бенчмарки пути сканирования на синтетических каналах (без обращения к Telegram API).
+Запуск из корня проекта: python -m benchmarks.run_benchmarks
+"""
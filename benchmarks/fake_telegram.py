@@ -0,0 +1,175 @@
+import asyncio
+import random
+import zlib
+from datetime import datetime, timedelta, timezone
+
+from rate_limiter import RateLimiter
+from telegram_client import TelegramClientWrapper, MESSAGES_PAGE_SIZE
+
+RUSSIAN_WORDS = (
+    'библиотека', 'новая', 'версия', 'для', 'работы', 'с', 'данными', 'быстрый', 'простой', 'удобный',
+    'инструмент', 'разработчиков', 'поддержка', 'асинхронных', 'запросов', 'позволяет', 'легко', 'создавать',
+    'приложения', 'сервер', 'клиент', 'обзор', 'возможностей', 'пример', 'кода', 'установка', 'через',
+    'документация', 'проект', 'открытым', 'исходным', 'кодом', 'тестирование', 'производительность', 'модуль',
+    'функция', 'класс', 'метод', 'ошибка', 'исправлена', 'релиз', 'сообщество', 'канал', 'подписывайтесь',
+)
+
+ENGLISH_WORDS = (
+    'library', 'new', 'release', 'for', 'working', 'with', 'data', 'fast', 'simple', 'handy', 'tool',
+    'developers', 'support', 'async', 'requests', 'lets', 'you', 'easily', 'build', 'applications', 'server',
+    'client', 'overview', 'features', 'code', 'example', 'install', 'via', 'docs', 'project', 'open', 'source',
+    'testing', 'performance', 'module', 'function', 'class', 'method', 'bug', 'fixed', 'community', 'channel',
+)
+
+# Слова, по которым бенчмарки ищут сообщения; попадают в часть синтетических сообщений
+TOPIC_WORDS = {
+    'ru': ('python', 'библиотека', 'фреймворк'),
+    'en': ('python', 'library', 'framework'),
+}
+EXCLUDE_WORDS = {
+    'ru': ('реклама', 'розыгрыш'),
+    'en': ('advertisement', 'giveaway'),
+}
+
+
+class FakeMessage:
+    """
+    Сообщение с атрибутами сообщения Telethon, которые использует парсер.
+    """
+
+    def __init__(self, message_id, text, date, chat_id, out=False):
+        self.id = message_id
+        self.text = text
+        self.message = text
+        self.date = date
+        self.chat_id = chat_id
+        self.out = out
+
+
+class FakeChannel:
+    def __init__(self, name, channel_id, messages):
+        self.name = name
+        self.id = channel_id
+        self.messages = messages  # В порядке возрастания ID
+
+
+def substring_is_message_valid(text, keywords, exclude_words):
+    """
+    Прежняя проверка TelegramClientWrapper.is_message_valid по подстрокам (до KeywordMatcher):
+    эталон поведения в тестах и точка отсчета в бенчмарках.
+    """
+    if keywords and not any(keyword.strip().lower() in text.lower() for keyword in keywords):
+        return False
+    if exclude_words and exclude_words != '' and exclude_words != [''] and any(
+            exclude_word.strip().lower() in text.lower() for exclude_word in exclude_words):
+        return False
+    return True
+
+
+def make_text(rng, words, length, topic_word=None, exclude_word=None):
+    """
+    Собирает текст из случайных слов длиной около length символов.
+    """
+    parts = []
+    size = 0
+    while size < length:
+        word = rng.choice(words)
+        parts.append(word)
+        size += len(word) + 1
+    for word in (topic_word, exclude_word):
+        if word:
+            parts.insert(rng.randrange(len(parts) + 1), word)
+    return ' '.join(parts)
+
+
+def make_channel(name, size, language='ru', text_length=300, topic_ratio=0.3, exclude_ratio=0.05, seed=0,
+                 start=datetime(2024, 1, 1, tzinfo=timezone.utc)):
+    """
+    Создает синтетический канал из size сообщений на русском ('ru') или английском ('en').
+    Доля topic_ratio сообщений содержит ключевые слова TOPIC_WORDS, доля exclude_ratio — исключаемые.
+    Сообщения идут с интервалом в минуту; каждое десятое — без текста (как фото без подписи).
+    """
+    rng = random.Random(f"{seed}:{name}")
+    words = RUSSIAN_WORDS if language == 'ru' else ENGLISH_WORDS
+    channel_id = -1000000000000 - zlib.crc32(name.encode('utf-8')) % 1000000
+    messages = []
+    for index in range(size):
+        text = ''
+        if index % 10 != 9:
+            topic_word = rng.choice(TOPIC_WORDS[language]) if rng.random() < topic_ratio else None
+            exclude_word = rng.choice(EXCLUDE_WORDS[language]) if rng.random() < exclude_ratio else None
+            text = make_text(rng, words, text_length, topic_word, exclude_word)
+        messages.append(FakeMessage(index + 1, text, start + timedelta(minutes=index), channel_id))
+    return FakeChannel(name, channel_id, messages)
+
+
+class FakeTelegramClient:
+    """
+    Локальная замена клиента Telethon для бенчмарков: отдает сообщения синтетических каналов.
+
+    Поддерживает то подмножество API (get_entity, get_messages, iter_messages с offset_date,
+    min_id, max_id, reverse и search), которым пользуется TelegramClientWrapper.
+    page_latency — задержка в секундах на каждую страницу из MESSAGES_PAGE_SIZE сообщений,
+    имитирующая сетевой запрос; по умолчанию 0, чтобы измерять только работу парсера.
+    """
+
+    def __init__(self, channels, page_latency=0.0):
+        self.channels = {channel.name: channel for channel in channels}
+        self.page_latency = page_latency
+        self.requests = 0
+
+    def is_connected(self):
+        return True
+
+    async def is_user_authorized(self):
+        return True
+
+    async def disconnect(self):
+        pass
+
+    async def get_entity(self, name):
+        self.requests += 1
+        return self.channels[name]
+
+    async def get_messages(self, entity, limit=1, **kwargs):
+        return [message async for message in self.iter_messages(entity, limit=limit, **kwargs)]
+
+    async def iter_messages(self, entity, limit=None, offset_date=None, min_id=0, max_id=0, reverse=False,
+                            search=None, wait_time=None, **kwargs):
+        messages = entity.messages
+        if min_id:
+            messages = [message for message in messages if message.id > min_id]
+        if max_id:
+            messages = [message for message in messages if message.id < max_id]
+        if offset_date is not None:
+            if reverse:
+                messages = [message for message in messages if message.date > offset_date]
+            else:
+                messages = [message for message in messages if message.date < offset_date]
+        if search:
+            query = search.lower()
+            messages = [message for message in messages if query in message.text.lower()]
+        if not reverse:
+            messages = messages[::-1]
+        if limit:
+            messages = messages[:limit]
+
+        for index, message in enumerate(messages):
+            if index % MESSAGES_PAGE_SIZE == 0:
+                self.requests += 1
+                if self.page_latency:
+                    await asyncio.sleep(self.page_latency)
+            yield message
+
+
+def create_client_wrapper(channels, page_latency=0.0, requests_per_second=1000.0):
+    """
+    Возвращает TelegramClientWrapper, подключенный к FakeTelegramClient.
+    Ограничитель частоты ослаблен, чтобы измерялся парсер, а не ожидание лимита.
+    Как и настоящий клиент, создается внутри работающего цикла событий.
+    """
+    wrapper = TelegramClientWrapper(0, '', persistent=True,
+                                    rate_limiter=RateLimiter(requests_per_second, burst=requests_per_second))
+    wrapper.client = FakeTelegramClient(channels, page_latency)
+    wrapper.is_connected = True
+    return wrapper
@@ -0,0 +1,186 @@
+import argparse
+import asyncio
+import json
+import logging
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+import g4f_wrapper
+from benchmarks.fake_telegram import RUSSIAN_WORDS, TOPIC_WORDS, make_text
+from benchmarks.mock_llm_server import add_settings_arguments, settings_from_args, start_server
+from benchmarks.run_benchmarks import compare_with_baseline, git_revision
+from image_store import ImageStore
+from llm_backends import create_backend
+from llm_cache import LLMCache
+
+STAGES = ("name", "text", "image", "image_request", "download", "resize", "total")
+
+
+def percentile(values, fraction):
+    """
+    Перцентиль по методу ближайшего ранга (fraction от 0 до 1).
+    """
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, int(round(fraction * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+
+def stage_metrics(results):
+    """
+    p50/p95/p99, среднее и максимум длительности каждого этапа по всем преобразованиям (в секундах).
+    """
+    metrics = {}
+    for stage in STAGES:
+        values = [result.timings[stage] for result in results if stage in result.timings]
+        if not values:
+            continue
+        metrics[stage] = {
+            "count": len(values),
+            "p50": percentile(values, 0.50),
+            "p95": percentile(values, 0.95),
+            "p99": percentile(values, 0.99),
+            "mean": sum(values) / len(values),
+            "max": max(values),
+        }
+    return metrics
+
+
+def make_messages(count, seed=0):
+    """
+    Разные тексты сообщений, чтобы кэш ответов и хранилище изображений не срабатывали.
+    """
+    rng = random.Random(seed)
+    return [f"#{index} " + make_text(rng, RUSSIAN_WORDS, 400, rng.choice(TOPIC_WORDS['ru'])) for index in range(count)]
+
+
+async def run_load(messages, concurrency, threads, timeouts):
+    """
+    Прогоняет сообщения через run_transform_pipeline, держа не больше concurrency преобразований
+    одновременно. Возвращает (результаты, общее время в секундах).
+    """
+    loop = asyncio.get_running_loop()
+    # Каждое преобразование занимает до двух потоков (текст и цепочка название -> изображение)
+    loop.set_default_executor(ThreadPoolExecutor(max_workers=threads, thread_name_prefix="load-test"))
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def transform(message_text):
+        async with semaphore:
+            return await g4f_wrapper.run_transform_pipeline(message_text, use_cache=False, **timeouts)
+
+    started = time.perf_counter()
+    results = await asyncio.gather(*(transform(message_text) for message_text in messages))
+    return results, time.perf_counter() - started
+
+
+def summarize(results, elapsed, concurrency, threads):
+    succeeded = [result for result in results if result.error is None and result.text and result.image]
+    errors = Counter(str(result.error) for result in results if result.error is not None)
+    without_image = sum(1 for result in results if result.error is None and result.text and not result.image)
+    return {
+        "name": "transform_pipeline",
+        "params": {"requests": len(results), "concurrency": concurrency, "threads": threads},
+        "metrics": {
+            "seconds": elapsed,
+            "succeeded": len(succeeded),
+            "failed": len(results) - len(succeeded),
+            "without_image": without_image,
+            "transforms_per_minute": len(succeeded) / elapsed * 60 if elapsed else None,
+            "requests_per_second": len(results) / elapsed if elapsed else None,
+        },
+        "stages": stage_metrics(results),
+        "errors": dict(errors.most_common(5)),
+    }
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        description="Нагрузочный тест преобразования сообщений на локальной заглушке нейросети."
+    )
+    parser.add_argument("--requests", type=int, default=50, help="число преобразований на каждый уровень")
+    parser.add_argument("--concurrency", nargs="+", type=int, default=[1, 4, 16],
+                        help="уровни одновременных преобразований")
+    parser.add_argument("--threads", type=int, help="размер пула потоков (по умолчанию 2 * concurrency)")
+    parser.add_argument("--url", help="адрес уже запущенного OpenAI-совместимого сервера вместо встроенной заглушки")
+    parser.add_argument("--name-timeout", type=float, default=g4f_wrapper.NAME_TIMEOUT)
+    parser.add_argument("--text-timeout", type=float, default=g4f_wrapper.TEXT_TIMEOUT)
+    parser.add_argument("--image-timeout", type=float, default=g4f_wrapper.IMAGE_TIMEOUT)
+    parser.add_argument("--output", help="файл для результата (по умолчанию — стандартный вывод)")
+    parser.add_argument("--baseline", help="JSON прошлого запуска для сравнения")
+    parser.add_argument("--verbose", action="store_true", help="выводить журнал преобразований")
+    add_settings_arguments(parser)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    # Ошибки преобразований учитываются в результате; журнал по каждой из них только мешал бы
+    logging.getLogger().setLevel(logging.INFO if args.verbose else logging.CRITICAL)
+
+    server = None
+    url = args.url
+    if url is None:
+        server, url = start_server(settings_from_args(args))
+    g4f_wrapper.set_backend(create_backend("http", url))
+
+    timeouts = {"name_timeout": args.name_timeout, "text_timeout": args.text_timeout,
+                "image_timeout": args.image_timeout}
+    levels = []
+    with tempfile.TemporaryDirectory() as directory:
+        # Кэш ответов и изображения теста не смешиваются с рабочими
+        llm_cache = LLMCache(os.path.join(directory, "llm_cache.db"))
+        g4f_wrapper.set_llm_cache(llm_cache)
+        image_store = ImageStore(os.path.join(directory, "images.db"), os.path.join(directory, "images"))
+        g4f_wrapper.set_image_store(image_store)
+        try:
+            for number, concurrency in enumerate(args.concurrency):
+                threads = args.threads or max(2, 2 * concurrency)
+                messages = make_messages(args.requests, seed=number)
+                results, elapsed = asyncio.run(run_load(messages, concurrency, threads, timeouts))
+                level = summarize(results, elapsed, concurrency, threads)
+                levels.append(level)
+                print(f"concurrency {concurrency}: {level['metrics']['transforms_per_minute']:.1f} преобразований/мин, "
+                      f"ошибок {level['metrics']['failed']}", file=sys.stderr)
+        finally:
+            g4f_wrapper.set_llm_cache(None)
+            llm_cache.close()
+            g4f_wrapper.set_image_store(None)
+            image_store.close()
+            if server is not None:
+                server.shutdown()
+
+    report = {
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "revision": git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "backend_url": args.url,
+            "parameters": {key: value for key, value in vars(args).items() if key not in ("output", "baseline")},
+        },
+        "results": levels,
+    }
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            compare_with_baseline(levels, json.load(f))
+
+    text = json.dumps(report, ensure_ascii=False, indent=2, default=str)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
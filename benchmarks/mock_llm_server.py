@@ -0,0 +1,164 @@
+import argparse
+import hashlib
+import io
+import json
+import logging
+import random
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from PIL import Image
+
+
+class MockSettings:
+    """
+    Поведение сервера-заглушки: задержки ответов (секунды, со случайным разбросом ±jitter),
+    доля ответов с ошибкой 500, размер изображения и длина текстового ответа.
+    """
+
+    def __init__(self, chat_latency=1.0, image_latency=3.0, download_latency=0.2, jitter=0.2, error_rate=0.0,
+                 image_size=(1024, 1024), reply_length=600, seed=None):
+        self.chat_latency = chat_latency
+        self.image_latency = image_latency
+        self.download_latency = download_latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.image_size = image_size
+        self.reply_length = reply_length
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+
+    def delay(self, latency):
+        with self.lock:
+            factor = 1 + self.random.uniform(-self.jitter, self.jitter)
+        if latency > 0:
+            time.sleep(latency * factor)
+
+    def should_fail(self):
+        with self.lock:
+            return self.random.random() < self.error_rate
+
+
+def make_image(size, seed=0):
+    """
+    PNG из шума: почти не сжимается, поэтому размер файла близок к настоящим сгенерированным изображениям.
+    """
+    width, height = size
+    image = Image.frombytes("RGB", size, random.Random(seed).randbytes(width * height * 3))
+    output = io.BytesIO()
+    image.save(output, format="PNG", compress_level=1)
+    return output.getvalue()
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    """
+    OpenAI-совместимые /v1/chat/completions и /v1/images/generations и раздача изображения /images/<id>.png.
+    """
+
+    protocol_version = "HTTP/1.1"  # Соединения остаются открытыми между запросами, как у настоящих API
+
+    def log_message(self, format, *args):
+        logging.debug(f"Mock-сервер: {format % args}")
+
+    def _send(self, status, body, content_type="application/json"):
+        if not isinstance(body, bytes):
+            body = json.dumps(body, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _read_json(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        return json.loads(self.rfile.read(length) or b"{}")
+
+    def do_POST(self):
+        settings = self.server.settings
+        payload = self._read_json()
+
+        if self.path == "/v1/chat/completions":
+            settings.delay(settings.chat_latency)
+            if settings.should_fail():
+                return self._send(500, {"error": {"message": "mock: сбой генерации текста"}})
+            content = payload["messages"][-1]["content"]
+            digest = hashlib.sha256(content.encode("utf-8")).hexdigest()[:8]
+            reply = f"Mock {digest}: " + content[-settings.reply_length:]
+            return self._send(200, {"choices": [{"index": 0, "message": {"role": "assistant", "content": reply}}]})
+
+        if self.path == "/v1/images/generations":
+            settings.delay(settings.image_latency)
+            if settings.should_fail():
+                return self._send(500, {"error": {"message": "mock: сбой генерации изображения"}})
+            digest = hashlib.sha256(payload.get("prompt", "").encode("utf-8")).hexdigest()[:16]
+            host, port = self.server.server_address[:2]
+            return self._send(200, {"data": [{"url": f"http://{host}:{port}/images/{digest}.png"}]})
+
+        self._send(404, {"error": {"message": "not found"}})
+
+    def do_GET(self):
+        settings = self.server.settings
+        if self.path.startswith("/images/"):
+            settings.delay(settings.download_latency)
+            return self._send(200, self.server.image, "image/png")
+        self._send(404, {"error": {"message": "not found"}})
+
+
+def start_server(settings, host="127.0.0.1", port=0):
+    """
+    Запускает сервер-заглушку в фоновом потоке. Возвращает (сервер, базовый адрес);
+    остановка — server.shutdown(). port=0 выбирает свободный порт.
+    """
+    server = ThreadingHTTPServer((host, port), MockHandler)
+    server.daemon_threads = True
+    server.settings = settings
+    server.image = make_image(settings.image_size)
+    threading.Thread(target=server.serve_forever, name="mock-llm-server", daemon=True).start()
+    url = f"http://{server.server_address[0]}:{server.server_address[1]}"
+    logging.info(f"Mock-сервер нейросети запущен: {url}, изображение {len(server.image)} байт")
+    return server, url
+
+
+def parse_size(value):
+    width, _, height = value.lower().partition("x")
+    return int(width), int(height or width)
+
+
+def add_settings_arguments(parser):
+    parser.add_argument("--chat-latency", type=float, default=1.0, help="задержка ответа на текстовый запрос, с")
+    parser.add_argument("--image-latency", type=float, default=3.0, help="задержка генерации изображения, с")
+    parser.add_argument("--download-latency", type=float, default=0.2, help="задержка отдачи изображения, с")
+    parser.add_argument("--jitter", type=float, default=0.2, help="случайный разброс задержек (доля)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="доля ответов с ошибкой 500")
+    parser.add_argument("--image-size", type=parse_size, default=(1024, 1024), help="размер изображения, ШxВ")
+    parser.add_argument("--reply-length", type=int, default=600, help="длина текстового ответа, символов")
+    parser.add_argument("--seed", type=int, help="зерно случайных задержек и ошибок")
+
+
+def settings_from_args(args):
+    return MockSettings(args.chat_latency, args.image_latency, args.download_latency, args.jitter, args.error_rate,
+                        args.image_size, args.reply_length, args.seed)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Локальная заглушка API нейросети для нагрузочных тестов.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    add_settings_arguments(parser)
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    server, url = start_server(settings_from_args(args), args.host, args.port)
+    print(f"LLM_BACKEND=http LLM_BACKEND_URL={url}", flush=True)
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
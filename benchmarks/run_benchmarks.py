@@ -0,0 +1,370 @@
+import argparse
+import asyncio
+import json
+import logging
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+from benchmarks.fake_telegram import (TOPIC_WORDS, EXCLUDE_WORDS, make_channel, create_client_wrapper,
+                                      substring_is_message_valid)
+from database import Database
+from keyword_matcher import KeywordMatcher
+from scan_engine import ScanEngine, ChannelScanConfig
+
+BENCHMARKS = ("scan_channel", "scan_engine", "is_message_valid", "database")
+
+ALPHABETS = {
+    'ru': 'абвгдежзийклмнопрстуфхцчшщыэюя',
+    'en': 'abcdefghijklmnopqrstuvwxyz',
+}
+
+
+def measure(func, repeat):
+    """
+    Выполняет func repeat раз и возвращает (длительности в секундах, результат последнего запуска).
+    """
+    timings = []
+    result = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = func()
+        timings.append(time.perf_counter() - started)
+    return timings, result
+
+
+def timing_metrics(timings, count=None, unit="messages"):
+    """
+    Метрики по длительностям: лучшее и медианное время и, если задан count, скорость по лучшему запуску.
+    """
+    best = min(timings)
+    metrics = {"seconds_best": best, "seconds_median": statistics.median(timings)}
+    if count is not None:
+        metrics[f"{unit}_per_second"] = count / best if best else None
+    return metrics
+
+
+def temp_database_path(directory):
+    descriptor, path = tempfile.mkstemp(suffix='.db', dir=directory)
+    os.close(descriptor)  # Пустой файл SQLite открывает как новую базу
+    return path
+
+
+def make_keywords(language, count, seed=0):
+    """
+    Список из count ключевых слов: слова TOPIC_WORDS, дополненные случайными словами того же алфавита.
+    """
+    rng = random.Random(f"{seed}:{language}:{count}")
+    keywords = list(TOPIC_WORDS[language][:count])
+    alphabet = ALPHABETS[language]
+    while len(keywords) < count:
+        keywords.append(''.join(rng.choice(alphabet) for _ in range(rng.randint(5, 10))))
+    return keywords
+
+
+def bench_scan_channel(args):
+    """
+    TelegramClientWrapper.scan_channel целиком: чтение истории, проверка ключевых слов, сбор найденного.
+    """
+    results = []
+    for language in args.languages:
+        for size in args.sizes:
+            channel = make_channel(f"bench_{language}_{size}", size, language, args.text_length)
+            keywords, exclude_words = list(TOPIC_WORDS[language]), list(EXCLUDE_WORDS[language])
+
+            async def scan():
+                wrapper = create_client_wrapper([channel], args.page_latency)
+                return await wrapper.scan_channel(channel.name, keywords=keywords, exclude_words=exclude_words,
+                                                  limit=None)
+
+            def run():
+                return asyncio.run(scan())
+
+            timings, found = measure(run, args.repeat)
+            metrics = timing_metrics(timings, size)
+            metrics["found"] = len(found)
+            results.append({
+                "name": "scan_channel",
+                "params": {"language": language, "messages": size, "text_length": args.text_length,
+                           "page_latency": args.page_latency},
+                "metrics": metrics,
+            })
+    return results
+
+
+def bench_scan_engine(args, directory):
+    """
+    ScanEngine с записью найденного в базу данных: сканирование одного канала от начала до контрольной точки.
+    """
+    results = []
+    for language in args.languages:
+        for size in args.sizes:
+            channel = make_channel(f"bench_{language}_{size}", size, language, args.text_length)
+            config_words = (list(TOPIC_WORDS[language]), list(EXCLUDE_WORDS[language]))
+
+            async def scan(db):
+                wrapper = create_client_wrapper([channel], args.page_latency)
+                config = ChannelScanConfig(channel.name, *config_words)
+                return (await ScanEngine(wrapper, db, batch_size=args.batch_size).run([config]))[0]
+
+            def run():
+                db = Database(temp_database_path(directory), wal=True)
+                try:
+                    return asyncio.run(scan(db))
+                finally:
+                    db.close()
+
+            timings, result = measure(run, args.repeat)
+            metrics = timing_metrics(timings, size)
+            metrics["saved"] = result.found
+            results.append({
+                "name": "scan_engine",
+                "params": {"language": language, "messages": size, "text_length": args.text_length,
+                           "batch_size": args.batch_size, "page_latency": args.page_latency},
+                "metrics": metrics,
+            })
+    return results
+
+
+def bench_is_message_valid(args):
+    """
+    Стоимость проверки одного сообщения в зависимости от числа ключевых слов
+    и время компиляции этого списка; для сравнения замеряется прежняя проверка по подстрокам.
+    """
+    async def create_wrapper():
+        return create_client_wrapper([])
+
+    wrapper = asyncio.run(create_wrapper())
+    results = []
+    for language in args.languages:
+        texts = [message.text for message in make_channel(f"valid_{language}", args.samples, language,
+                                                          args.text_length).messages if message.text]
+        exclude_words = list(EXCLUDE_WORDS[language])
+        for count in args.keyword_counts:
+            keywords = make_keywords(language, count)
+
+            compile_timings, matcher = measure(lambda: KeywordMatcher(keywords, exclude_words), args.repeat)
+
+            def check(matcher=matcher):
+                return sum(1 for text in texts if wrapper.is_message_valid(text, keywords, exclude_words, matcher))
+
+            timings, matched = measure(check, args.repeat)
+            # Без готового KeywordMatcher: поиск в кэше compile_matcher на каждом вызове
+            cached_timings, _ = measure(
+                lambda: sum(1 for text in texts if wrapper.is_message_valid(text, keywords, exclude_words)),
+                args.repeat)
+            substring_timings, substring_matched = measure(
+                lambda: sum(1 for text in texts if substring_is_message_valid(text, keywords, exclude_words)),
+                args.repeat)
+            if substring_matched != matched:
+                logging.error(f"is_message_valid: {matched} совпадений против {substring_matched} у проверки по подстрокам")
+
+            results.append({
+                "name": "is_message_valid",
+                "params": {"language": language, "keywords": count, "text_length": args.text_length,
+                           "messages": len(texts)},
+                "metrics": {
+                    "compile_ms_best": min(compile_timings) * 1000,
+                    "ns_per_message": min(timings) / len(texts) * 1e9,
+                    "ns_per_message_cached_compile": min(cached_timings) / len(texts) * 1e9,
+                    "ns_per_message_substring": min(substring_timings) / len(texts) * 1e9,
+                    "speedup_vs_substring": min(substring_timings) / min(timings),
+                    "messages_per_second": len(texts) / min(timings),
+                    "matched": matched,
+                },
+            })
+    return results
+
+
+def bench_database(args, directory):
+    """
+    Скорость записи и чтения Database: пакетная и поштучная вставка, повторная запись (upsert),
+    постраничное чтение истории, полнотекстовый поиск и чтение контрольной точки.
+    """
+    results = []
+    for language in args.languages:
+        channel = make_channel(f"db_{language}", args.db_messages, language, args.text_length)
+        rows = [(message.text, message.date, message.chat_id, message.id) for message in channel.messages]
+        single_count = min(len(rows), args.single_inserts)
+        measurements = {name: [] for name in ("insert_batch", "insert_single", "upsert_batch", "read_pages",
+                                              "search", "checkpoint_lookup")}
+        pages = 0
+
+        for _ in range(args.repeat):
+            db = Database(temp_database_path(directory), wal=True)
+            try:
+                started = time.perf_counter()
+                for start in range(0, len(rows), args.batch_size):
+                    batch = rows[start:start + args.batch_size]
+                    db.save_messages(channel.name, batch, batch[-1][1], batch[-1][3])
+                measurements["insert_batch"].append(time.perf_counter() - started)
+
+                started = time.perf_counter()
+                for start in range(0, len(rows), args.batch_size):
+                    db.save_messages(channel.name, rows[start:start + args.batch_size])
+                measurements["upsert_batch"].append(time.perf_counter() - started)
+
+                started = time.perf_counter()
+                for text, date, chat_id, message_id in rows[:single_count]:
+                    db.save_message("single", text, date, chat_id - 1, message_id)
+                measurements["insert_single"].append(time.perf_counter() - started)
+
+                started = time.perf_counter()
+                pages = 0
+                cursor = None
+                while True:
+                    page, cursor = db.get_messages_page(channel_name=channel.name, cursor=cursor, page_size=50)
+                    pages += 1
+                    if cursor is None:
+                        break
+                measurements["read_pages"].append(time.perf_counter() - started)
+
+                queries = [word for word in TOPIC_WORDS[language]] * (args.search_queries // 3 + 1)
+                queries = queries[:args.search_queries]
+                started = time.perf_counter()
+                for query in queries:
+                    db.search_messages(query, limit=50)
+                measurements["search"].append(time.perf_counter() - started)
+
+                started = time.perf_counter()
+                for _ in range(args.lookups):
+                    db.get_last_scan_id(channel.name)
+                measurements["checkpoint_lookup"].append(time.perf_counter() - started)
+            finally:
+                db.close()
+
+        params = {"language": language, "messages": len(rows), "text_length": args.text_length,
+                  "batch_size": args.batch_size}
+        counts = {
+            "insert_batch": (len(rows), "rows"),
+            "upsert_batch": (len(rows), "rows"),
+            "insert_single": (single_count, "rows"),
+            "read_pages": (pages, "pages"),
+            "search": (args.search_queries, "queries"),
+            "checkpoint_lookup": (args.lookups, "lookups"),
+        }
+        for name, timings in measurements.items():
+            count, unit = counts[name]
+            results.append({
+                "name": f"database.{name}",
+                "params": dict(params, operations=count),
+                "metrics": timing_metrics(timings, count, unit),
+            })
+    return results
+
+
+def result_key(result):
+    return result["name"], json.dumps(result["params"], sort_keys=True)
+
+
+def compare_with_baseline(results, baseline):
+    """
+    Добавляет к результатам отношение каждой метрики к тому же замеру из прошлого запуска
+    (больше 1 — метрика выросла). Замеры сопоставляются по имени и параметрам.
+    """
+    previous = {result_key(result): result for result in baseline.get("results", [])}
+    for result in results:
+        old = previous.get(result_key(result))
+        if old is None:
+            continue
+        result["baseline_ratio"] = {
+            name: value / old["metrics"][name]
+            for name, value in result["metrics"].items()
+            if isinstance(value, (int, float)) and old["metrics"].get(name)
+        }
+
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        description="Бенчмарки сканирования на синтетических каналах. Результат — JSON для сравнения запусков."
+    )
+    parser.add_argument("--only", nargs="+", choices=BENCHMARKS, default=list(BENCHMARKS),
+                        help="какие бенчмарки запускать")
+    parser.add_argument("--languages", nargs="+", choices=("ru", "en"), default=["ru", "en"])
+    parser.add_argument("--sizes", nargs="+", type=int, default=[1000, 10000, 50000],
+                        help="размеры синтетических каналов для сканирования")
+    parser.add_argument("--text-length", type=int, default=300, help="примерная длина сообщения в символах")
+    parser.add_argument("--keyword-counts", nargs="+", type=int, default=[1, 10, 100, 1000],
+                        help="размеры списков ключевых слов для is_message_valid")
+    parser.add_argument("--samples", type=int, default=5000, help="число сообщений для is_message_valid")
+    parser.add_argument("--db-messages", type=int, default=20000, help="число сообщений для замеров базы данных")
+    parser.add_argument("--batch-size", type=int, default=50, help="размер пачки записи в базу")
+    parser.add_argument("--single-inserts", type=int, default=1000, help="число поштучных вставок")
+    parser.add_argument("--search-queries", type=int, default=30, help="число поисковых запросов")
+    parser.add_argument("--lookups", type=int, default=5000, help="число чтений контрольной точки")
+    parser.add_argument("--page-latency", type=float, default=0.0,
+                        help="имитация сетевой задержки на страницу истории, с")
+    parser.add_argument("--repeat", type=int, default=3, help="повторов каждого замера (берется лучший)")
+    parser.add_argument("--quick", action="store_true", help="маленькие размеры для быстрой проверки")
+    parser.add_argument("--output", help="файл для результата (по умолчанию — стандартный вывод)")
+    parser.add_argument("--baseline", help="JSON прошлого запуска для сравнения")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    if args.quick:
+        args.sizes = [1000]
+        args.keyword_counts = [1, 100]
+        args.samples = 1000
+        args.db_messages = 2000
+        args.single_inserts = 200
+        args.lookups = 500
+        args.repeat = 1
+    # Журнал настраивается при импорте database.py; отладочные сообщения искажали бы замеры
+    logging.getLogger().setLevel(logging.WARNING)
+
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        for name in args.only:
+            started = time.perf_counter()
+            if name == "scan_channel":
+                results += bench_scan_channel(args)
+            elif name == "scan_engine":
+                results += bench_scan_engine(args, directory)
+            elif name == "is_message_valid":
+                results += bench_is_message_valid(args)
+            elif name == "database":
+                results += bench_database(args, directory)
+            print(f"{name}: {time.perf_counter() - started:.1f} с", file=sys.stderr)
+
+    report = {
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "revision": git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "parameters": {key: value for key, value in vars(args).items() if key not in ("output", "baseline")},
+        },
+        "results": results,
+    }
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            compare_with_baseline(results, json.load(f))
+
+    text = json.dumps(report, ensure_ascii=False, indent=2, default=str)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,383 @@
+"""
+Консольный запуск парсера без графического интерфейса (для сервера, cron и systemd).
+
+    python cli.py scan @channel -k python,библиотека --mode continue
+    python cli.py scan --file channels.txt --json
+    python cli.py transform --channel @channel --date-from 2025-01-01 --workers 5
+    python cli.py upload --channel @my_channel --library-id 12 --library-id 13 --album
+    python cli.py serve --file channels.txt --interval 600 --transform
+    python cli.py serve --file channels.txt --monitor --transform
+
+Коды выхода: 0 — успешно, 1 — ошибка хотя бы в одном канале или задаче, 2 — неверные аргументы,
+130 — прервано пользователем.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import signal
+import sys
+from datetime import datetime, timedelta
+
+from dotenv import load_dotenv
+
+EXIT_OK = 0
+EXIT_FAILED = 1
+EXIT_USAGE = 2
+EXIT_INTERRUPTED = 130
+
+
+def parse_date(value):
+    try:
+        return datetime.strptime(value, "%Y-%m-%d")
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"неверная дата {value!r}, используйте формат ГГГГ-ММ-ДД")
+
+
+def print_result(args, data, text):
+    """
+    Печатает результат команды: JSON при --json, иначе текст.
+    """
+    if args.json:
+        print(json.dumps(data, ensure_ascii=False, default=str))
+    else:
+        print(text)
+
+
+def create_telegram_client(args, persistent=True):
+    """
+    Создает клиент Telegram с бюджетом запросов из --requests-per-second и --burst
+    (без них — из переменных TELEGRAM_REQUESTS_PER_SECOND и TELEGRAM_BURST).
+    """
+    from rate_limiter import create_rate_limiter
+    from telegram_client import TelegramClientWrapper
+
+    api_id = os.getenv("API_ID")
+    api_hash = os.getenv("API_HASH")
+    if not api_id or not api_hash:
+        raise ValueError("API_ID и API_HASH должны быть указаны в .env файле.")
+    rate_limiter = create_rate_limiter(args.requests_per_second, args.burst)
+    return TelegramClientWrapper(api_id, api_hash, persistent=persistent, rate_limiter=rate_limiter)
+
+
+def load_scan_configs(args):
+    """
+    Собирает настройки сканирования из аргументов и файла (строки в формате ChannelScanConfig.from_line).
+    """
+    from scan_engine import ChannelScanConfig
+
+    configs = []
+    if args.file:
+        with open(args.file, encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if line and not line.startswith("#"):
+                    configs.append(ChannelScanConfig.from_line(line))
+
+    mode, specific_date = args.mode, None
+    if mode not in ("start", "continue"):
+        specific_date = datetime.strptime(mode, "%Y-%m-%d")
+        mode = "specific_date"
+    for channel_name in args.channels:
+        configs.append(ChannelScanConfig(channel_name, args.keywords, args.exclude, mode, specific_date, args.limit,
+                                         args.server_search))
+    return configs
+
+
+def scan_result_to_dict(result):
+    return {
+        "channel": result.channel_name,
+        "status": result.status,
+        "found": result.found,
+        "last_message_date": result.last_message_date,
+        "error": str(result.error) if result.error else None,
+    }
+
+
+async def scan_channels(args, configs):
+    from async_database import AsyncDatabase
+    from scan_engine import ScanEngine
+
+    telegram_client = create_telegram_client(args)
+    try:
+        async with AsyncDatabase() as db:
+            return await ScanEngine(telegram_client, db, concurrency=args.concurrency).run(configs)
+    finally:
+        await telegram_client.shutdown()
+
+
+def command_scan(args, db):
+    configs = load_scan_configs(args)
+    if not configs:
+        raise ValueError("Не указано ни одного канала (аргументы или --file).")
+
+    results = asyncio.run(scan_channels(args, configs))
+    print_result(args, [scan_result_to_dict(result) for result in results], "\n".join(
+        f"{result.channel_name}: ошибка ({result.error})" if result.status == "error"
+        else f"{result.channel_name}: найдено {result.found}" for result in results
+    ))
+    return EXIT_FAILED if any(result.status == "error" for result in results) else EXIT_OK
+
+
+def find_prompt(db, name):
+    if not name:
+        return None
+    for prompt in db.get_prompts():
+        if prompt[1] == name:
+            return prompt
+    raise ValueError(f"Промт {name!r} не найден.")
+
+
+async def run_transform_queue(workers, max_attempts):
+    from async_database import AsyncDatabase
+    from transform_queue import TransformQueue
+
+    async with AsyncDatabase() as db:
+        return await TransformQueue(db, workers=workers, max_attempts=max_attempts).run()
+
+
+def command_transform(args, db):
+    if args.message_ids or args.channel or args.date_from or args.date_to or args.all:
+        date_to = args.date_to + timedelta(days=1) if args.date_to else None
+        count = db.enqueue_transform_jobs(args.message_ids or None, find_prompt(db, args.prompt), args.channel,
+                                          args.date_from, date_to)
+        logging.info(f"В очередь добавлено {count} сообщений.")
+
+    failed_before = db.get_transform_job_counts()["failed"]
+    counts = asyncio.run(run_transform_queue(args.workers, args.max_attempts))
+
+    print_result(args, counts, f"Готово: {counts['done']}, в очереди: {counts['pending']}, "
+                               f"ошибок: {counts['failed']}")
+    return EXIT_FAILED if counts["failed"] > failed_before else EXIT_OK
+
+
+async def run_upload_queue(args):
+    from async_database import AsyncDatabase
+    from upload_queue import UploadQueue
+
+    telegram_client = create_telegram_client(args)
+    try:
+        async with AsyncDatabase() as db:
+            return await UploadQueue(db, telegram_client, max_attempts=args.max_attempts).run()
+    finally:
+        await telegram_client.shutdown()
+
+
+def command_upload(args, db):
+    from upload_queue import enqueue_libraries
+
+    libraries = []
+    for library_id in args.library_ids:
+        library = db.get_transformed_library(library_id)
+        if library is None:
+            raise ValueError(f"Преобразованное сообщение {library_id} не найдено.")
+        libraries.append(library)
+    if not libraries and args.image is None:
+        raise ValueError("Укажите --library-id или --image.")
+
+    job_ids = enqueue_libraries(db, args.channel, libraries, args.album)
+    if args.image:
+        job_ids.append(db.enqueue_upload_job(args.channel, [args.text or ""], [args.image]))
+
+    # Очередь выгружает и новые задачи, и оставшиеся с прошлых запусков
+    asyncio.run(run_upload_queue(args))
+
+    results = []
+    for job_id in job_ids:
+        status, message_ids, error = db.get_upload_job(job_id)
+        results.append({"job_id": job_id, "status": status, "message_ids": message_ids, "error": error})
+    print_result(args, results, "\n".join(
+        f"Задача {result['job_id']}: {result['status']}" + (f" ({result['error']})" if result['error'] else "")
+        for result in results
+    ))
+    return EXIT_OK if all(result["status"] == "sent" for result in results) else EXIT_FAILED
+
+
+async def serve(args, db):
+    """
+    Периодически сканирует каналы (или отслеживает их при --monitor) и при --transform
+    обрабатывает очередь преобразования, пока не получен SIGINT или SIGTERM.
+    Возвращает False, если какая-либо задача завершилась с ошибкой.
+    """
+    from async_database import AsyncDatabase
+    from scan_engine import ScanEngine
+
+    stopping = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for signal_name in ("SIGINT", "SIGTERM"):
+        try:
+            loop.add_signal_handler(getattr(signal, signal_name), stopping.set)
+        except (NotImplementedError, AttributeError):
+            pass  # Windows: остановка по KeyboardInterrupt
+
+    configs = load_scan_configs(args)
+    if not configs and not args.transform:
+        raise ValueError("Нечего запускать: укажите каналы (аргументы или --file) и/или --transform.")
+
+    prompt = find_prompt(db, args.prompt)
+    # Сканирование, мониторинг и очередь работают в одном цикле событий и пишут в базу без его блокировки
+    async_db = await AsyncDatabase.open()
+    telegram_client = create_telegram_client(args)
+    scan_engine = ScanEngine(telegram_client, async_db, concurrency=args.concurrency)
+
+    async def scan_periodically():
+        while not stopping.is_set():
+            results = await scan_engine.run(configs)
+            for result in results:
+                print_result(args, scan_result_to_dict(result), f"{result.channel_name}: {result.status}, "
+                                                                f"найдено {result.found}")
+            sys.stdout.flush()
+            # Следующие проходы продолжают с последнего обработанного сообщения
+            for config in configs:
+                config.scan_mode = "continue"
+            try:
+                await asyncio.wait_for(stopping.wait(), args.interval)
+            except asyncio.TimeoutError:
+                pass
+
+    async def monitor_channels():
+        from monitor import ChannelMonitor
+
+        def on_message(channel_name, message, saved):
+            if saved:
+                print_result(args, {"channel": channel_name, "message_id": message.id, "date": message.date},
+                             f"{channel_name}: новое сообщение {message.id}")
+                sys.stdout.flush()
+
+        await ChannelMonitor(telegram_client, async_db, configs, enqueue_transform=args.transform, prompt=prompt,
+                             on_message=on_message).run()
+
+    queue = None
+    tasks = []
+    if configs:
+        # Мониторинг получает новые сообщения от Telegram сразу, без периодического сканирования
+        tasks.append(asyncio.ensure_future(monitor_channels() if args.monitor else scan_periodically()))
+    if args.transform:
+        from transform_queue import TransformQueue
+
+        queue = TransformQueue(async_db, workers=args.workers, max_attempts=args.max_attempts)
+        tasks.append(asyncio.ensure_future(queue.run(stop_when_empty=False)))
+
+    def on_task_done(task):
+        # Упавшая задача останавливает весь фоновый режим, чтобы systemd мог его перезапустить
+        if not task.cancelled() and task.exception() is not None:
+            logging.error(f"Фоновая задача завершилась с ошибкой: {task.exception()}")
+            stopping.set()
+
+    for task in tasks:
+        task.add_done_callback(on_task_done)
+
+    logging.info("Фоновый режим запущен.")
+    try:
+        await stopping.wait()
+    finally:
+        logging.info("Остановка фонового режима.")
+        # Очередь дорабатывает текущие задачи, сканирование прерывается
+        # (сохраненные пачки и контрольные точки остаются в базе)
+        if queue is not None:
+            queue.stop()
+        if configs:
+            tasks[0].cancel()
+        results = await asyncio.gather(*tasks, return_exceptions=True)
+        await telegram_client.shutdown()
+        await async_db.close()
+    return not any(isinstance(result, Exception) and not isinstance(result, asyncio.CancelledError)
+                   for result in results)
+
+
+def command_serve(args, db):
+    return EXIT_OK if asyncio.run(serve(args, db)) else EXIT_FAILED
+
+
+def add_scan_arguments(parser):
+    parser.add_argument("channels", nargs="*", help="каналы для сканирования")
+    parser.add_argument("--file", help="файл с каналами: строки 'канал; ключевые слова; исключения; режим; лимит'")
+    parser.add_argument("-k", "--keywords", default="", help="ключевые слова через запятую")
+    parser.add_argument("-x", "--exclude", default="", help="исключаемые слова через запятую")
+    parser.add_argument("--mode", default="start", help="start, continue или дата ГГГГ-ММ-ДД")
+    parser.add_argument("--limit", type=int, help="наибольшее число найденных сообщений на канал")
+    parser.add_argument("--server-search", action="store_true", help="искать ключевые слова на стороне Telegram")
+    parser.add_argument("--concurrency", type=int, default=5, help="число одновременно сканируемых каналов")
+
+
+def add_queue_arguments(parser):
+    parser.add_argument("--workers", type=int, default=int(os.getenv("TRANSFORM_WORKERS", 3)),
+                        help="число обработчиков очереди преобразования")
+    parser.add_argument("--max-attempts", type=int, default=5, help="число попыток для каждой задачи")
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="cli.py", description="Парсер Telegram-каналов без графического интерфейса.")
+    parser.add_argument("--json", action="store_true", help="выводить результат в формате JSON")
+    parser.add_argument("-q", "--quiet", action="store_true", help="выводить в журнал только предупреждения и ошибки")
+    parser.add_argument("--requests-per-second", type=float,
+                        help="запросов к Telegram в секунду (по умолчанию TELEGRAM_REQUESTS_PER_SECOND или 1)")
+    parser.add_argument("--burst", type=int,
+                        help="запросов к Telegram подряд без ожидания (по умолчанию TELEGRAM_BURST или 3)")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    scan_parser = commands.add_parser("scan", help="просканировать каналы и сохранить найденные сообщения")
+    add_scan_arguments(scan_parser)
+    scan_parser.set_defaults(handler=command_scan)
+
+    transform_parser = commands.add_parser("transform", help="поставить сообщения в очередь и преобразовать их")
+    transform_parser.add_argument("--message-id", dest="message_ids", type=int, action="append", default=[],
+                                  help="id сообщения в базе (можно указать несколько раз)")
+    transform_parser.add_argument("--channel", help="преобразовать сообщения канала")
+    transform_parser.add_argument("--date-from", type=parse_date, help="с даты ГГГГ-ММ-ДД")
+    transform_parser.add_argument("--date-to", type=parse_date, help="по дату ГГГГ-ММ-ДД включительно")
+    transform_parser.add_argument("--all", action="store_true", help="поставить в очередь все сообщения")
+    transform_parser.add_argument("--prompt", help="название промта (по умолчанию стандартные промты)")
+    add_queue_arguments(transform_parser)
+    transform_parser.set_defaults(handler=command_transform)
+
+    upload_parser = commands.add_parser("upload", help="выгрузить преобразованные сообщения в канал")
+    upload_parser.add_argument("--channel", required=True, help="канал для выгрузки")
+    upload_parser.add_argument("--library-id", dest="library_ids", type=int, action="append", default=[],
+                               help="id преобразованного сообщения (можно указать несколько раз)")
+    upload_parser.add_argument("--text", help="текст сообщения")
+    upload_parser.add_argument("--image", help="путь к изображению")
+    upload_parser.add_argument("--album", action="store_true",
+                               help="выгрузить преобразованные сообщения альбомами (до 10 изображений)")
+    upload_parser.add_argument("--max-attempts", type=int, default=5, help="число попыток для каждой выгрузки")
+    upload_parser.set_defaults(handler=command_upload)
+
+    serve_parser = commands.add_parser("serve", help="фоновый режим: периодическое сканирование и обработка очереди")
+    add_scan_arguments(serve_parser)
+    serve_parser.add_argument("--interval", type=float, default=600, help="пауза между сканированиями (секунды)")
+    serve_parser.add_argument("--monitor", action="store_true",
+                              help="получать новые сообщения в реальном времени вместо периодического сканирования")
+    serve_parser.add_argument("--transform", action="store_true",
+                              help="обрабатывать очередь преобразования (при --monitor найденные сообщения "
+                                   "ставятся в очередь)")
+    serve_parser.add_argument("--prompt", help="название промта для сообщений, найденных мониторингом")
+    add_queue_arguments(serve_parser)
+    serve_parser.set_defaults(handler=command_serve)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    load_dotenv()
+
+    from database import Database
+
+    if args.quiet:
+        # Журнал настраивается при импорте database.py
+        logging.getLogger().setLevel(logging.WARNING)
+    db = Database(wal=True)
+    try:
+        return args.handler(args, db)
+    except KeyboardInterrupt:
+        return EXIT_INTERRUPTED
+    except (ValueError, OSError) as e:
+        logging.error(f"{e}")
+        print_result(args, {"error": str(e)}, f"Ошибка: {e}")
+        return EXIT_USAGE if isinstance(e, ValueError) else EXIT_FAILED
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
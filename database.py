@@ -1,6 +1,9 @@
+import re
+import json
+import time
 import sqlite3
 import logging
-from datetime import datetime
+from datetime import datetime, timezone
 
 # Настройка логирования
 logging.basicConfig(
@@ -12,11 +15,291 @@ logging.basicConfig(
     ]
 )
 
+# Вставка сообщения; сообщение Telegram с тем же (channel_id, message_id) обновляется на месте
+UPSERT_MESSAGE_SQL = '''
+    INSERT INTO messages (channel_name, message_text, message_date, channel_id, message_id)
+    VALUES (?, ?, ?, ?, ?)
+    ON CONFLICT (channel_id, message_id) DO UPDATE SET
+        channel_name = excluded.channel_name,
+        message_text = excluded.message_text,
+        message_date = excluded.message_date
+'''
+
+# Контрольная точка канала; без нового ID сохраняется прежний
+UPSERT_LAST_SCAN_SQL = '''
+    INSERT INTO last_scan (channel_name, last_message_date, last_message_id)
+    VALUES (?, ?, ?)
+    ON CONFLICT (channel_name) DO UPDATE SET
+        last_message_date = excluded.last_message_date,
+        last_message_id = COALESCE(excluded.last_message_id, last_scan.last_message_id)
+'''
+
+# Запросы, общие для Database и AsyncDatabase
+FIND_MESSAGE_ROW_ID_SQL = 'SELECT id FROM messages WHERE channel_id = ? AND message_id = ?'
+DELETE_MESSAGE_SQL = 'DELETE FROM messages WHERE id = ?'
+LAST_SCAN_DATE_SQL = 'SELECT last_message_date FROM last_scan WHERE channel_name = ?'
+LAST_SCAN_ID_SQL = 'SELECT last_message_id FROM last_scan WHERE channel_name = ?'
+LAST_SCAN_MESSAGES_SQL = 'SELECT id, message_text, message_date FROM messages ORDER BY id DESC LIMIT 5'
+
+INSERT_TRANSFORMED_LIBRARY_SQL = '''
+    INSERT INTO transformed_libraries (library_name, original_description, transformed_description, image_path)
+    VALUES (?, ?, ?, ?)
+'''
+TRANSFORMED_LIBRARIES_SQL = 'SELECT library_name, transformed_description, image_path FROM transformed_libraries'
+TRANSFORMED_LIBRARIES_PAGE_SQL = '''
+    SELECT id, library_name, transformed_description, image_path FROM transformed_libraries
+    WHERE id > ?
+    ORDER BY id
+    LIMIT ?
+'''
+TRANSFORMED_LIBRARY_SQL = '''
+    SELECT id, library_name, transformed_description, image_path FROM transformed_libraries WHERE id = ?
+'''
+
+# Очередь преобразования: выбор следующей задачи и ее захват по статусу (защита от двойного захвата)
+NEXT_TRANSFORM_JOB_SQL = '''
+    SELECT j.id, j.message_id, m.message_text, j.message_prompt, j.image_prompt, j.name_prompt, j.attempts
+    FROM transform_jobs j LEFT JOIN messages m ON m.id = j.message_id
+    WHERE j.status = 'pending' AND j.next_attempt_at <= ?
+    ORDER BY j.next_attempt_at, j.id
+    LIMIT 1
+'''
+CLAIM_TRANSFORM_JOB_SQL = '''
+    UPDATE transform_jobs SET status = 'running', attempts = attempts + 1, updated_at = ?
+    WHERE id = ? AND status = 'pending'
+'''
+COMPLETE_TRANSFORM_JOB_SQL = '''
+    UPDATE transform_jobs SET status = 'done', library_id = ?, last_error = NULL, updated_at = ?
+    WHERE id = ?
+'''
+FAIL_TRANSFORM_JOB_SQL = '''
+    UPDATE transform_jobs SET status = ?, last_error = ?, next_attempt_at = COALESCE(?, next_attempt_at),
+                              updated_at = ?
+    WHERE id = ?
+'''
+RESET_RUNNING_TRANSFORM_JOBS_SQL = '''
+    UPDATE transform_jobs SET status = 'pending', updated_at = ? WHERE status = 'running'
+'''
+RETRY_FAILED_TRANSFORM_JOBS_SQL = '''
+    UPDATE transform_jobs SET status = 'pending', attempts = 0, next_attempt_at = ?, updated_at = ?
+    WHERE status = 'failed'
+'''
+TRANSFORM_JOB_COUNTS_SQL = 'SELECT status, COUNT(*) FROM transform_jobs GROUP BY status'
+
+# Очередь выгрузки в Telegram
+INSERT_UPLOAD_JOB_SQL = '''
+    INSERT INTO upload_jobs (channel_name, captions, image_paths, library_ids, status, next_attempt_at,
+                             created_at, updated_at)
+    VALUES (?, ?, ?, ?, 'pending', ?, ?, ?)
+'''
+NEXT_UPLOAD_JOB_SQL = '''
+    SELECT id, channel_name, captions, image_paths, attempts FROM upload_jobs
+    WHERE status = 'pending' AND next_attempt_at <= ?
+    ORDER BY next_attempt_at, id
+    LIMIT 1
+'''
+CLAIM_UPLOAD_JOB_SQL = '''
+    UPDATE upload_jobs SET status = 'sending', attempts = attempts + 1, sending_started_at = ?, updated_at = ?
+    WHERE id = ? AND status = 'pending'
+'''
+SENDING_UPLOAD_JOBS_SQL = '''
+    SELECT id, channel_name, captions, image_paths, sending_started_at FROM upload_jobs
+    WHERE status = 'sending'
+'''
+COMPLETE_UPLOAD_JOB_SQL = '''
+    UPDATE upload_jobs SET status = 'sent', sent_message_ids = ?, last_error = NULL, updated_at = ?
+    WHERE id = ?
+'''
+FAIL_UPLOAD_JOB_SQL = '''
+    UPDATE upload_jobs SET status = ?, last_error = ?, next_attempt_at = COALESCE(?, next_attempt_at),
+                           updated_at = ?
+    WHERE id = ?
+'''
+UPLOAD_JOB_SQL = 'SELECT status, sent_message_ids, last_error FROM upload_jobs WHERE id = ?'
+UPLOAD_JOB_COUNTS_SQL = 'SELECT status, COUNT(*) FROM upload_jobs GROUP BY status'
+
+# Промты
+INSERT_PROMPT_SQL = 'INSERT INTO prompts (name, message_prompt, image_prompt, name_prompt) VALUES (?, ?, ?, ?)'
+PROMPTS_SQL = 'SELECT id, name, message_prompt, image_prompt, name_prompt FROM prompts'
+UPDATE_PROMPT_SQL = 'UPDATE prompts SET message_prompt = ?, image_prompt = ?, name_prompt = ? WHERE id = ?'
+DELETE_PROMPT_SQL = 'DELETE FROM prompts WHERE id = ?'
+
+# Окончания русских слов, отбрасываемые в префиксном поиске ("библиотеки" -> "библиотек*")
+RUSSIAN_ENDINGS = sorted((
+    'ами', 'ями', 'ого', 'его', 'ому', 'ему', 'ыми', 'ими', 'ах', 'ях', 'ов', 'ев', 'ей', 'ом', 'ем', 'ой',
+    'ый', 'ий', 'ая', 'яя', 'ое', 'ее', 'ые', 'ие', 'ую', 'юю', 'а', 'я', 'о', 'е', 'ы', 'и', 'у', 'ю', 'ь', 'й'
+), key=len, reverse=True)
+
+
+def search_term_stem(term):
+    """
+    Отбрасывает у русского слова типичное окончание, оставляя основу не короче 4 букв.
+    """
+    lowered = term.lower()
+    if not re.search('[а-яё]', lowered):
+        return term
+    for ending in RUSSIAN_ENDINGS:
+        if lowered.endswith(ending) and len(lowered) - len(ending) >= 4:
+            return term[:-len(ending)]
+    return term
+
+
+def enqueue_transform_query(message_ids=None, prompt=None, channel_name=None, date_from=None, date_to=None):
+    """
+    Собирает запрос постановки сообщений в очередь преобразования: (SQL, параметры)
+    или None, если передан пустой список сообщений.
+    """
+    prompt_id = message_prompt = image_prompt = name_prompt = None
+    if prompt:
+        prompt_id = prompt[0]
+        message_prompt, image_prompt, name_prompt = prompt[2:5]
+
+    conditions = []
+    params = []
+    if message_ids is not None:
+        message_ids = list(message_ids)
+        if not message_ids:
+            return None
+        conditions.append(f'm.id IN ({", ".join("?" * len(message_ids))})')
+        params.extend(message_ids)
+    if channel_name:
+        conditions.append('m.channel_name = ?')
+        params.append(channel_name)
+    if date_from:
+        conditions.append('m.message_date >= ?')
+        params.append(date_from)
+    if date_to:
+        conditions.append('m.message_date < ?')
+        params.append(date_to)
+    conditions.append('''NOT EXISTS (
+        SELECT 1 FROM transform_jobs j
+        WHERE j.message_id = m.id AND j.prompt_id IS ? AND j.status != 'failed'
+    )''')
+    params.append(prompt_id)
+
+    now = datetime.now()
+    query = f'''
+        INSERT INTO transform_jobs (message_id, prompt_id, message_prompt, image_prompt, name_prompt,
+                                    status, next_attempt_at, created_at, updated_at)
+        SELECT m.id, ?, ?, ?, ?, 'pending', ?, ?, ? FROM messages m
+        WHERE {' AND '.join(conditions)}
+        ORDER BY m.message_date, m.id
+    '''
+    return query, [prompt_id, message_prompt, image_prompt, name_prompt, now, now, now] + params
+
+
+def messages_query(limit=None):
+    """
+    Собирает запрос истории сканирования (последние сообщения первыми): (SQL, параметры).
+    """
+    query = 'SELECT channel_name, message_text, message_date FROM messages ORDER BY id DESC'
+    params = ()
+    if limit:
+        query += ' LIMIT ?'
+        params = (int(limit),)
+    return query, params
+
+
+def messages_page_query(channel_name=None, date_from=None, date_to=None, cursor=None, page_size=50, order='date'):
+    """
+    Собирает запрос одной страницы истории: (SQL, параметры).
+    order='date' — от новых сообщений к старым по ключу (дата, id), order='id' — в обратном
+    порядке сохранения по ключу id.
+    """
+    conditions = []
+    params = []
+    if channel_name:
+        conditions.append('channel_name = ?')
+        params.append(channel_name)
+    if date_from:
+        conditions.append('message_date >= ?')
+        params.append(date_from)
+    if date_to:
+        conditions.append('message_date < ?')
+        params.append(date_to)
+    if cursor and order == 'id':
+        conditions.append('id < ?')
+        params.append(cursor)
+    elif cursor:
+        conditions.append('(message_date, id) < (?, ?)')
+        params.extend(cursor)
+
+    query = 'SELECT id, channel_name, message_text, message_date FROM messages'
+    if conditions:
+        query += ' WHERE ' + ' AND '.join(conditions)
+    query += ' ORDER BY id DESC LIMIT ?' if order == 'id' else ' ORDER BY message_date DESC, id DESC LIMIT ?'
+    params.append(page_size)
+    return query, params
+
+
+def messages_page_cursor(rows, page_size, order='date'):
+    """
+    Возвращает курсор страницы, следующей за rows, или None, если страница последняя.
+    """
+    if len(rows) < page_size:
+        return None
+    return rows[-1][0] if order == 'id' else (rows[-1][3], rows[-1][0])
+
+
+def search_query(query, channel_name=None, date_from=None, date_to=None, limit=50, prefix=True):
+    """
+    Собирает запрос полнотекстового поиска: (SQL, параметры) или None, если в запросе нет слов.
+    """
+    terms = re.findall(r'\w+', query)
+    if not terms:
+        return None
+    # Каждое слово берется в кавычки, чтобы символы запроса не разбирались как синтаксис FTS5
+    if prefix:
+        match = ' '.join(f'"{search_term_stem(term)}"*' for term in terms)
+    else:
+        match = ' '.join(f'"{term}"' for term in terms)
+
+    sql = '''
+        SELECT m.id, m.channel_name, m.message_text, snippet(messages_fts, 0, '[', ']', '…', 16), m.message_date,
+               bm25(messages_fts) AS rank
+        FROM messages_fts
+        JOIN messages m ON m.id = messages_fts.rowid
+        WHERE messages_fts MATCH ?
+    '''
+    params = [match]
+    if channel_name:
+        sql += ' AND m.channel_name = ?'
+        params.append(channel_name)
+    if date_from:
+        sql += ' AND m.message_date >= ?'
+        params.append(date_from)
+    if date_to:
+        sql += ' AND m.message_date < ?'
+        params.append(date_to)
+    sql += ' ORDER BY rank LIMIT ?'
+    params.append(limit)
+    return sql, params
+
+
 class Database:
-    def __init__(self, db_name='telegram_parser.db'):
-        self.conn = sqlite3.connect(db_name)
+    def __init__(self, db_name='telegram_parser.db', wal=False, cache_size_kb=20000, check_same_thread=True):
+        # Соединение из нескольких потоков (check_same_thread=False) вызывающий код защищает блокировкой
+        self.conn = sqlite3.connect(db_name, check_same_thread=check_same_thread)
         self.cursor = self.conn.cursor()
+        if wal:
+            self.enable_wal(cache_size_kb)
         self.create_tables()
+        self.fts_enabled = self.create_search_index()
+
+    def enable_wal(self, cache_size_kb=20000):
+        """
+        Включает журнал WAL и настройки, ускоряющие массовую запись:
+        synchronous=NORMAL (fsync только при контрольных точках), увеличенный кэш страниц
+        и временные таблицы в памяти.
+        """
+        try:
+            mode = self.cursor.execute('PRAGMA journal_mode=WAL').fetchone()[0]
+            self.cursor.execute('PRAGMA synchronous=NORMAL')
+            self.cursor.execute(f'PRAGMA cache_size=-{int(cache_size_kb)}')
+            self.cursor.execute('PRAGMA temp_store=MEMORY')
+            logging.info(f"Режим журнала базы данных: {mode}")
+        except Exception as e:
+            logging.error(f"Ошибка при настройке журнала WAL: {e}")
 
     def create_tables(self):
         try:
@@ -26,7 +309,9 @@ class Database:
                     id INTEGER PRIMARY KEY AUTOINCREMENT,
                     channel_name TEXT,
                     message_text TEXT,
-                    message_date DATETIME
+                    message_date DATETIME,
+                    channel_id INTEGER,
+                    message_id INTEGER
                 )
             ''')
 
@@ -46,7 +331,8 @@ class Database:
                 CREATE TABLE IF NOT EXISTS last_scan (
                     id INTEGER PRIMARY KEY AUTOINCREMENT,
                     channel_name TEXT UNIQUE,
-                    last_message_date DATETIME
+                    last_message_date DATETIME,
+                    last_message_id INTEGER
                 )
             ''')
 
@@ -61,36 +347,199 @@ class Database:
                 )
             ''')
 
+            # Очередь пакетного преобразования сообщений; промты копируются в задачу при постановке
+            self.cursor.execute('''
+                CREATE TABLE IF NOT EXISTS transform_jobs (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    message_id INTEGER,
+                    prompt_id INTEGER,
+                    message_prompt TEXT,
+                    image_prompt TEXT,
+                    name_prompt TEXT,
+                    status TEXT DEFAULT 'pending',
+                    attempts INTEGER DEFAULT 0,
+                    last_error TEXT,
+                    next_attempt_at DATETIME,
+                    library_id INTEGER,
+                    created_at DATETIME,
+                    updated_at DATETIME
+                )
+            ''')
+            self.cursor.execute('''
+                CREATE INDEX IF NOT EXISTS idx_transform_jobs_status ON transform_jobs (status, next_attempt_at)
+            ''')
+            self.cursor.execute('''
+                CREATE INDEX IF NOT EXISTS idx_transform_jobs_message ON transform_jobs (message_id)
+            ''')
+
+            # Очередь выгрузки в Telegram: одна задача — одно сообщение или альбом.
+            # Пути к изображениям, подписи и ID отправленных сообщений хранятся в JSON
+            self.cursor.execute('''
+                CREATE TABLE IF NOT EXISTS upload_jobs (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    channel_name TEXT,
+                    captions TEXT,
+                    image_paths TEXT,
+                    library_ids TEXT,
+                    status TEXT DEFAULT 'pending',
+                    attempts INTEGER DEFAULT 0,
+                    last_error TEXT,
+                    next_attempt_at DATETIME,
+                    sending_started_at DATETIME,
+                    sent_message_ids TEXT,
+                    created_at DATETIME,
+                    updated_at DATETIME
+                )
+            ''')
+            self.cursor.execute('''
+                CREATE INDEX IF NOT EXISTS idx_upload_jobs_status ON upload_jobs (status, next_attempt_at)
+            ''')
+
+            # Сгенерированные изображения: какой файл получен на какой запрос (SHA-256 модели и промта)
+            self.cursor.execute('''
+                CREATE TABLE IF NOT EXISTS generated_images (
+                    request_key TEXT PRIMARY KEY,
+                    model TEXT,
+                    prompt TEXT,
+                    file_path TEXT,
+                    created_at REAL
+                )
+            ''')
+            self.cursor.execute('''
+                CREATE INDEX IF NOT EXISTS idx_generated_images_file ON generated_images (file_path)
+            ''')
+
+            # Миграция баз, созданных до появления идентификаторов сообщений Telegram
+            self._add_missing_columns('messages', {'channel_id': 'INTEGER', 'message_id': 'INTEGER'})
+            self._add_missing_columns('last_scan', {'last_message_id': 'INTEGER'})
+
+            # Одно сообщение Telegram — одна строка; повторное сканирование обновляет ее
+            self.cursor.execute('''
+                CREATE UNIQUE INDEX IF NOT EXISTS idx_messages_identity ON messages (channel_id, message_id)
+            ''')
+
+            # Индексы для фильтров истории по каналу и датам и постраничного просмотра по (дата, id)
+            self.cursor.execute('''
+                CREATE INDEX IF NOT EXISTS idx_messages_channel_date ON messages (channel_name, message_date)
+            ''')
+            self.cursor.execute('''
+                CREATE INDEX IF NOT EXISTS idx_messages_date ON messages (message_date)
+            ''')
+
             self.conn.commit()
             logging.info("Таблицы в базе данных успешно созданы.")
         except Exception as e:
             logging.error(f"Ошибка при создании таблиц: {e}")
 
-    def save_message(self, channel_name, message_text, message_date):
+    def create_search_index(self):
+        """
+        Создает полнотекстовый индекс FTS5 по текстам сообщений и триггеры,
+        поддерживающие его в актуальном состоянии. Токенизатор unicode61 разбивает
+        на слова и приводит к нижнему регистру в том числе кириллицу.
+        Возвращает False, если SQLite собран без FTS5.
+        """
         try:
+            exists = self.cursor.execute('''
+                SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'messages_fts'
+            ''').fetchone()
+
+            self.cursor.execute('''
+                CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5(
+                    message_text,
+                    content='messages',
+                    content_rowid='id',
+                    tokenize='unicode61 remove_diacritics 0',
+                    prefix='2 3'
+                )
+            ''')
+            self.cursor.execute('''
+                CREATE TRIGGER IF NOT EXISTS messages_fts_insert AFTER INSERT ON messages BEGIN
+                    INSERT INTO messages_fts (rowid, message_text) VALUES (new.id, new.message_text);
+                END
+            ''')
+            self.cursor.execute('''
+                CREATE TRIGGER IF NOT EXISTS messages_fts_delete AFTER DELETE ON messages BEGIN
+                    INSERT INTO messages_fts (messages_fts, rowid, message_text)
+                    VALUES ('delete', old.id, old.message_text);
+                END
+            ''')
             self.cursor.execute('''
-                INSERT INTO messages (channel_name, message_text, message_date)
-                VALUES (?, ?, ?)
-            ''', (channel_name, message_text, message_date))
+                CREATE TRIGGER IF NOT EXISTS messages_fts_update AFTER UPDATE OF message_text ON messages BEGIN
+                    INSERT INTO messages_fts (messages_fts, rowid, message_text)
+                    VALUES ('delete', old.id, old.message_text);
+                    INSERT INTO messages_fts (rowid, message_text) VALUES (new.id, new.message_text);
+                END
+            ''')
+
+            # Индексируем сообщения, сохраненные до появления индекса
+            if not exists:
+                self.cursor.execute("INSERT INTO messages_fts (messages_fts) VALUES ('rebuild')")
+            self.conn.commit()
+            return True
+        except Exception as e:
+            self.conn.rollback()
+            logging.error(f"Полнотекстовый поиск недоступен: {e}")
+            return False
+
+    def _add_missing_columns(self, table, columns):
+        existing = {row[1] for row in self.cursor.execute(f'PRAGMA table_info({table})')}
+        for column, column_type in columns.items():
+            if column not in existing:
+                self.cursor.execute(f'ALTER TABLE {table} ADD COLUMN {column} {column_type}')
+                logging.info(f"В таблицу {table} добавлен столбец {column}.")
+
+    def save_message(self, channel_name, message_text, message_date, channel_id=None, message_id=None):
+        """
+        Сохраняет сообщение. Если заданы channel_id и message_id Telegram, запись идемпотентна:
+        повторное сохранение того же сообщения обновляет существующую строку.
+        """
+        try:
+            self.cursor.execute(UPSERT_MESSAGE_SQL, (channel_name, message_text, message_date, channel_id, message_id))
             self.conn.commit()
             logging.info(f"Сообщение сохранено: {message_text[:50]}...")
         except Exception as e:
             logging.error(f"Ошибка при сохранении сообщения: {e}")
 
+    def save_messages(self, channel_name, messages, last_message_date=None, last_message_id=None):
+        """
+        Сохраняет пачку сообщений [(текст, дата, id канала, id сообщения), ...] одной транзакцией.
+        Идентификаторы Telegram можно не указывать: [(текст, дата), ...]. Сообщения с идентификаторами
+        сохраняются как upsert, поэтому повторное сканирование не создает дубликатов.
+        Если передан last_message_date, в той же транзакции обновляется контрольная точка канала
+        (дата и ID последнего сообщения), так что она никогда не опережает сохраненные сообщения.
+        """
+        try:
+            with self.conn:
+                self.cursor.executemany(UPSERT_MESSAGE_SQL, (
+                    (channel_name,) + (tuple(message) + (None, None))[:4] for message in messages
+                ))
+                saved = self.cursor.rowcount
+                if last_message_date is not None:
+                    self.cursor.execute(UPSERT_LAST_SCAN_SQL, (channel_name, last_message_date, last_message_id))
+            logging.info(f"Сохранено {saved} сообщений канала {channel_name}.")
+            return saved
+        except Exception as e:
+            logging.error(f"Ошибка при сохранении сообщений: {e}")
+            raise
+
+    def find_message_row_id(self, channel_id, message_id):
+        """
+        Возвращает id строки таблицы messages для сообщения Telegram или None.
+        """
+        self.cursor.execute(FIND_MESSAGE_ROW_ID_SQL, (channel_id, message_id))
+        row = self.cursor.fetchone()
+        return row[0] if row else None
+
     def delete_message(self, message_id):
         try:
-            self.cursor.execute('''
-                DELETE FROM messages WHERE id = ?
-            ''', (message_id,))
+            self.cursor.execute(DELETE_MESSAGE_SQL, (message_id,))
             self.conn.commit()
             logging.info(f"Сообщение с ID {message_id} удалено.")
         except Exception as e:
             logging.error(f"Ошибка при удалении сообщения: {e}")
 
     def get_last_scan_date(self, channel_name):
-        self.cursor.execute('''
-            SELECT last_message_date FROM last_scan WHERE channel_name = ?
-        ''', (channel_name,))
+        self.cursor.execute(LAST_SCAN_DATE_SQL, (channel_name,))
         row = self.cursor.fetchone()
         if row:
             # Преобразуем строку даты в объект datetime
@@ -98,37 +547,116 @@ class Database:
         logging.info(f"Для канала {channel_name} последняя дата сканирования не найдена.")
         return None
 
-    def update_last_scan_date(self, channel_name, last_message_date):
-        self.cursor.execute('''
-            INSERT OR REPLACE INTO last_scan (channel_name, last_message_date)
-            VALUES (?, ?)
-        ''', (channel_name, last_message_date))
+    def get_last_scan_id(self, channel_name):
+        """
+        Возвращает ID последнего обработанного сообщения канала или None.
+        """
+        self.cursor.execute(LAST_SCAN_ID_SQL, (channel_name,))
+        row = self.cursor.fetchone()
+        return row[0] if row else None
+
+    def update_last_scan_date(self, channel_name, last_message_date, last_message_id=None):
+        self.cursor.execute(UPSERT_LAST_SCAN_SQL, (channel_name, last_message_date, last_message_id))
         self.conn.commit()
 
     def save_transformed_library(self, library_name, original_description, transformed_description, image_path):
         try:
-            self.cursor.execute('''
-                INSERT INTO transformed_libraries (library_name, original_description, transformed_description, image_path)
-                VALUES (?, ?, ?, ?)
-            ''', (library_name, original_description, transformed_description, image_path))
+            self.cursor.execute(INSERT_TRANSFORMED_LIBRARY_SQL, (library_name, original_description, transformed_description,
+                                                                 image_path))
             self.conn.commit()
             logging.info(f"Преобразованная библиотека сохранена")
+            return self.cursor.lastrowid
         except Exception as e:
             logging.error(f"Ошибка при сохранении преобразованной библиотеки: {e}")
+            return None
+
+    # Методы для очереди пакетного преобразования
+    def enqueue_transform_jobs(self, message_ids=None, prompt=None, channel_name=None, date_from=None, date_to=None):
+        """
+        Ставит сообщения в очередь преобразования и возвращает число новых задач.
+        Сообщения задаются списком id из таблицы messages или фильтром по каналу и датам
+        (если message_ids не передан). prompt — строка из get_prompts() или None для стандартных промтов.
+        Сообщения, для которых с тем же промтом уже есть незавершившаяся неудачей задача, пропускаются.
+        """
+        built = enqueue_transform_query(message_ids, prompt, channel_name, date_from, date_to)
+        if built is None:
+            return 0
+        query, params = built
+        try:
+            with self.conn:
+                self.cursor.execute(query, params)
+            count = self.cursor.rowcount
+            logging.info(f"В очередь преобразования добавлено {count} задач.")
+            return count
+        except Exception as e:
+            logging.error(f"Ошибка при постановке задач преобразования: {e}")
+            raise
+
+    def claim_transform_job(self):
+        """
+        Забирает следующую готовую к выполнению задачу и помечает ее как выполняемую.
+        Возвращает (id задачи, id сообщения, текст сообщения, промт текста, промт изображения,
+        промт названия, номер попытки) или None, если готовых задач нет.
+        """
+        now = datetime.now()
+        with self.conn:
+            self.cursor.execute(NEXT_TRANSFORM_JOB_SQL, (now,))
+            row = self.cursor.fetchone()
+            if row is None:
+                return None
+            # Условие по статусу защищает от двойного захвата другим процессом
+            self.cursor.execute(CLAIM_TRANSFORM_JOB_SQL, (now, row[0]))
+            if self.cursor.rowcount == 0:
+                return None
+        return row[:6] + (row[6] + 1,)
+
+    def complete_transform_job(self, job_id, library_id):
+        with self.conn:
+            self.cursor.execute(COMPLETE_TRANSFORM_JOB_SQL, (library_id, datetime.now(), job_id))
+
+    def fail_transform_job(self, job_id, error, retry_at=None):
+        """
+        Записывает ошибку задачи. Если передан retry_at, задача вернется в очередь в это время,
+        иначе помечается как окончательно неудачная.
+        """
+        with self.conn:
+            self.cursor.execute(FAIL_TRANSFORM_JOB_SQL, ('pending' if retry_at else 'failed', str(error), retry_at,
+                                                 datetime.now(), job_id))
+
+    def reset_running_transform_jobs(self):
+        """
+        Возвращает в очередь задачи, прерванные закрытием программы во время выполнения.
+        """
+        with self.conn:
+            self.cursor.execute(RESET_RUNNING_TRANSFORM_JOBS_SQL, (datetime.now(),))
+        if self.cursor.rowcount:
+            logging.info(f"Возвращено в очередь {self.cursor.rowcount} прерванных задач преобразования.")
+        return self.cursor.rowcount
+
+    def retry_failed_transform_jobs(self):
+        """
+        Возвращает в очередь все неудачные задачи со сброшенным счетчиком попыток.
+        """
+        with self.conn:
+            self.cursor.execute(RETRY_FAILED_TRANSFORM_JOBS_SQL, (datetime.now(), datetime.now()))
+        return self.cursor.rowcount
+
+    def get_transform_job_counts(self):
+        """
+        Возвращает число задач преобразования по статусам: {'pending': ..., 'running': ..., ...}.
+        """
+        self.cursor.execute(TRANSFORM_JOB_COUNTS_SQL)
+        counts = {'pending': 0, 'running': 0, 'done': 0, 'failed': 0}
+        counts.update(dict(self.cursor.fetchall()))
+        return counts
 
     def get_messages(self, limit=None):
         """
             Возвращает историю сканирования с ограничением по количеству записей.
+            Для постраничного просмотра большой истории используйте get_messages_page.
             """
         try:
-            query = '''
-                    SELECT channel_name, message_text, message_date FROM messages
-                    ORDER BY id DESC
-                '''
-            if limit:
-                query += f' LIMIT {limit}'
-
-            self.cursor.execute(query)
+            self.cursor.execute(*messages_query(limit))
             history = self.cursor.fetchall()
             logging.info(f"Получено {len(history)} записей истории сканирования.")
             return history
@@ -136,13 +664,52 @@ class Database:
             logging.error(f"Ошибка при получении истории сканирования: {e}")
             return []
 
+    def get_messages_page(self, channel_name=None, date_from=None, date_to=None, cursor=None, page_size=50,
+                          order='date'):
+        """
+        Возвращает одну страницу истории и курсор следующей страницы.
+        order='date' — от новых сообщений к старым, order='id' — от последних сохраненных к первым.
+        Страницы выбираются по ключу (дата, id) или id через индексы, а не через OFFSET, поэтому
+        любая страница читается одинаково быстро независимо от размера таблицы.
+        Результат: ([(id, канал, текст, дата), ...], курсор или None, если страница последняя).
+        """
+        query, params = messages_page_query(channel_name, date_from, date_to, cursor, page_size, order)
+        try:
+            self.cursor.execute(query, params)
+            rows = self.cursor.fetchall()
+            return rows, messages_page_cursor(rows, page_size, order)
+        except Exception as e:
+            logging.error(f"Ошибка при получении страницы истории: {e}")
+            return [], None
+
+    def search_messages(self, query, channel_name=None, date_from=None, date_to=None, limit=50, prefix=True):
+        """
+        Полнотекстовый поиск по сохраненным сообщениям.
+        Все слова запроса должны встречаться в сообщении; при prefix=True у русских слов
+        отбрасывается окончание и основа ищется как начало слова ("библиотеки" найдет "библиотека").
+        Возвращает [(id, канал, текст, фрагмент с подсветкой [..], дата, ранг)], лучшие совпадения первыми.
+        """
+        if not self.fts_enabled:
+            logging.error("Полнотекстовый поиск недоступен.")
+            return []
+
+        built = search_query(query, channel_name, date_from, date_to, limit, prefix)
+        if built is None:
+            return []
+        sql, params = built
+
+        try:
+            self.cursor.execute(sql, params)
+            results = self.cursor.fetchall()
+            logging.info(f"По запросу '{query}' найдено {len(results)} сообщений.")
+            return results
+        except Exception as e:
+            logging.error(f"Ошибка при поиске сообщений: {e}")
+            return []
+
     def get_last_scan_messages(self):
         try:
-            self.cursor.execute('''
-                SELECT id, message_text, message_date FROM messages
-                ORDER BY id DESC
-                LIMIT 5
-            ''')
+            self.cursor.execute(LAST_SCAN_MESSAGES_SQL)
             messages = self.cursor.fetchall()
             logging.info(f"Получено {len(messages)} сообщений для канала.")
             return messages
@@ -155,9 +722,7 @@ class Database:
         Возвращает все преобразованные сообщения из таблицы transformed_libraries.
         """
         try:
-            self.cursor.execute('''
-                SELECT library_name, transformed_description, image_path FROM transformed_libraries
-            ''')
+            self.cursor.execute(TRANSFORMED_LIBRARIES_SQL)
             libraries = self.cursor.fetchall()
             logging.info(f"Получено {len(libraries)} преобразованных библиотек.")
             return libraries
@@ -165,13 +730,155 @@ class Database:
             logging.error(f"Ошибка при получении преобразованных библиотек: {e}")
             return []
 
+    def get_transformed_libraries_page(self, cursor=None, page_size=50):
+        """
+        Возвращает одну страницу преобразованных сообщений в порядке сохранения и курсор следующей страницы.
+        Результат: ([(id, название, текст, путь к изображению), ...], курсор или None).
+        """
+        try:
+            self.cursor.execute(TRANSFORMED_LIBRARIES_PAGE_SQL, (cursor or 0, page_size))
+            rows = self.cursor.fetchall()
+            next_cursor = rows[-1][0] if len(rows) == page_size else None
+            return rows, next_cursor
+        except Exception as e:
+            logging.error(f"Ошибка при получении страницы преобразованных библиотек: {e}")
+            return [], None
+
+    # Методы для очереди выгрузки в Telegram
+    def enqueue_upload_job(self, channel_name, captions, image_paths, library_ids=None):
+        """
+        Ставит в очередь выгрузку одного сообщения (одно изображение) или альбома (несколько).
+        Возвращает id задачи.
+        """
+        now = datetime.now()
+        with self.conn:
+            self.cursor.execute(INSERT_UPLOAD_JOB_SQL, (channel_name, json.dumps(list(captions), ensure_ascii=False),
+                                                json.dumps(list(image_paths)), json.dumps(list(library_ids or [])),
+                                                now, now, now))
+        logging.info(f"Выгрузка в канал {channel_name} поставлена в очередь ({len(image_paths)} изображений).")
+        return self.cursor.lastrowid
+
+    def claim_upload_job(self):
+        """
+        Забирает следующую готовую задачу выгрузки и помечает ее как отправляемую.
+        Возвращает (id, канал, подписи, пути к изображениям, номер попытки) или None.
+        """
+        now = datetime.now()
+        with self.conn:
+            self.cursor.execute(NEXT_UPLOAD_JOB_SQL, (now,))
+            row = self.cursor.fetchone()
+            if row is None:
+                return None
+            # Время начала отправки (UTC) нужно, чтобы после сбоя найти уже отправленное сообщение
+            self.cursor.execute(CLAIM_UPLOAD_JOB_SQL, (datetime.now(timezone.utc), now, row[0]))
+            if self.cursor.rowcount == 0:
+                return None
+        return row[0], row[1], json.loads(row[2]), json.loads(row[3]), row[4] + 1
+
+    def get_sending_upload_jobs(self):
+        """
+        Возвращает задачи, отправка которых была прервана: (id, канал, подписи, пути, время начала отправки).
+        """
+        self.cursor.execute(SENDING_UPLOAD_JOBS_SQL)
+        return [(row[0], row[1], json.loads(row[2]), json.loads(row[3]),
+                 datetime.fromisoformat(row[4]) if row[4] else None) for row in self.cursor.fetchall()]
+
+    def complete_upload_job(self, job_id, message_ids):
+        with self.conn:
+            self.cursor.execute(COMPLETE_UPLOAD_JOB_SQL, (json.dumps(list(message_ids)), datetime.now(), job_id))
+
+    def fail_upload_job(self, job_id, error, retry_at=None):
+        """
+        Записывает ошибку выгрузки. Если передан retry_at, задача вернется в очередь в это время,
+        иначе помечается как окончательно неудачная.
+        """
+        with self.conn:
+            self.cursor.execute(FAIL_UPLOAD_JOB_SQL, ('pending' if retry_at else 'failed', str(error) if error else None,
+                                              retry_at, datetime.now(), job_id))
+
+    def get_upload_job(self, job_id):
+        """
+        Возвращает состояние задачи выгрузки: (статус, ID отправленных сообщений, последняя ошибка) или None.
+        """
+        self.cursor.execute(UPLOAD_JOB_SQL, (job_id,))
+        row = self.cursor.fetchone()
+        if row is None:
+            return None
+        return row[0], json.loads(row[1]) if row[1] else [], row[2]
+
+    def get_upload_job_counts(self):
+        """
+        Возвращает число задач выгрузки по статусам: {'pending': ..., 'sending': ..., 'sent': ..., 'failed': ...}.
+        """
+        self.cursor.execute(UPLOAD_JOB_COUNTS_SQL)
+        counts = {'pending': 0, 'sending': 0, 'sent': 0, 'failed': 0}
+        counts.update(dict(self.cursor.fetchall()))
+        return counts
+
+    def get_transformed_library(self, library_id):
+        """
+        Возвращает преобразованное сообщение (id, название, текст, путь к изображению) или None.
+        """
+        self.cursor.execute(TRANSFORMED_LIBRARY_SQL, (library_id,))
+        return self.cursor.fetchone()
+
+    # Методы для хранилища сгенерированных изображений
+    def get_generated_image(self, request_key):
+        """
+        Возвращает путь к изображению, сохраненному для ключа запроса, или None.
+        """
+        self.cursor.execute('''
+            SELECT file_path FROM generated_images WHERE request_key = ?
+        ''', (request_key,))
+        row = self.cursor.fetchone()
+        return row[0] if row else None
+
+    def save_generated_image(self, request_key, model, prompt, file_path):
+        with self.conn:
+            self.cursor.execute('''
+                INSERT INTO generated_images (request_key, model, prompt, file_path, created_at)
+                VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT (request_key) DO UPDATE SET
+                    file_path = excluded.file_path,
+                    created_at = excluded.created_at
+            ''', (request_key, model, prompt, file_path, time.time()))
+
+    def delete_generated_image(self, request_key):
+        with self.conn:
+            self.cursor.execute('DELETE FROM generated_images WHERE request_key = ?', (request_key,))
+
+    def delete_generated_image_files(self, file_paths):
+        """
+        Забывает все запросы, которые ссылаются на файлы из file_paths.
+        """
+        with self.conn:
+            self.cursor.executemany('DELETE FROM generated_images WHERE file_path = ?',
+                                    ((file_path,) for file_path in file_paths))
+
+    def get_generated_image_files(self):
+        self.cursor.execute('SELECT DISTINCT file_path FROM generated_images')
+        return [row[0] for row in self.cursor.fetchall()]
+
+    def get_referenced_image_paths(self):
+        """
+        Возвращает пути изображений, которые еще нужны: сохраненные в преобразованных сообщениях
+        и ожидающие выгрузки (задачи upload_jobs, кроме уже отправленных).
+        """
+        self.cursor.execute('''
+            SELECT image_path FROM transformed_libraries WHERE image_path IS NOT NULL
+        ''')
+        paths = {row[0] for row in self.cursor.fetchall()}
+        self.cursor.execute('''
+            SELECT image_paths FROM upload_jobs WHERE status != 'sent' AND image_paths IS NOT NULL
+        ''')
+        for row in self.cursor.fetchall():
+            paths.update(path for path in json.loads(row[0]) if path)
+        return paths
+
     # Методы для работы с промтами
     def save_prompt(self, name, message_prompt, image_prompt, name_prompt):
         try:
-            self.cursor.execute('''
-                INSERT INTO prompts (name, message_prompt, image_prompt, name_prompt)
-                VALUES (?, ?, ?, ?)
-            ''', (name, message_prompt, image_prompt, name_prompt))
+            self.cursor.execute(INSERT_PROMPT_SQL, (name, message_prompt, image_prompt, name_prompt))
             self.conn.commit()
             logging.info(f"Промт '{name}' сохранен.")
         except Exception as e:
@@ -179,9 +886,7 @@ class Database:
 
     def get_prompts(self):
         try:
-            self.cursor.execute('''
-                SELECT id, name, message_prompt, image_prompt, name_prompt FROM prompts
-            ''')
+            self.cursor.execute(PROMPTS_SQL)
             prompts = self.cursor.fetchall()
             logging.info(f"Получено {len(prompts)} промтов.")
             return prompts
@@ -191,11 +896,7 @@ class Database:
 
     def update_prompt(self, prompt_id, message_prompt, image_prompt, name_prompt):
         try:
-            self.cursor.execute('''
-                UPDATE prompts
-                SET message_prompt = ?, image_prompt = ?, name_prompt = ?
-                WHERE id = ?
-            ''', (message_prompt, image_prompt, name_prompt, prompt_id))
+            self.cursor.execute(UPDATE_PROMPT_SQL, (message_prompt, image_prompt, name_prompt, prompt_id))
             self.conn.commit()
             logging.info(f"Промт с ID {prompt_id} обновлен.")
         except Exception as e:
@@ -203,9 +904,7 @@ class Database:
 
     def delete_prompt(self, prompt_id):
         try:
-            self.cursor.execute('''
-                DELETE FROM prompts WHERE id = ?
-            ''', (prompt_id,))
+            self.cursor.execute(DELETE_PROMPT_SQL, (prompt_id,))
             self.conn.commit()
             logging.info(f"Промт с ID {prompt_id} удален.")
         except Exception as e:
@@ -1,12 +1,14 @@
-import g4f
-import os
+import io
+import asyncio
+import time
 import requests
 import logging
-import re
-import random
-import string
-from g4f.client import Client
+import threading
+from requests.adapters import HTTPAdapter
 from PIL import Image
+from llm_backends import create_backend
+from llm_cache import LLMCache
+from image_store import ImageStore
 
 # Настройка логирования
 logging.basicConfig(
@@ -18,11 +20,151 @@ logging.basicConfig(
     ]
 )
 
-# Создаем папку для изображений, если она не существует
-if not os.path.exists('generated_images'):
-    os.makedirs('generated_images')
+IMAGE_MODEL = "dall-e-3"
+IMAGE_SIZE = (300, 300)  # Максимальный размер сохраняемого изображения
+MAX_IMAGE_BYTES = 20 * 1024 * 1024  # Наибольший допустимый размер загружаемого файла
+DOWNLOAD_TIMEOUT = (10, 60)  # Таймауты подключения и чтения при загрузке изображения
 
-def extract_library_name(message_text, name_prompt=None):
+# Общая сессия HTTP: соединения с сервером изображений переиспользуются между загрузками
+http_session = requests.Session()
+http_session.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=32))
+http_session.mount("http://", HTTPAdapter(pool_connections=4, pool_maxsize=32))
+
+_backend = None
+_backend_lock = threading.Lock()
+
+_llm_cache = None
+_llm_cache_lock = threading.Lock()
+
+_image_store = None
+_image_store_lock = threading.Lock()
+
+
+def get_backend():
+    """
+    Возвращает бэкенд нейросети (см. llm_backends). Создается при первом вызове,
+    чтобы переменные окружения из .env уже были загружены.
+    """
+    global _backend
+    with _backend_lock:
+        if _backend is None:
+            _backend = create_backend()
+        return _backend
+
+
+def set_backend(backend):
+    """
+    Заменяет бэкенд нейросети (например, на локальный сервер-заглушку в нагрузочных тестах).
+    """
+    global _backend
+    with _backend_lock:
+        _backend = backend
+
+
+def download_image(url, max_bytes=MAX_IMAGE_BYTES):
+    """
+    Загружает изображение потоком через общую сессию и возвращает его содержимое.
+    Загрузка прерывается, если файл больше max_bytes.
+    """
+    with http_session.get(url, stream=True, timeout=DOWNLOAD_TIMEOUT) as response:
+        if response.status_code != 200:
+            raise ValueError(f"Не удалось загрузить изображение: {response.status_code}")
+        content_length = response.headers.get("Content-Length")
+        if content_length and content_length.isdigit() and int(content_length) > max_bytes:
+            raise ValueError(f"Изображение слишком большое: {content_length} байт")
+
+        data = bytearray()
+        for chunk in response.iter_content(chunk_size=64 * 1024):
+            data.extend(chunk)
+            if len(data) > max_bytes:
+                raise ValueError(f"Изображение больше {max_bytes} байт")
+        return bytes(data)
+
+
+def resize_image(data, size=IMAGE_SIZE):
+    """
+    Уменьшает изображение в памяти и возвращает его в формате PNG.
+    JPEG сразу декодируется в уменьшенном масштабе (draft), остальные форматы
+    сначала быстро уменьшаются в целое число раз (reduce), а затем до нужного размера.
+    """
+    image = Image.open(io.BytesIO(data))
+    image.draft("RGB", size)
+    factor = min(image.width // size[0], image.height // size[1])
+    if factor >= 2:
+        if image.mode not in ("L", "LA", "RGB", "RGBA"):
+            # reduce работает не со всеми режимами (например, с палитрой)
+            image = image.convert("RGBA")
+        image = image.reduce(factor)
+    image.thumbnail(size)  # Устанавливаем максимальный размер
+
+    output = io.BytesIO()
+    image.save(output, format="PNG")
+    return output.getvalue()
+
+
+def get_image_store():
+    """
+    Возвращает хранилище изображений (папка generated_images) с повторным использованием одинаковых запросов.
+    Папка и база открываются при первом обращении, а не при импорте модуля.
+    """
+    global _image_store
+    with _image_store_lock:
+        if _image_store is None:
+            _image_store = ImageStore()
+        return _image_store
+
+
+def set_image_store(store):
+    """
+    Заменяет хранилище изображений (например, на временное в нагрузочных тестах).
+    None возвращает хранилище по умолчанию, которое будет открыто при следующем обращении.
+    """
+    global _image_store
+    with _image_store_lock:
+        _image_store = store
+
+
+def get_llm_cache():
+    """
+    Возвращает постоянный кэш ответов нейросети: одинаковые запросы не отправляются повторно.
+    Файл llm_cache.db открывается при первом обращении, а не при импорте модуля.
+    """
+    global _llm_cache
+    with _llm_cache_lock:
+        if _llm_cache is None:
+            _llm_cache = LLMCache()
+        return _llm_cache
+
+
+def set_llm_cache(cache):
+    """
+    Заменяет кэш ответов нейросети (например, на временный в нагрузочных тестах).
+    None возвращает кэш по умолчанию, который будет открыт при следующем обращении.
+    """
+    global _llm_cache
+    with _llm_cache_lock:
+        _llm_cache = cache
+
+
+def chat_completion(prompt, text, model="gpt-4", use_cache=True):
+    """
+    Отправляет нейросети промт с текстом и возвращает ответ.
+    Ответы кэшируются по (модель, промт, текст); use_cache=False запрашивает ответ заново
+    (например, для кнопок повторного преобразования) и обновляет кэш.
+    """
+    if use_cache:
+        response = get_llm_cache().get(model, prompt, text)
+        if response is not None:
+            logging.info("Ответ нейросети взят из кэша.")
+            return response
+
+    response = get_backend().complete(model, prompt + " " + text)
+    if response:
+        get_llm_cache().set(model, prompt, text, response)
+    return response
+
+
+def extract_library_name(message_text, name_prompt=None, use_cache=True):
     """
     Извлекает название сообщения из текста с помощью нейросети.
     """
@@ -33,105 +175,177 @@ def extract_library_name(message_text, name_prompt=None):
                            f"Ответ должен содержать только название сообщения: {message_text}")
 
         # Запрос к нейросети для извлечения названия сообщения
-        response = g4f.ChatCompletion.create(
-            model="gpt-4",
-            messages=[{"role": "user", "content": (name_prompt + " " + message_text)}],
-        )
+        response = chat_completion(name_prompt, message_text, use_cache=use_cache)
         return response.strip()  # Убираем лишние пробелы
     except Exception as e:
         logging.error(f"Ошибка при извлечении названия сообщения: {e}")
         return None
 
-def generate_image_name(library_name):
-    """
-    Генерирует имя файла для изображения на основе названия сообщения.
-    - Имя должно быть не длиннее 10 символов.
-    - Используются только латинские буквы (без пробелов и специальных знаков).
-    - Если в названии нет латинских букв, генерируется случайное имя.
-    """
-    # Убираем все нелатинские символы и пробелы
-    cleaned_name = re.sub(r'[^a-zA-Z]', '', library_name)
-
-    # Если в названии есть латинские буквы, обрезаем до 10 символов
-    if cleaned_name:
-        return cleaned_name[:10].lower()  # Приводим к нижнему регистру
-
-    # Если латинских букв нет, генерируем случайное имя из 10 символов
-    random_name = ''.join(random.choices(string.ascii_lowercase, k=10))
-    return random_name
-
-def generate_image(library_name, image_prompt=None):
+def generate_image(library_name, image_prompt=None, use_cache=True, timings=None):
     """
     Генерирует изображение с использованием названия сообщения.
+    Изображение, уже сгенерированное на такой же промт, берется из хранилища
+    (use_cache=False генерирует новое, например для кнопки повторной генерации).
+    Если передан словарь timings, в него записывается длительность запроса
+    на генерацию ("image_request"), загрузки ("download") и уменьшения ("resize").
     """
+    timings = {} if timings is None else timings
     try:
-        client = Client()
         # Если промт не задан, используем стандартный
         if not image_prompt:
             image_prompt = (f"сгенерируйте изображение с текстом '{library_name}'. "
                             f"Текст должен быть крупным и ярким")
+        prompt = image_prompt + " " + library_name
+
+        if use_cache:
+            filename = get_image_store().get(IMAGE_MODEL, prompt)
+            if filename:
+                logging.info(f"Изображение взято из хранилища: {filename}")
+                return filename
+
+        started = time.perf_counter()
+        image_url = get_backend().image_url(IMAGE_MODEL, prompt)
+        timings["image_request"] = time.perf_counter() - started
 
-        response = client.images.generate(
-            model="dall-e-3",
-            prompt=(image_prompt + " " + library_name),
-            response_format="url"
-        )
-        image_url = response.data[0].url
-
-        # Генерируем имя файла
-        image_name = generate_image_name(library_name)
-        filename = f"generated_images/{image_name}_image.png"
-
-        # Сохраняем изображение
-        response = requests.get(image_url)
-        if response.status_code == 200:
-            with open(filename, 'wb') as f:
-                f.write(response.content)
-
-            # Уменьшаем размер изображения
-            image = Image.open(filename)
-            image.thumbnail((300, 300))  # Устанавливаем максимальный размер 300x300
-            image.save(filename)
-
-            logging.info(f"Изображение сохранено: {filename}")
-            return filename
-        else:
-            logging.error(f"Не удалось загрузить изображение: {response.status_code}")
-            return None
+        # Загружаем и уменьшаем изображение в памяти; на диск оно записывается один раз
+        started = time.perf_counter()
+        data = download_image(image_url)
+        timings["download"] = time.perf_counter() - started
+
+        started = time.perf_counter()
+        data = resize_image(data)
+        timings["resize"] = time.perf_counter() - started
+        return get_image_store().put(IMAGE_MODEL, prompt, data)
     except Exception as e:
         logging.error(f"Ошибка при генерации изображения: {e}")
         return None
 
-def transform_library_description(message_text, message_prompt=None, image_prompt=None, name_prompt=None):
+# Ограничения времени на этапы преобразования (в секундах)
+NAME_TIMEOUT = 60
+TEXT_TIMEOUT = 120
+IMAGE_TIMEOUT = 180
+
+
+def build_message_prompt(message_text, message_prompt=None):
     """
-    Преобразует описание сообщения и генерирует изображение.
+    Возвращает промт для переписывания текста (стандартный, если не задан).
+    """
+    if not message_prompt:
+        message_prompt = (f"Перепиши другими словами, но чтобы смысл остался прежним. Убери все лишнее, оставь "
+                          f"только название библиотеки, описание, установку, допиши не большой код использования библиотеки до 200 символов"
+                          f"и ссылку на документацию: {message_text}.")
+    return message_prompt
+
+
+def rewrite_text(message_text, message_prompt=None, use_cache=True):
+    """
+    Переписывает текст сообщения с помощью нейросети.
+    """
+    return chat_completion(build_message_prompt(message_text, message_prompt), message_text, use_cache=use_cache)
+
+
+class TransformResult:
+    """
+    Результат преобразования сообщения и время выполнения каждого этапа.
+    """
+
+    def __init__(self):
+        self.library_name = None
+        self.text = None
+        self.image = None
+        self.timings = {}  # Этап (name, text, image с image_request, download, resize; total) -> секунды
+        self.error = None
+
+    def __repr__(self):
+        return f"TransformResult(library_name={self.library_name!r}, image={self.image!r}, timings={self.timings})"
+
+
+async def run_stage(result, stage, timeout, func, *args):
+    """
+    Выполняет блокирующий этап в пуле потоков с ограничением времени.
+    При превышении timeout ожидание прерывается с asyncio.TimeoutError
+    (сам поток нельзя остановить, его результат просто отбрасывается).
     """
+    started = time.perf_counter()
     try:
-        # Если промт не задан, используем стандартный
-        if not message_prompt:
-            message_prompt = (f"Перепиши другими словами, но чтобы смысл остался прежним. Убери все лишнее, оставь "
-                              f"только название библиотеки, описание, установку, допиши не большой код использования библиотеки до 200 символов"
-                              f"и ссылку на документацию: {message_text}.")
-
-        # Извлекаем название сообщения
-        library_name = extract_library_name(message_text, name_prompt)
-        if not library_name:
-            logging.error("Не удалось извлечь название сообщения.")
-            return None, None
-
-        # Преобразуем текст
-        transformed_text = g4f.ChatCompletion.create(
-            model="gpt-4",
-            messages=[{"role": "user", "content": (message_prompt + " " + message_text)}],
-        )
-
-        # Генерируем изображение
-        image_path = generate_image(library_name, image_prompt)
-        if not image_path:
+        return await asyncio.wait_for(asyncio.to_thread(func, *args), timeout)
+    except asyncio.TimeoutError:
+        logging.error(f"Этап {stage} не завершился за {timeout} с.")
+        raise
+    finally:
+        result.timings[stage] = time.perf_counter() - started
+
+
+async def run_transform_pipeline(message_text, message_prompt=None, image_prompt=None, name_prompt=None,
+                                 name_timeout=NAME_TIMEOUT, text_timeout=TEXT_TIMEOUT, image_timeout=IMAGE_TIMEOUT,
+                                 use_cache=True):
+    """
+    Преобразует описание сообщения и генерирует изображение.
+
+    Переписывание текста не зависит от названия, поэтому выполняется одновременно
+    с цепочкой "название -> изображение", и общее время равно самой долгой из них.
+    Если название не удалось получить или текст не удалось переписать, вторая
+    ветка отменяется; без изображения текст возвращается как есть. Возвращает TransformResult.
+    use_cache=False запрашивает у нейросети название и текст заново, минуя кэш ответов.
+    """
+    result = TransformResult()
+    started = time.perf_counter()
+
+    async def name_and_image():
+        result.library_name = await run_stage(result, "name", name_timeout, extract_library_name, message_text,
+                                              name_prompt, use_cache)
+        if not result.library_name:
+            raise ValueError("Не удалось извлечь название сообщения.")
+        try:
+            result.image = await run_stage(result, "image", image_timeout, generate_image, result.library_name,
+                                           image_prompt, True, result.timings)
+        except asyncio.TimeoutError:
+            # Как и при ошибке генерации, текст сохраняется без изображения
+            result.image = None
+        if not result.image:
             logging.error("Не удалось сгенерировать изображение.")
-            return transformed_text, None
 
-        return transformed_text, image_path
+    async def text():
+        result.text = await run_stage(result, "text", text_timeout, rewrite_text, message_text, message_prompt,
+                                      use_cache)
+
+    tasks = [asyncio.ensure_future(name_and_image()), asyncio.ensure_future(text())]
+    try:
+        # Первая ошибка отменяет оставшуюся ветку
+        done, pending = await asyncio.wait(tasks, return_when=asyncio.FIRST_EXCEPTION)
+        for task in done:
+            if task.exception() is not None:
+                raise task.exception()
     except Exception as e:
         logging.error(f"Ошибка при преобразовании описания: {e}")
-        return None, None
\ No newline at end of file
+        result.error = e
+        result.text, result.image = None, None
+    finally:
+        for task in tasks:
+            if not task.done():
+                task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        result.timings["total"] = time.perf_counter() - started
+
+    logging.info(f"Преобразование завершено за {result.timings['total']:.1f} с: {result.timings}")
+    return result
+
+
+async def transform_library_description_async(message_text, message_prompt=None, image_prompt=None,
+                                              name_prompt=None, use_cache=True):
+    """
+    Асинхронная версия transform_library_description: возвращает (текст, путь к изображению).
+    """
+    result = await run_transform_pipeline(message_text, message_prompt, image_prompt, name_prompt,
+                                          use_cache=use_cache)
+    return result.text, result.image
+
+
+def transform_library_description(message_text, message_prompt=None, image_prompt=None, name_prompt=None,
+                                  use_cache=True):
+    """
+    Преобразует описание сообщения и генерирует изображение.
+    Синхронная обертка над run_transform_pipeline для вызова вне цикла событий.
+    """
+    return asyncio.run(transform_library_description_async(message_text, message_prompt, image_prompt, name_prompt,
+                                                           use_cache))
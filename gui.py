@@ -1,14 +1,21 @@
 import tkinter as tk
 import os
-import asyncio
 import logging
 from dotenv import load_dotenv
 from tkinter import messagebox, simpledialog, ttk
 from database import Database
+from async_database import AsyncDatabase
 from telegram_client import TelegramClientWrapper
-from g4f_wrapper import transform_library_description, extract_library_name, generate_image
-from PIL import Image, ImageTk
-from datetime import datetime
+from scan_engine import ScanEngine, ChannelScanConfig
+from virtual_list import VirtualListView
+from worker import AsyncWorker
+from transform_queue import TransformQueue
+from thumbnail_cache import ThumbnailCache
+from monitor import ChannelMonitor
+from upload_queue import UploadQueue, enqueue_libraries
+from g4f_wrapper import (transform_library_description_async, rewrite_text, extract_library_name, generate_image,
+                         get_image_store)
+from datetime import datetime, timedelta
 
 
 # Загружаем переменные из .env файла
@@ -24,6 +31,14 @@ logging.basicConfig(
     ]
 )
 
+def preview_text(text, max_length=400):
+    """
+    Сокращает текст для строки списка фиксированной высоты.
+    """
+    text = text or ""
+    return text if len(text) <= max_length else text[:max_length].rstrip() + "…"
+
+
 class TelegramParserApp:
     def __init__(self, root):
         self.root = root
@@ -31,7 +46,7 @@ class TelegramParserApp:
         self.root.geometry("1000x600")  # Устанавливаем размер окна
 
         # Инициализация базы данных
-        self.db = Database()
+        self.db = Database(wal=True)
         logging.info("База данных инициализирована.")
 
         # Инициализация Telegram клиента
@@ -40,34 +55,86 @@ class TelegramParserApp:
         if not api_id or not api_hash:
             logging.error("Не удалось загрузить API_ID или API_HASH из .env файла.")
             raise ValueError("API_ID и API_HASH должны быть указаны в .env файле.")
-        self.telegram_client = TelegramClientWrapper(api_id, api_hash)
+        # Постоянное соединение: клиент подключается один раз и живет до закрытия окна
+        self.telegram_client = TelegramClientWrapper(api_id, api_hash, persistent=True)
         logging.info("Telegram клиент инициализирован.")
 
         # Создаем меню
         self.create_menu()
 
+        # Строка состояния с активными фоновыми задачами
+        self.create_status_bar()
+
+        # Фоновый цикл asyncio: в нем работают Telegram клиент, сканирование и выгрузка,
+        # а запросы к нейросети — в его пуле потоков. Окно при этом не блокируется.
+        self.worker = AsyncWorker(self.root, on_jobs_changed=self.update_status_bar)
+
+        # Отдельное соединение с базой для фонового потока (sqlite3 привязан к потоку)
+        self.worker_db = self.worker.run_sync(self.open_worker_database())
+
+        # Движок сканирования нескольких каналов через один клиент
+        self.scan_engine = ScanEngine(self.telegram_client, self.worker_db)
+
+        # Очередь пакетного преобразования; сообщения, отмеченные в истории, хранятся по id
+        self.transform_queue = TransformQueue(self.worker_db, workers=int(os.getenv("TRANSFORM_WORKERS", 3)))
+        self.transform_queue_job = None
+        self.selected_messages = set()
+
+        # Уменьшенные изображения для списков и окон (декодируются в фоне)
+        self.thumbnails = ThumbnailCache(self.worker)
+
+        # Очередь выгрузки в Telegram через тот же постоянный клиент
+        self.upload_queue = UploadQueue(self.worker_db, self.telegram_client)
+        self.upload_queue_job = None
+
+        # Мониторинг каналов в реальном времени (запускается из меню)
+        self.monitor = None
+        self.monitor_job = None
+
         # Создаем контейнер для библиотек с прокруткой
         self.create_library_container()
 
         # Обновляем интерфейс
         self.update_library_list()
 
-        # Запускаем цикл событий asyncio
-        self.loop = asyncio.get_event_loop()
+        # Продолжаем обработку очереди, оставшейся с прошлого запуска
+        counts = self.db.get_transform_job_counts()
+        if counts['pending'] or counts['running']:
+            self.start_transform_queue()
+        # Выгрузки, прерванные закрытием программы, сверяются с каналом и досылаются
+        counts = self.db.get_upload_job_counts()
+        if counts['pending'] or counts['sending']:
+            self.start_upload_queue()
 
         # Обработка закрытия окна
         self.root.protocol("WM_DELETE_WINDOW", self.on_close)
 
+    async def open_worker_database(self):
+        """
+        Открывает асинхронную базу данных для фонового цикла: запись пачек сканирования
+        и задач очередей не останавливает цикл событий, на котором работает Telethon.
+        """
+        return await AsyncDatabase.open()
+
     async def initialize_telegram_client(self):
         """
         Асинхронный метод для подключения Telegram клиента.
         """
-        try:
-            await self.telegram_client.connect()
-            logging.info("Telegram клиент успешно подключен.")
-        except Exception as e:
-            logging.error(f"Ошибка при подключении Telegram клиента: {e}")
-            messagebox.showerror("Ошибка", f"Не удалось подключить Telegram клиент: {e}")
+        await self.telegram_client.connect()
+        logging.info("Telegram клиент успешно подключен.")
+
+    def create_status_bar(self):
+        self.status_label = tk.Label(self.root, text="Нет активных задач", anchor="w", relief=tk.SUNKEN)
+        self.status_label.pack(side=tk.BOTTOM, fill=tk.X)
+
+    def update_status_bar(self, jobs):
+        """
+        Показывает в строке состояния активные фоновые задачи и их прогресс.
+        """
+        if jobs:
+            self.status_label.config(text=f"Выполняется задач: {len(jobs)} — " + "; ".join(jobs.values()))
+        else:
+            self.status_label.config(text="Нет активных задач")
 
     def create_menu(self):
         # Создаем меню
@@ -76,8 +143,15 @@ class TelegramParserApp:
         # Меню "Сканировать"
         scan_menu = tk.Menu(menubar, tearoff=0)
         scan_menu.add_command(label="Сканировать телеграм канал", command=self.show_scan_input)
+        scan_menu.add_command(label="Сканировать несколько каналов", command=self.show_multi_scan_input)
         menubar.add_cascade(label="Сканировать", menu=scan_menu)
 
+        # Меню "Мониторинг"
+        monitor_menu = tk.Menu(menubar, tearoff=0)
+        monitor_menu.add_command(label="Запустить мониторинг", command=self.show_monitor_input)
+        monitor_menu.add_command(label="Остановить мониторинг", command=self.stop_monitor)
+        menubar.add_cascade(label="Мониторинг", menu=monitor_menu)
+
         # Меню "История сканирования"
         history_menu = tk.Menu(menubar, tearoff=0)
         history_menu.add_command(label="Последние 5", command=lambda: self.show_history(5))
@@ -88,8 +162,22 @@ class TelegramParserApp:
         # Меню "Показать преобразованные"
         transformed_menu = tk.Menu(menubar, tearoff=0)
         transformed_menu.add_command(label="Показать преобразованные", command=self.show_transformed_libraries_all)
+        transformed_menu.add_command(label="Выгрузить альбомом", command=self.show_album_upload_input)
+        transformed_menu.add_command(label="Удалить неиспользуемые изображения", command=self.collect_image_garbage)
         menubar.add_cascade(label="Показать преобразованные", menu=transformed_menu)
 
+        # Меню "Пакетное преобразование"
+        batch_menu = tk.Menu(menubar, tearoff=0)
+        batch_menu.add_command(label="Поставить в очередь", command=self.show_batch_transform_input)
+        batch_menu.add_command(label="Повторить неудачные", command=self.retry_failed_transforms)
+        batch_menu.add_command(label="Остановить очередь", command=self.stop_transform_queue)
+        menubar.add_cascade(label="Пакетное преобразование", menu=batch_menu)
+
+        # Меню "Поиск"
+        search_menu = tk.Menu(menubar, tearoff=0)
+        search_menu.add_command(label="Поиск по сообщениям", command=self.show_search_input)
+        menubar.add_cascade(label="Поиск", menu=search_menu)
+
         # Меню "Промты"
         prompt_menu = tk.Menu(menubar, tearoff=0)
         prompt_menu.add_command(label="Управление промтами", command=self.manage_prompts)
@@ -107,11 +195,11 @@ class TelegramParserApp:
         self.canvas.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
 
         # Добавляем Scrollbar
-        scrollbar = ttk.Scrollbar(self.container, orient=tk.VERTICAL, command=self.canvas.yview)
-        scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        self.scrollbar = ttk.Scrollbar(self.container, orient=tk.VERTICAL, command=self.canvas.yview)
+        self.scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
 
         # Настраиваем Canvas для работы с Scrollbar
-        self.canvas.configure(yscrollcommand=scrollbar.set)
+        self.canvas.configure(yscrollcommand=self.scrollbar.set)
         self.canvas.bind(
             "<Configure>",
             lambda e: self.canvas.configure(scrollregion=self.canvas.bbox("all"))
@@ -127,6 +215,30 @@ class TelegramParserApp:
             lambda e: self.canvas.yview_scroll(int(-1 * (e.delta / 120)), "units")
         )
 
+        # Виртуальный список для больших выборок (история, преобразованные) показывается вместо canvas
+        self.virtual_list = None
+
+    def show_virtual_list(self, fetch_page, create_row, update_row, limit=None):
+        """
+        Показывает в основном окне виртуальный список вместо обычного фрейма.
+        """
+        self.show_library_frame()
+        self.canvas.pack_forget()
+        self.scrollbar.pack_forget()
+        self.virtual_list = VirtualListView(self.container, fetch_page, create_row, update_row, limit=limit)
+        self.virtual_list.pack(fill=tk.BOTH, expand=True)
+
+    def show_library_frame(self):
+        """
+        Возвращает в основное окно обычный фрейм с прокруткой.
+        """
+        if self.virtual_list is None:
+            return
+        self.virtual_list.destroy()
+        self.virtual_list = None
+        self.canvas.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        self.scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+
     def show_scan_input(self):
         # Окно для ввода канала и выбора режима сканирования.
         scan_window = tk.Toplevel(self.root)
@@ -163,6 +275,17 @@ class TelegramParserApp:
         self.date_entry = tk.Entry(scan_window, state=tk.DISABLED)
         self.date_entry.grid(row=6, column=1, padx=5, pady=5)
 
+        # Поле для ограничения количества найденных сообщений
+        tk.Label(scan_window, text="Лимит сообщений (пусто — без ограничения):").grid(row=7, column=0, padx=5,
+                                                                                       pady=5)
+        limit_entry = tk.Entry(scan_window)
+        limit_entry.grid(row=7, column=1, padx=5, pady=5)
+
+        # Поиск ключевых слов на стороне Telegram вместо чтения всей истории
+        server_search = tk.BooleanVar(value=False)
+        tk.Checkbutton(scan_window, text="Искать ключевые слова на сервере Telegram", variable=server_search).grid(
+            row=8, column=0, columnspan=2, sticky="w", padx=5, pady=5)
+
         # Обработчик изменения выбора радио-кнопок
         def on_scan_mode_change():
             if self.scan_mode.get() == "specific_date":
@@ -194,104 +317,403 @@ class TelegramParserApp:
                     messagebox.showwarning("Ошибка", "Неверный формат даты. Используйте формат ГГГГ-ММ-ДД.")
                     return
 
+            limit = limit_entry.get().strip()
+            if limit:
+                if not limit.isdigit() or int(limit) <= 0:
+                    messagebox.showwarning("Ошибка", "Лимит должен быть положительным числом.")
+                    return
+                limit = int(limit)
+            else:
+                limit = None
+
             if channel_name and keywords:
-                self.scan_channel(channel_name, keywords, exclude_words, scan_mode, specific_date)
+                self.scan_channel(channel_name, keywords, exclude_words, scan_mode, specific_date, limit,
+                                  server_search.get())
                 scan_window.destroy()
             else:
                 messagebox.showwarning("Ошибка", "Пожалуйста, заполните все поля.")
 
-        tk.Button(scan_window, text="Сканировать", command=on_scan).grid(row=8, column=0, columnspan=2, pady=10)
+        tk.Button(scan_window, text="Сканировать", command=on_scan).grid(row=9, column=0, columnspan=2, pady=10)
 
-    def scan_channel(self, channel_name, keywords, exclude_words, scan_mode, specific_date):
+    def scan_channel(self, channel_name, keywords, exclude_words, scan_mode, specific_date, limit=None,
+                     server_search=False):
         logging.info(f"Начато сканирование канала: {channel_name}")
+        config = ChannelScanConfig(channel_name, keywords, exclude_words, scan_mode, specific_date, limit,
+                                   server_search)
+
+        def on_done(result):
+            if result.status == "error":
+                messagebox.showerror("Ошибка", f"Произошла ошибка: {str(result.error)}")
+            elif result.found:
+                messagebox.showinfo("Сканирование", f"Канал {channel_name}: найдено {result.found} сообщений.")
+                self.update_library_list()
+            else:
+                messagebox.showinfo("Сканирование", f"Канал {channel_name}: новые сообщения не найдены.")
+
+        def on_progress(result):
+            # Вызывается в фоновом потоке
+            self.worker.report_progress(job_id, f"Сканирование {channel_name}: найдено {result.found}")
+
+        # Сканирование идет в фоновом цикле, окно остается доступным.
+        # id задачи создается заранее: scan_one сообщает о прогрессе сразу после запуска
+        job_id = self.worker.new_job(f"Сканирование {channel_name}")
+        self.worker.submit(self.scan_engine.scan_one(config, progress_callback=on_progress), on_done,
+                           self.show_job_error, job_id=job_id)
 
-        async def run_scan():
+    def show_multi_scan_input(self):
+        """
+        Окно для одновременного сканирования нескольких каналов.
+        """
+        scan_window = tk.Toplevel(self.root)
+        scan_window.title("Сканирование нескольких каналов")
+
+        tk.Label(scan_window, text="Каналы, по одному в строке:\n"
+                                   "канал; ключевые слова; исключения; режим (start, continue или ГГГГ-ММ-ДД); лимит; "
+                                   "server (поиск на сервере)",
+                 justify=tk.LEFT).grid(row=0, column=0, columnspan=2, sticky="w", padx=5, pady=5)
+        channels_text = tk.Text(scan_window, height=15, width=80)
+        channels_text.grid(row=1, column=0, columnspan=2, padx=5, pady=5)
+
+        tk.Label(scan_window, text="Одновременно сканировать каналов:").grid(row=2, column=0, padx=5, pady=5)
+        concurrency_entry = tk.Entry(scan_window)
+        concurrency_entry.insert(0, str(self.scan_engine.concurrency))
+        concurrency_entry.grid(row=2, column=1, padx=5, pady=5)
+
+        def on_scan():
+            lines = [line for line in channels_text.get("1.0", tk.END).splitlines() if line.strip()]
+            if not lines:
+                messagebox.showwarning("Ошибка", "Пожалуйста, укажите хотя бы один канал.")
+                return
             try:
-                last_message_date = None
-
-                # Определяем дату начала сканирования
-                if scan_mode == "continue":
-                    last_message_date = self.db.get_last_scan_date(channel_name)
-                    logging.info(f"Продолжение сканирования с последней даты: {last_message_date}")
-                elif scan_mode == "specific_date":
-                    last_message_date = specific_date
-                    logging.info(f"Сканирование с конкретной даты: {last_message_date}")
-
-                # Преобразуем ключевые и исключаемые слова в списки (если они переданы как строки)
-                keywords_list = [keyword.strip() for keyword in keywords.split(',')] if isinstance(keywords,
-                                                                                                   str) else keywords
-                exclude_words_list = [word.strip() for word in exclude_words.split(',')] if isinstance(exclude_words,
-                                                                                                       str) else exclude_words
-
-                # Сканируем канал (не более 5 сообщений за раз)
-                messages_found = await self.telegram_client.scan_channel(channel_name, last_message_date, keywords_list,
-                                                                         exclude_words_list)
-                logging.info(f"Найдено {len(messages_found)} сообщений.")
-
-                if messages_found:
-                    # Сохраняем найденные сообщения
-                    for message_text, message_date in messages_found:
-                        self.db.save_message(channel_name, message_text, message_date)
-
-                    # Обновляем последнюю дату сканирования
-                    last_message_date = messages_found[-1][1]
-                    self.db.update_last_scan_date(channel_name, last_message_date)
-
-                    messagebox.showinfo("Сканирование", f"Найдено {len(messages_found)} сообщений.")
-                    self.update_library_list()
+                configs = [ChannelScanConfig.from_line(line) for line in lines]
+                concurrency = int(concurrency_entry.get())
+            except ValueError as e:
+                messagebox.showwarning("Ошибка", f"Неверные параметры сканирования: {e}")
+                return
+
+            scan_window.destroy()
+            self.scan_channels(configs, concurrency)
+
+        tk.Button(scan_window, text="Сканировать", command=on_scan).grid(row=3, column=0, columnspan=2, pady=10)
+
+    def scan_channels(self, configs, concurrency):
+        """
+        Сканирует несколько каналов одновременно и показывает итог по каждому.
+        """
+        logging.info(f"Начато сканирование {len(configs)} каналов (одновременно: {concurrency}).")
+        self.scan_engine.concurrency = concurrency
+
+        progress = {}
+
+        def on_progress(result):
+            # Вызывается в фоновом потоке
+            progress[result.channel_name] = result
+            finished = sum(1 for item in progress.values() if item.status in ("done", "error"))
+            found = sum(item.found for item in progress.values())
+            self.worker.report_progress(job_id, f"Сканирование каналов: завершено {finished} из {len(configs)}, "
+                                                f"найдено {found}")
+
+        def on_done(results):
+            summary = []
+            for result in results:
+                if result.status == "error":
+                    summary.append(f"{result.channel_name}: ошибка ({result.error})")
                 else:
-                    messagebox.showinfo("Сканирование", "Новые сообщения не найдены.")
-            except Exception as e:
-                logging.error(f"Ошибка при сканировании канала: {e}")
-                messagebox.showerror("Ошибка", f"Произошла ошибка: {str(e)}")
+                    summary.append(f"{result.channel_name}: найдено {result.found}")
+            messagebox.showinfo("Сканирование", "\n".join(summary))
+            self.update_library_list()
+
+        job_id = self.worker.new_job(f"Сканирование {len(configs)} каналов")
+        self.worker.submit(self.scan_engine.run(configs, on_progress), on_done, self.show_job_error, job_id=job_id)
+
+    def show_monitor_input(self):
+        """
+        Окно запуска мониторинга новых сообщений в реальном времени.
+        """
+        if self.monitor_job is not None:
+            messagebox.showinfo("Мониторинг", "Мониторинг уже запущен.")
+            return
+
+        monitor_window = tk.Toplevel(self.root)
+        monitor_window.title("Мониторинг каналов")
+
+        tk.Label(monitor_window, text="Каналы, по одному в строке: канал; ключевые слова; исключения\n"
+                                      "(аккаунт должен быть подписан на эти каналы)",
+                 justify=tk.LEFT).grid(row=0, column=0, columnspan=2, sticky="w", padx=5, pady=5)
+        channels_text = tk.Text(monitor_window, height=10, width=80)
+        channels_text.grid(row=1, column=0, columnspan=2, padx=5, pady=5)
+
+        enqueue_var = tk.BooleanVar(value=False)
+        tk.Checkbutton(monitor_window, text="Ставить найденные сообщения в очередь преобразования",
+                       variable=enqueue_var).grid(row=2, column=0, columnspan=2, sticky="w", padx=5)
+
+        def on_start():
+            lines = [line for line in channels_text.get("1.0", tk.END).splitlines() if line.strip()]
+            if not lines:
+                messagebox.showwarning("Ошибка", "Пожалуйста, укажите хотя бы один канал.")
+                return
+            try:
+                configs = [ChannelScanConfig.from_line(line) for line in lines]
+            except ValueError as e:
+                messagebox.showwarning("Ошибка", f"Неверные параметры мониторинга: {e}")
+                return
+
+            monitor_window.destroy()
+            self.start_monitor(configs, enqueue_var.get())
+
+        tk.Button(monitor_window, text="Запустить", command=on_start).grid(row=3, column=0, columnspan=2, pady=10)
+
+    def start_monitor(self, configs, enqueue_transform):
+        def on_message(channel_name, message, saved):
+            # Вызывается в фоновом потоке
+            self.worker.report_progress(self.monitor_job, f"Мониторинг {len(configs)} каналов: "
+                                                          f"найдено {self.monitor.found}")
+            if saved and enqueue_transform:
+                self.worker.call_in_ui(self.start_transform_queue)
+
+        def on_done(result):
+            self.monitor = self.monitor_job = None
+
+        def on_error(error):
+            self.monitor = self.monitor_job = None
+            messagebox.showerror("Ошибка", f"Мониторинг остановлен: {error}")
+
+        self.monitor = ChannelMonitor(self.telegram_client, self.worker_db, configs, enqueue_transform,
+                                      on_message=on_message)
+        self.monitor_job = self.worker.new_job(f"Мониторинг {len(configs)} каналов")
+        self.worker.submit(self.monitor.run(), on_done, on_error, job_id=self.monitor_job)
 
-        asyncio.run(run_scan())
+    def stop_monitor(self):
+        if self.monitor is not None:
+            self.worker.loop.call_soon_threadsafe(self.monitor.stop)
+
+    def show_job_error(self, error):
+        messagebox.showerror("Ошибка", f"Произошла ошибка: {error}")
 
     def show_history(self, limit=None):
         """
            Отображает историю сканирования с ограничением по количеству записей.
+           Записи подгружаются из базы страницами по мере прокрутки, последние сохраненные первыми.
            """
         logging.info(f"Загрузка истории сканирования (limit={limit}).")
-        # Очищаем фрейм
-        for widget in self.library_frame.winfo_children():
-            widget.destroy()
+        page_size = min(limit, 100) if limit else 100
+        self.show_virtual_list(
+            lambda cursor: self.db.get_messages_page(cursor=cursor, page_size=page_size, order='id'),
+            self.create_history_row, self.update_history_row, limit
+        )
+
+    def create_history_row(self, parent):
+        """
+        Создает переиспользуемую строку истории сканирования.
+        """
+        frame = tk.Frame(parent, bd=2, relief=tk.GROOVE)
+        frame.label = tk.Label(frame, wraplength=700, justify=tk.LEFT, anchor="nw")
+        frame.label.pack(side=tk.LEFT, fill=tk.BOTH, expand=True, padx=5, pady=5)
+        frame.transform_button = tk.Button(frame, text="Преобразовать")
+        frame.transform_button.pack(side=tk.RIGHT, padx=5)
+        # Отметка для пакетного преобразования
+        frame.selected = tk.BooleanVar()
+        frame.select_button = tk.Checkbutton(frame, variable=frame.selected)
+        frame.select_button.pack(side=tk.LEFT, before=frame.label)
+        return frame
+
+    def update_history_row(self, frame, record):
+        message_id, channel_name, message_text, message_date = record
+        frame.label.config(text=f"{preview_text(message_text)} (канал: {channel_name}, дата: {message_date})")
+        frame.selected.set(message_id in self.selected_messages)
+        frame.select_button.config(command=lambda: self.toggle_message_selection(message_id, frame.selected.get()))
+        frame.transform_button.config(command=lambda text=message_text: self.transform_library(text))
+
+    def toggle_message_selection(self, message_id, selected):
+        if selected:
+            self.selected_messages.add(message_id)
+        else:
+            self.selected_messages.discard(message_id)
+
+    def show_batch_transform_input(self):
+        """
+        Окно постановки сообщений в очередь пакетного преобразования:
+        отмеченные в истории сообщения или все сообщения канала за период.
+        """
+        batch_window = tk.Toplevel(self.root)
+        batch_window.title("Пакетное преобразование")
+
+        source_var = tk.StringVar(value="selected" if self.selected_messages else "filter")
+        tk.Radiobutton(batch_window, text=f"Отмеченные в истории ({len(self.selected_messages)})",
+                       variable=source_var, value="selected").grid(row=0, column=0, columnspan=2, sticky="w", padx=5)
+        tk.Radiobutton(batch_window, text="Сообщения канала за период", variable=source_var,
+                       value="filter").grid(row=1, column=0, columnspan=2, sticky="w", padx=5)
+
+        tk.Label(batch_window, text="Канал (пусто — все каналы):").grid(row=2, column=0, padx=5, pady=5)
+        channel_entry = tk.Entry(batch_window, width=40)
+        channel_entry.grid(row=2, column=1, padx=5, pady=5)
+
+        tk.Label(batch_window, text="С даты (ГГГГ-ММ-ДД, необязательно):").grid(row=3, column=0, padx=5, pady=5)
+        date_from_entry = tk.Entry(batch_window, width=40)
+        date_from_entry.grid(row=3, column=1, padx=5, pady=5)
+
+        tk.Label(batch_window, text="По дату (ГГГГ-ММ-ДД, необязательно):").grid(row=4, column=0, padx=5, pady=5)
+        date_to_entry = tk.Entry(batch_window, width=40)
+        date_to_entry.grid(row=4, column=1, padx=5, pady=5)
+
+        tk.Label(batch_window, text="Промт (без выбора — стандартный):").grid(row=5, column=0, columnspan=2, pady=5)
+        self.prompt_listbox = tk.Listbox(batch_window, width=50, height=6)
+        self.prompt_listbox.grid(row=6, column=0, columnspan=2, padx=5, pady=5)
+        self.load_prompts()
 
-        # Получаем историю сканирования
-        history = self.db.get_messages(limit)
-        logging.info(f"Получено {len(history)} записей истории сканирования.")
+        tk.Label(batch_window, text="Количество обработчиков:").grid(row=7, column=0, padx=5, pady=5)
+        workers_entry = tk.Entry(batch_window, width=10)
+        workers_entry.insert(0, str(self.transform_queue.workers))
+        workers_entry.grid(row=7, column=1, sticky="w", padx=5, pady=5)
 
-        # Отображаем каждую запись
-        for record in history:
-            channel_name, message_text, message_date = record
-            self.add_history_record_to_frame(channel_name, message_text, message_date)
+        def on_enqueue():
+            try:
+                date_from = datetime.strptime(date_from_entry.get(), "%Y-%m-%d") if date_from_entry.get() else None
+                date_to = datetime.strptime(date_to_entry.get(), "%Y-%m-%d") if date_to_entry.get() else None
+                workers = int(workers_entry.get())
+                if workers < 1:
+                    raise ValueError
+            except ValueError:
+                messagebox.showwarning("Ошибка", "Проверьте даты (ГГГГ-ММ-ДД) и количество обработчиков.")
+                return
+            if date_to:
+                date_to += timedelta(days=1)
 
-        # Обновляем область прокрутки
-        self.canvas.configure(scrollregion=self.canvas.bbox("all"))
+            selected = self.prompt_listbox.curselection()
+            prompt = self.db.get_prompts()[selected[0]] if selected else None
+            try:
+                if source_var.get() == "selected":
+                    count = self.db.enqueue_transform_jobs(sorted(self.selected_messages), prompt)
+                    self.selected_messages.clear()
+                else:
+                    count = self.db.enqueue_transform_jobs(None, prompt, channel_entry.get().strip() or None,
+                                                           date_from, date_to)
+            except Exception as e:
+                messagebox.showerror("Ошибка", f"Не удалось поставить сообщения в очередь: {e}")
+                return
+
+            batch_window.destroy()
+            messagebox.showinfo("Пакетное преобразование", f"В очередь добавлено {count} сообщений.")
+            self.transform_queue.workers = workers
+            self.start_transform_queue()
 
-    def add_history_record_to_frame(self, channel_name, message_text, message_date):
+        tk.Button(batch_window, text="Поставить в очередь", command=on_enqueue).grid(row=8, column=0, columnspan=2,
+                                                                                   pady=10)
+
+    def start_transform_queue(self):
         """
-        Добавляет запись истории сканирования в интерфейс.
+        Запускает обработку очереди преобразования в фоне, если она еще не запущена.
         """
-        # Фрейм для одной записи
-        frame = tk.Frame(self.library_frame, bd=2, relief=tk.GROOVE)
-        frame.pack(fill=tk.X, pady=5, padx=5)
+        if self.transform_queue_job is not None:
+            return
 
-        # Метка с текстом сообщения (без обрезки)
-        label = tk.Label(frame, text=f"{message_text} (канал: {channel_name}, дата: {message_date})", wraplength=700,
-                         justify=tk.LEFT)
-        label.pack(side=tk.LEFT, padx=5, pady=5)
+        def on_progress(counts):
+            # Вызывается в фоновом потоке
+            self.worker.report_progress(self.transform_queue_job, f"Пакетное преобразование: готово {counts['done']}, "
+                                                                  f"в очереди {counts['pending']}, "
+                                                                  f"выполняется {counts['running']}, "
+                                                                  f"ошибок {counts['failed']}")
 
-        # Кнопка "Преобразовать"
-        transform_button = tk.Button(frame, text="Преобразовать",
-                                     command=lambda text=message_text: self.transform_library(text))
-        transform_button.pack(side=tk.RIGHT, padx=5)
+        def on_done(counts):
+            self.transform_queue_job = None
+            messagebox.showinfo("Пакетное преобразование",
+                                f"Очередь обработана: готово {counts['done']}, ошибок {counts['failed']}.")
 
-        # Разделительная линия
-        separator = ttk.Separator(self.library_frame, orient=tk.HORIZONTAL)
-        separator.pack(fill=tk.X, pady=5)
+        def on_error(error):
+            self.transform_queue_job = None
+            self.show_job_error(error)
+
+        self.transform_queue_job = self.worker.new_job("Пакетное преобразование")
+        self.worker.submit(self.transform_queue.run(progress_callback=on_progress), on_done, on_error,
+                           job_id=self.transform_queue_job)
+
+    def stop_transform_queue(self):
+        """
+        Останавливает обработку очереди после текущих задач; остальные задачи сохраняются в базе.
+        """
+        self.worker.loop.call_soon_threadsafe(self.transform_queue.stop)
+
+    def retry_failed_transforms(self):
+        count = self.db.retry_failed_transform_jobs()
+        messagebox.showinfo("Пакетное преобразование", f"В очередь возвращено {count} задач.")
+        if count:
+            self.start_transform_queue()
+
+    def show_search_input(self):
+        """
+        Окно полнотекстового поиска по сохраненным сообщениям.
+        """
+        search_window = tk.Toplevel(self.root)
+        search_window.title("Поиск по сообщениям")
+
+        tk.Label(search_window, text="Слова для поиска:").grid(row=0, column=0, padx=5, pady=5)
+        query_entry = tk.Entry(search_window, width=40)
+        query_entry.grid(row=0, column=1, padx=5, pady=5)
+
+        tk.Label(search_window, text="Канал (необязательно):").grid(row=1, column=0, padx=5, pady=5)
+        channel_entry = tk.Entry(search_window, width=40)
+        channel_entry.grid(row=1, column=1, padx=5, pady=5)
+
+        tk.Label(search_window, text="С даты (ГГГГ-ММ-ДД, необязательно):").grid(row=2, column=0, padx=5, pady=5)
+        date_from_entry = tk.Entry(search_window, width=40)
+        date_from_entry.grid(row=2, column=1, padx=5, pady=5)
+
+        tk.Label(search_window, text="По дату (ГГГГ-ММ-ДД, необязательно):").grid(row=3, column=0, padx=5, pady=5)
+        date_to_entry = tk.Entry(search_window, width=40)
+        date_to_entry.grid(row=3, column=1, padx=5, pady=5)
+
+        def on_search():
+            query = query_entry.get().strip()
+            if not query:
+                messagebox.showwarning("Ошибка", "Пожалуйста, введите слова для поиска.")
+                return
+            try:
+                date_from = datetime.strptime(date_from_entry.get(), "%Y-%m-%d") if date_from_entry.get() else None
+                date_to = datetime.strptime(date_to_entry.get(), "%Y-%m-%d") if date_to_entry.get() else None
+            except ValueError:
+                messagebox.showwarning("Ошибка", "Неверный формат даты. Используйте формат ГГГГ-ММ-ДД.")
+                return
+            if date_to:
+                # Включаем в результаты весь последний день
+                date_to += timedelta(days=1)
+
+            results = self.db.search_messages(query, channel_entry.get().strip() or None, date_from, date_to)
+            self.show_search_results(query, results)
+
+        query_entry.bind("<Return>", lambda e: on_search())
+        tk.Button(search_window, text="Найти", command=on_search).grid(row=4, column=0, columnspan=2, pady=10)
+
+    def show_search_results(self, query, results):
+        """
+        Отображает результаты поиска: фрагменты сообщений с подсвеченными словами.
+        """
+        logging.info(f"Отображение {len(results)} результатов поиска по запросу '{query}'.")
+        self.show_library_frame()
+        # Очищаем фрейм
+        for widget in self.library_frame.winfo_children():
+            widget.destroy()
+
+        if not results:
+            tk.Label(self.library_frame, text=f"По запросу «{query}» ничего не найдено.").pack(padx=5, pady=5)
+
+        for message_id, channel_name, message_text, snippet, message_date, rank in results:
+            frame = tk.Frame(self.library_frame, bd=2, relief=tk.GROOVE)
+            frame.pack(fill=tk.X, pady=5, padx=5)
+
+            label = tk.Label(frame, text=f"{snippet} (канал: {channel_name}, дата: {message_date})", wraplength=700,
+                             justify=tk.LEFT)
+            label.pack(side=tk.LEFT, padx=5, pady=5)
+
+            transform_button = tk.Button(frame, text="Преобразовать",
+                                         command=lambda text=message_text: self.transform_library(text))
+            transform_button.pack(side=tk.RIGHT, padx=5)
+
+        # Обновляем область прокрутки
+        self.canvas.configure(scrollregion=self.canvas.bbox("all"))
 
     def update_library_list(self):
         logging.info("Обновление списка библиотек (последнее сканирование).")
+        self.show_library_frame()
         # Очищаем фрейм
         for widget in self.library_frame.winfo_children():
             widget.destroy()
@@ -362,14 +784,19 @@ class TelegramParserApp:
 
             #prompt_id = int(self.prompt_listbox.get(selected[0]).split("(ID: ")[1].rstrip(")"))
             prompt = self.db.get_prompts()[selected[0]]
-            # Преобразуем текст и генерируем изображение
-            transformed_text, image_path = transform_library_description(message_text, prompt[2], prompt[3], prompt[4])
-            if transformed_text and image_path:
-                # Отображаем преобразованный текст и изображение
-                self.show_transformed_library(transformed_text, image_path, message_text)
-                prompt_window.destroy()
-            else:
-                messagebox.showerror("Ошибка", "Не удалось преобразовать текст или сгенерировать изображение.")
+
+            def on_done(result):
+                transformed_text, image_path = result
+                if transformed_text and image_path:
+                    # Отображаем преобразованный текст и изображение
+                    self.show_transformed_library(transformed_text, image_path, message_text)
+                else:
+                    messagebox.showerror("Ошибка", "Не удалось преобразовать текст или сгенерировать изображение.")
+
+            # Преобразуем текст и генерируем изображение в фоне (этапы выполняются одновременно)
+            self.worker.submit(transform_library_description_async(message_text, prompt[2], prompt[3], prompt[4]),
+                               on_done, self.show_job_error, "Преобразование текста")
+            prompt_window.destroy()
 
         tk.Button(prompt_window, text="Преобразовать", command=on_transform).grid(row=2, column=0, columnspan=2,
                                                                                   pady=10)
@@ -394,15 +821,9 @@ class TelegramParserApp:
         image_frame = tk.Frame(transformed_window)
         image_frame.pack(pady=10)
 
-        try:
-            image = Image.open(image_path)
-            photo = ImageTk.PhotoImage(image)
-            image_label = tk.Label(image_frame, image=photo)
-            image_label.image = photo  # Сохраняем ссылку на изображение
-            image_label.pack()
-        except Exception as e:
-            logging.error(f"Ошибка при загрузке изображения: {e}")
-            messagebox.showerror("Ошибка", f"Не удалось загрузить изображение: {e}")
+        image_label = tk.Label(image_frame)
+        image_label.pack()
+        self.show_image(image_label, image_path)
 
         # Кнопки
         button_frame = tk.Frame(transformed_window)
@@ -428,100 +849,178 @@ class TelegramParserApp:
                                        ))
         retry_image_button.pack(side=tk.LEFT, padx=5)
 
+    def show_image(self, image_label, image_path, size=(300, 300)):
+        """
+        Показывает изображение в метке; файл читается и уменьшается в фоне через кэш миниатюр.
+        """
+        def on_loaded(photo):
+            if not image_label.winfo_exists():
+                return
+            if photo is None:
+                messagebox.showerror("Ошибка", f"Не удалось загрузить изображение: {image_path}")
+                return
+            image_label.config(image=photo)
+            image_label.image = photo  # Сохраняем ссылку на изображение
+
+        self.thumbnails.request(image_path, on_loaded, size)
+
     def show_transformed_libraries_all(self):
         """
         Отображает все преобразованные сообщения.
+        Записи подгружаются из базы страницами по мере прокрутки.
         """
         logging.info("Загрузка преобразованных библиотек.")
-        # Очищаем фрейм
-        for widget in self.library_frame.winfo_children():
-            widget.destroy()
-
-        # Получаем преобразованные сообщения из базы данных
-        libraries = self.db.get_transformed_libraries()
-        logging.info(f"Получено {len(libraries)} преобразованных библиотек.")
-
-        # Отображаем каждое преобразованное сообщение
-        for library in libraries:
-            library_name, transformed_text, image_path = library
-            self.add_transformed_library_to_frame(library_name, transformed_text, image_path)
-
-        # Обновляем область прокрутки
-        self.canvas.configure(scrollregion=self.canvas.bbox("all"))
+        self.show_virtual_list(
+            lambda cursor: self.db.get_transformed_libraries_page(cursor=cursor),
+            self.create_transformed_row, self.update_transformed_row
+        )
 
-    def add_transformed_library_to_frame(self, library_name, transformed_text, image_path):
+    def create_transformed_row(self, parent):
         """
-        Добавляет преобразованное сообщение в интерфейс.
+        Создает переиспользуемую строку преобразованного сообщения.
         """
-        # Фрейм для одной библиотеки
-        frame = tk.Frame(self.library_frame, bd=2, relief=tk.GROOVE)
-        frame.pack(fill=tk.X, pady=5, padx=5)
-
-        # Метка с текстом сообщения (без обрезки)
-        label = tk.Label(frame, text=f"{transformed_text} (библиотека: {library_name})", wraplength=700,
-                         justify=tk.LEFT)
-        label.pack(side=tk.LEFT, padx=5, pady=5)
-
-        # Кнопка "Выгрузить в Telegram"
-        upload_button = tk.Button(frame, text="Выгрузить в Telegram",
-                                  command=lambda text=transformed_text, img=image_path: self.upload_to_telegram(text,
-                                                                                                                img))
-        upload_button.pack(side=tk.RIGHT, padx=5)
+        frame = tk.Frame(parent, bd=2, relief=tk.GROOVE)
+        frame.label = tk.Label(frame, wraplength=700, justify=tk.LEFT, anchor="nw")
+        frame.label.pack(side=tk.LEFT, fill=tk.BOTH, expand=True, padx=5, pady=5)
+        frame.upload_button = tk.Button(frame, text="Выгрузить в Telegram")
+        frame.upload_button.pack(side=tk.RIGHT, padx=5)
+        frame.image_label = tk.Label(frame)
+        frame.image_label.pack(side=tk.LEFT, padx=5, before=frame.label)
+        frame.image_path = None
+        return frame
+
+    def update_transformed_row(self, frame, record):
+        library_id, library_name, transformed_text, image_path = record
+        frame.label.config(text=f"{preview_text(transformed_text)} (библиотека: {library_name})")
+        frame.image_path = image_path
+        frame.image_label.config(image="")
+        frame.image_label.image = None
+        if image_path:
+            def on_loaded(photo, path=image_path):
+                # Строка могла за это время получить другую запись
+                if photo is not None and frame.image_path == path:
+                    frame.image_label.config(image=photo)
+                    frame.image_label.image = photo
+
+            self.thumbnails.request(image_path, on_loaded)
+        frame.upload_button.config(
+            command=lambda text=transformed_text, img=image_path, library=library_id:
+            self.upload_to_telegram(text, img, library)
+        )
 
-        # Разделительная линия
-        separator = ttk.Separator(self.library_frame, orient=tk.HORIZONTAL)
-        separator.pack(fill=tk.X, pady=5)
+    def collect_image_garbage(self):
+        """
+        Удаляет сгенерированные изображения, не сохраненные ни в одном преобразованном сообщении.
+        """
+        self.worker.submit_blocking(
+            lambda: get_image_store().collect_garbage(),
+            on_done=lambda count: messagebox.showinfo("Изображения", f"Удалено неиспользуемых изображений: {count}."),
+            on_error=self.show_job_error, description="Удаление неиспользуемых изображений"
+        )
 
-    def upload_to_telegram(self, text, image_path):
+    def upload_to_telegram(self, text, image_path, library_id=None):
         """
-        Выгружает преобразованное сообщение в Telegram.
+        Ставит преобразованное сообщение в очередь выгрузки в Telegram.
         """
         # Окно для ввода названия канала
         channel_name = simpledialog.askstring("Выгрузить в Telegram", "Введите название канала:")
         if channel_name:
-            async def run_upload():
-                try:
-                    await self.telegram_client.upload_message(channel_name, text, image_path)
-                    messagebox.showinfo("Успех", "Сообщение успешно выгружено в Telegram.")
-                except Exception as e:
-                    logging.error(f"Ошибка при выгрузке в Telegram: {e}")
-                    messagebox.showerror("Ошибка", f"Не удалось выгрузить сообщение: {e}")
+            self.db.enqueue_upload_job(channel_name, [text], [image_path], [library_id] if library_id else None)
+            self.start_upload_queue()
+
+    def show_album_upload_input(self):
+        """
+        Выгружает несколько преобразованных сообщений альбомами (по 10 изображений).
+        """
+        channel_name = simpledialog.askstring("Выгрузить альбомом", "Введите название канала:")
+        if not channel_name:
+            return
+        ids = simpledialog.askstring("Выгрузить альбомом", "ID преобразованных сообщений через запятую:")
+        if not ids:
+            return
+        try:
+            libraries = [self.db.get_transformed_library(int(library_id)) for library_id in ids.split(',')]
+        except ValueError:
+            messagebox.showwarning("Ошибка", "ID должны быть числами.")
+            return
+        if None in libraries:
+            messagebox.showwarning("Ошибка", "Некоторые преобразованные сообщения не найдены.")
+            return
+
+        enqueue_libraries(self.db, channel_name, libraries, album=True)
+        self.start_upload_queue()
+
+    def start_upload_queue(self):
+        """
+        Запускает выгрузку из очереди в фоне, если она еще не запущена.
+        """
+        if self.upload_queue_job is not None:
+            return
+        failed_before = self.db.get_upload_job_counts()['failed']
+
+        def on_progress(counts):
+            # Вызывается в фоновом потоке
+            self.worker.report_progress(self.upload_queue_job, f"Выгрузка: отправлено {counts['sent']}, "
+                                                               f"в очереди {counts['pending']}, "
+                                                               f"ошибок {counts['failed']}")
+
+        def on_done(counts):
+            self.upload_queue_job = None
+            if counts['failed'] > failed_before:
+                messagebox.showerror("Выгрузка", f"Не удалось выгрузить сообщений: {counts['failed'] - failed_before}, "
+                                                 f"подробности в журнале.")
+            else:
+                messagebox.showinfo("Успех", "Сообщения успешно выгружены в Telegram.")
 
-            asyncio.run(run_upload())
+        def on_error(error):
+            self.upload_queue_job = None
+            messagebox.showerror("Ошибка", f"Не удалось выгрузить сообщение: {error}")
+
+        self.upload_queue_job = self.worker.new_job("Выгрузка в Telegram")
+        self.worker.submit(self.upload_queue.run(progress_callback=on_progress), on_done, on_error,
+                           job_id=self.upload_queue_job)
 
     def save_transformed_library(self, transformed_text, image_path, original_text):
         """
         Сохраняет преобразованный текст и изображение.
         """
-        try:
-            # Извлекаем название сообщения
-            library_name = extract_library_name(transformed_text)
+        def on_done(library_name):
             if not library_name:
                 logging.error("Не удалось извлечь название сообщения.")
                 return
+            try:
+                # Сохраняем в базу данных
+                self.db.save_transformed_library(library_name, original_text, transformed_text, image_path)
+                logging.info(f"Преобразованный текст и изображение сохранены для сообщения: {library_name}")
+                messagebox.showinfo("Сохранено", "Преобразованный текст и изображение сохранены.")
+            except Exception as e:
+                logging.error(f"Ошибка при сохранении: {e}")
+                messagebox.showerror("Ошибка", f"Не удалось сохранить: {e}")
 
-            # Сохраняем в базу данных
-            self.db.save_transformed_library(library_name, original_text, transformed_text, image_path)
-            logging.info(f"Преобразованный текст и изображение сохранены для сообщения: {library_name}")
-            messagebox.showinfo("Сохранено", "Преобразованный текст и изображение сохранены.")
-        except Exception as e:
-            logging.error(f"Ошибка при сохранении: {e}")
-            messagebox.showerror("Ошибка", f"Не удалось сохранить: {e}")
+        def on_error(error):
+            messagebox.showerror("Ошибка", f"Не удалось сохранить: {error}")
+
+        # Извлекаем название сообщения в фоне
+        self.worker.submit_blocking(extract_library_name, transformed_text, on_done=on_done, on_error=on_error,
+                                    description="Извлечение названия")
 
     def retry_transform_text(self, text_edit, original_text):
         """
         Повторно преобразует текст.
         """
-        try:
-            transformed_text = transform_library_description(original_text)
+        def on_done(transformed_text):
             if transformed_text:
                 text_edit.delete("1.0", tk.END)
                 text_edit.insert(tk.END, transformed_text)
             else:
                 messagebox.showerror("Ошибка", "Не удалось преобразовать текст.")
-        except Exception as e:
-            logging.error(f"Ошибка при повторном преобразовании текста: {e}")
-            messagebox.showerror("Ошибка", f"Не удалось преобразовать текст: {e}")
+
+        def on_error(error):
+            messagebox.showerror("Ошибка", f"Не удалось преобразовать текст: {error}")
+
+        # Изображение при этом не перегенерируется — только текст, в обход кэша ответов
+        self.worker.submit_blocking(rewrite_text, original_text, use_cache=False, on_done=on_done,
+                                    on_error=on_error, description="Повторное преобразование текста")
 
     def manage_prompts(self):
         """
@@ -657,24 +1156,26 @@ class TelegramParserApp:
         """
         Повторно генерирует изображение.
         """
-        try:
+        def generate():
+            # Выполняется в фоновом потоке
             library_name = extract_library_name(transformed_text)
             if not library_name:
-                messagebox.showerror("Ошибка", "Не удалось извлечь название сообщения.")
-                return
+                raise ValueError("Не удалось извлечь название сообщения.")
+            # Повторная генерация не берет готовое изображение из хранилища
+            return generate_image(library_name, use_cache=False)
 
-            image_path = generate_image(library_name)
+        def on_done(image_path):
             if image_path:
                 # Обновляем изображение
-                image = Image.open(image_path)
-                photo = ImageTk.PhotoImage(image)
-                image_label.config(image=photo)
-                image_label.image = photo  # Сохраняем ссылку на изображение
+                self.show_image(image_label, image_path)
             else:
                 messagebox.showerror("Ошибка", "Не удалось сгенерировать изображение.")
-        except Exception as e:
-            logging.error(f"Ошибка при повторной генерации изображения: {e}")
-            messagebox.showerror("Ошибка", f"Не удалось сгенерировать изображение: {e}")
+
+        def on_error(error):
+            messagebox.showerror("Ошибка", f"Не удалось сгенерировать изображение: {error}")
+
+        self.worker.submit_blocking(generate, on_done=on_done, on_error=on_error,
+                                    description="Генерация изображения")
 
     def __del__(self):
         self.db.close()
@@ -685,19 +1186,22 @@ class TelegramParserApp:
         Асинхронный метод для завершения работы приложения.
         """
         try:
-            await self.telegram_client.disconnect()
+            await self.telegram_client.shutdown()
             logging.info("Telegram клиент отключен.")
         except Exception as e:
             logging.error(f"Ошибка при отключении Telegram клиента: {e}")
-        finally:
-            await self.telegram_client.disconnect()
-            logging.info("Telegram клиент отключен.")
+        # Соединения фоновой базы закрываются в том же цикле событий
+        await self.worker_db.close()
 
     def on_close(self):
         """
         Обрабатывает событие закрытия окна.
         """
-        # Запускаем асинхронное завершение работы
-        self.loop.run_until_complete(self.shutdown())
+        # Отключаем клиент в фоновом цикле и останавливаем его
+        try:
+            self.worker.run_sync(self.shutdown(), timeout=10)
+        except Exception as e:
+            logging.error(f"Ошибка при завершении работы: {e}")
+        self.worker.stop()
         self.root.destroy()
 
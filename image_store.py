@@ -0,0 +1,121 @@
+import hashlib
+import logging
+import os
+import tempfile
+import threading
+import time
+
+from database import Database
+
+IMAGES_DIR = 'generated_images'
+
+
+def request_key(model, prompt):
+    """
+    Ключ запроса на генерацию: SHA-256 от модели и полного промта.
+    """
+    return hashlib.sha256(f"{model}\0{prompt}".encode("utf-8")).hexdigest()
+
+
+class ImageStore:
+    """
+    Хранилище сгенерированных изображений с адресацией по содержимому.
+
+    Файл называется по SHA-256 своего содержимого, поэтому одинаковые изображения
+    хранятся один раз, а существующий файл никогда не перезаписывается. В таблице
+    generated_images базы данных запоминается, какой файл получен на какой запрос
+    (модель и промт), и повторный такой же запрос возвращает готовое изображение.
+
+    Таблица входит в схему Database, а запись идет через Database в режиме WAL, поэтому
+    хранилище не мешает парсеру и очередям писать в тот же файл базы. Хранилище
+    используется из потоков пула, поэтому соединение защищено блокировкой.
+    """
+
+    def __init__(self, db_name='telegram_parser.db', directory=IMAGES_DIR):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self.lock = threading.Lock()
+        self.db = Database(db_name, wal=True, check_same_thread=False)
+
+    def get(self, model, prompt):
+        """
+        Возвращает путь к изображению, уже сгенерированному на такой же запрос, или None.
+        """
+        key = request_key(model, prompt)
+        with self.lock:
+            file_path = self.db.get_generated_image(key)
+            if file_path is None:
+                return None
+            if os.path.exists(file_path):
+                return file_path
+            # Файл удален вручную — забываем запрос
+            self.db.delete_generated_image(key)
+        return None
+
+    def put(self, model, prompt, data, extension='png'):
+        """
+        Сохраняет содержимое изображения и связывает его с запросом. Возвращает путь к файлу.
+        """
+        file_path = os.path.join(self.directory, f"{hashlib.sha256(data).hexdigest()}.{extension}")
+        self._write_once(file_path, data)
+
+        with self.lock:
+            self.db.save_generated_image(request_key(model, prompt), model, prompt, file_path)
+        logging.info(f"Изображение сохранено: {file_path}")
+        return file_path
+
+    def _write_once(self, file_path, data):
+        """
+        Записывает файл во временный и атомарно создает итоговое имя жесткой ссылкой.
+        Если файл с таким именем уже есть, его содержимое совпадает, и он не трогается.
+        """
+        if os.path.exists(file_path):
+            return
+        descriptor, temp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(descriptor, 'wb') as f:
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+            try:
+                os.link(temp_path, file_path)
+            except FileExistsError:
+                pass
+        finally:
+            os.remove(temp_path)
+
+    def collect_garbage(self, min_age=24 * 3600):
+        """
+        Удаляет изображения, на которые не ссылается ни одно преобразованное сообщение
+        и ни одна неотправленная задача выгрузки, и записи о файлах, которых больше нет.
+        Файлы моложе min_age секунд не удаляются, чтобы не тронуть только что
+        сгенерированные, но еще не сохраненные изображения. Возвращает число удаленных файлов.
+        """
+        now = time.time()
+        with self.lock:
+            referenced = {os.path.normpath(path) for path in self.db.get_referenced_image_paths()}
+
+            removed = []
+            for name in os.listdir(self.directory):
+                file_path = os.path.join(self.directory, name)
+                if not os.path.isfile(file_path) or os.path.normpath(file_path) in referenced:
+                    continue
+                if now - os.path.getmtime(file_path) < min_age:
+                    continue
+                try:
+                    os.remove(file_path)
+                    removed.append(file_path)
+                except OSError as e:
+                    logging.error(f"Не удалось удалить изображение {file_path}: {e}")
+
+            self.db.delete_generated_image_files(removed)
+            # Записи о файлах, удаленных вне хранилища
+            self.db.delete_generated_image_files(
+                [file_path for file_path in self.db.get_generated_image_files() if not os.path.exists(file_path)])
+
+        logging.info(f"Удалено неиспользуемых изображений: {len(removed)}.")
+        return len(removed)
+
+    def close(self):
+        with self.lock:
+            self.db.close()
@@ -0,0 +1,108 @@
+import re
+from functools import lru_cache
+
+# С этого числа слов одно регулярное выражение быстрее, чем поиск каждой подстроки по отдельности
+REGEX_MIN_WORDS = 100
+
+
+def trie_pattern(words):
+    """
+    Строит регулярное выражение-альтернативу, сгруппированную по общим префиксам слов
+    (например, "py(?:pi|thon)"), чтобы в каждой позиции текста не перебирались все слова подряд.
+    Слово, продолжающее другое слово, отбрасывается: для поиска подстроки достаточно более короткого.
+    """
+    trie = {}
+    for word in words:
+        node = trie
+        for char in word:
+            node = node.setdefault(char, {})
+        node[''] = None
+
+    def build(node):
+        prefix = ''
+        # Цепочки без ветвлений сворачиваются в обычную строку
+        while '' not in node and len(node) == 1:
+            (char, node), = node.items()
+            prefix += re.escape(char)
+        if '' in node:
+            return prefix
+        branches = [re.escape(char) + build(child) for char, child in sorted(node.items())]
+        return prefix + '(?:' + '|'.join(branches) + ')'
+
+    return build(trie)
+
+
+def compile_words(words):
+    """
+    Возвращает функцию, которая проверяет, содержит ли текст в нижнем регистре хотя бы одно из слов.
+    Короткие списки проверяются поиском подстрок, длинные — одним скомпилированным выражением.
+    """
+    words = tuple(sorted(set(words)))
+    if len(words) < REGEX_MIN_WORDS:
+        return lambda text: any(word in text for word in words)
+    pattern = re.compile(trie_pattern(words))
+    return lambda text: pattern.search(text) is not None
+
+
+class KeywordMatcher:
+    """
+    Проверяет текст на ключевые и исключаемые слова.
+
+    Ключевые и исключаемые слова компилируются один раз (см. compile_words), а текст
+    приводится к нижнему регистру один раз на проверку, а не на каждое слово.
+    Поведение совпадает с прежней проверкой по подстрокам:
+    - Если ключевые слова заданы, текст должен содержать хотя бы одно из них.
+    - Если исключаемые слова заданы, текст не должен содержать ни одного из них.
+    - Пустое слово (например, от лишней запятой) совпадает с любым текстом.
+    """
+
+    def __init__(self, keywords=None, exclude_words=None):
+        self.include = None  # None — текст не обязан содержать ключевые слова
+        self.exclude = None
+        self.exclude_all = False
+
+        if keywords:
+            patterns = [keyword.strip().lower() for keyword in keywords]
+            if all(patterns):
+                self.include = compile_words(patterns)
+
+        if exclude_words and list(exclude_words) != ['']:
+            patterns = [exclude_word.strip().lower() for exclude_word in exclude_words]
+            if all(patterns):
+                self.exclude = compile_words(patterns)
+            else:
+                self.exclude_all = True
+
+    def matches(self, text):
+        """
+        Возвращает True, если текст удовлетворяет условиям по ключевым и исключаемым словам.
+        """
+        if self.exclude_all:
+            return False
+        if self.include is None and self.exclude is None:
+            return True
+
+        text = text.lower()
+        if self.include is not None and not self.include(text):
+            return False
+        return self.exclude is None or not self.exclude(text)
+
+
+@lru_cache(maxsize=128)
+def _compile_cached(keywords, exclude_words):
+    return KeywordMatcher(keywords, exclude_words)
+
+
+def compile_matcher(keywords=None, exclude_words=None):
+    """
+    Возвращает скомпилированный KeywordMatcher, переиспользуя уже скомпилированные списки слов.
+    """
+    def freeze(words):
+        if words is None or isinstance(words, str):
+            return words
+        return tuple(words)
+
+    frozen_exclude = freeze(exclude_words)
+    if frozen_exclude == ('',):
+        frozen_exclude = None
+    return _compile_cached(freeze(keywords), frozen_exclude)
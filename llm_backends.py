@@ -0,0 +1,115 @@
+import os
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+
+
+class G4FBackend:
+    """
+    Бэкенд по умолчанию: бесплатные провайдеры g4f.
+    Пакет g4f импортируется только при создании бэкенда, поэтому для бэкенда http он не нужен.
+    """
+
+    name = "g4f"
+
+    def __init__(self):
+        import g4f
+        from g4f.client import Client
+
+        self._g4f = g4f
+        self._client_class = Client
+        self._image_client = None
+        self._lock = threading.Lock()
+
+    def get_image_client(self):
+        """
+        Возвращает общий клиент g4f для генерации изображений (создается при первом вызове).
+        """
+        with self._lock:
+            if self._image_client is None:
+                self._image_client = self._client_class()
+            return self._image_client
+
+    def complete(self, model, content):
+        """
+        Отправляет нейросети сообщение и возвращает текст ответа.
+        """
+        return self._g4f.ChatCompletion.create(
+            model=model,
+            messages=[{"role": "user", "content": content}],
+        )
+
+    def image_url(self, model, prompt):
+        """
+        Запрашивает генерацию изображения и возвращает ссылку на него.
+        """
+        response = self.get_image_client().images.generate(
+            model=model,
+            prompt=prompt,
+            response_format="url"
+        )
+        return response.data[0].url
+
+
+class HTTPBackend:
+    """
+    Бэкенд для OpenAI-совместимого HTTP API: /v1/chat/completions и /v1/images/generations.
+    Подходит для локального сервера-заглушки из benchmarks/mock_llm_server.py и для
+    собственных серверов моделей. Соединения переиспользуются через общую сессию.
+    """
+
+    name = "http"
+
+    def __init__(self, base_url, api_key=None, timeout=(10, 120), pool_size=32):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=2, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        if api_key:
+            self.session.headers["Authorization"] = f"Bearer {api_key}"
+
+    def _post(self, path, payload):
+        response = self.session.post(self.base_url + path, json=payload, timeout=self.timeout)
+        if response.status_code != 200:
+            raise ValueError(f"Сервер {self.base_url} вернул ошибку {response.status_code}: {response.text[:200]}")
+        return response.json()
+
+    def complete(self, model, content):
+        data = self._post("/v1/chat/completions", {
+            "model": model,
+            "messages": [{"role": "user", "content": content}],
+        })
+        return data["choices"][0]["message"]["content"]
+
+    def image_url(self, model, prompt):
+        data = self._post("/v1/images/generations", {
+            "model": model,
+            "prompt": prompt,
+            "response_format": "url",
+        })
+        return data["data"][0]["url"]
+
+
+BACKENDS = {
+    G4FBackend.name: G4FBackend,
+    HTTPBackend.name: HTTPBackend,
+}
+
+
+def create_backend(name=None, url=None):
+    """
+    Создает бэкенд по имени ("g4f" или "http"). По умолчанию имя и адрес берутся
+    из переменных окружения LLM_BACKEND и LLM_BACKEND_URL (и LLM_BACKEND_API_KEY для http).
+    """
+    name = name or os.getenv("LLM_BACKEND", G4FBackend.name)
+    if name not in BACKENDS:
+        raise ValueError(f"Неизвестный бэкенд нейросети: {name}. Доступны: {', '.join(BACKENDS)}")
+    if name == HTTPBackend.name:
+        url = url or os.getenv("LLM_BACKEND_URL")
+        if not url:
+            raise ValueError("Для бэкенда http укажите адрес в LLM_BACKEND_URL.")
+        return HTTPBackend(url, os.getenv("LLM_BACKEND_API_KEY"))
+    return BACKENDS[name]()
@@ -0,0 +1,114 @@
+import hashlib
+import logging
+import sqlite3
+import threading
+import time
+
+# Время жизни ответа в кэше (в секундах) и наибольшее число хранимых ответов
+DEFAULT_TTL = 7 * 24 * 3600
+DEFAULT_MAX_ENTRIES = 5000
+
+
+def cache_key(model, prompt, text):
+    """
+    Ключ кэша: SHA-256 от модели, промта и входного текста.
+    """
+    digest = hashlib.sha256()
+    for part in (model, prompt, text):
+        digest.update((part or "").encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+class LLMCache:
+    """
+    Постоянный кэш ответов нейросети в отдельной базе SQLite.
+
+    Ответ хранится ttl секунд с момента получения. Когда записей становится больше
+    max_entries, удаляются давно не запрашивавшиеся (LRU). Кэш используется из потоков
+    пула, поэтому соединение общее и защищено блокировкой.
+    """
+
+    def __init__(self, db_name='llm_cache.db', ttl=DEFAULT_TTL, max_entries=DEFAULT_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(db_name, check_same_thread=False)
+        self.cursor = self.conn.cursor()
+        try:
+            self.cursor.execute('PRAGMA journal_mode=WAL')
+            self.cursor.execute('''
+                CREATE TABLE IF NOT EXISTS llm_cache (
+                    key TEXT PRIMARY KEY,
+                    model TEXT,
+                    response TEXT,
+                    created_at REAL,
+                    accessed_at REAL
+                )
+            ''')
+            self.cursor.execute('''
+                CREATE INDEX IF NOT EXISTS idx_llm_cache_accessed ON llm_cache (accessed_at)
+            ''')
+            self.conn.commit()
+        except Exception as e:
+            logging.error(f"Ошибка при создании кэша ответов нейросети: {e}")
+
+    def get(self, model, prompt, text):
+        """
+        Возвращает сохраненный ответ или None, если его нет или срок хранения истек.
+        """
+        key = cache_key(model, prompt, text)
+        now = time.time()
+        try:
+            with self.lock, self.conn:
+                self.cursor.execute('''
+                    SELECT response FROM llm_cache WHERE key = ? AND created_at > ?
+                ''', (key, now - self.ttl))
+                row = self.cursor.fetchone()
+                if row is None:
+                    return None
+                self.cursor.execute('''
+                    UPDATE llm_cache SET accessed_at = ? WHERE key = ?
+                ''', (now, key))
+            return row[0]
+        except Exception as e:
+            logging.error(f"Ошибка при чтении кэша ответов нейросети: {e}")
+            return None
+
+    def set(self, model, prompt, text, response):
+        """
+        Сохраняет ответ и при переполнении удаляет устаревшие и давно не использовавшиеся записи.
+        """
+        key = cache_key(model, prompt, text)
+        now = time.time()
+        try:
+            with self.lock, self.conn:
+                self.cursor.execute('''
+                    INSERT INTO llm_cache (key, model, response, created_at, accessed_at)
+                    VALUES (?, ?, ?, ?, ?)
+                    ON CONFLICT (key) DO UPDATE SET
+                        response = excluded.response,
+                        created_at = excluded.created_at,
+                        accessed_at = excluded.accessed_at
+                ''', (key, model, response, now, now))
+                self._evict(now)
+        except Exception as e:
+            logging.error(f"Ошибка при записи в кэш ответов нейросети: {e}")
+
+    def _evict(self, now):
+        self.cursor.execute('''
+            DELETE FROM llm_cache WHERE created_at <= ?
+        ''', (now - self.ttl,))
+        self.cursor.execute('''
+            DELETE FROM llm_cache WHERE key IN (
+                SELECT key FROM llm_cache ORDER BY accessed_at DESC LIMIT -1 OFFSET ?
+            )
+        ''', (self.max_entries,))
+
+    def clear(self):
+        with self.lock, self.conn:
+            self.cursor.execute('DELETE FROM llm_cache')
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
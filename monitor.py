@@ -0,0 +1,139 @@
+import asyncio
+import logging
+
+from telethon import events
+from telethon.utils import get_peer_id
+
+from async_database import resolve
+from keyword_matcher import compile_matcher
+from scan_engine import ScanEngine
+
+
+class ChannelMonitor:
+    """
+    Отслеживает новые и отредактированные сообщения каналов в реальном времени.
+
+    Обработчики events.NewMessage и events.MessageEdited регистрируются на одном постоянном
+    клиенте, поэтому новые посты приходят от Telegram сами, без опроса истории. Каждое
+    сообщение проверяется is_message_valid по ключевым словам своего канала; подходящие
+    сразу сохраняются в базу (upsert по ID сообщения, так что правка обновляет текст) и
+    при enqueue_transform ставятся в очередь преобразования.
+
+    Обновления Telegram присылает только по каналам, на которые подписан аккаунт.
+    При запуске каналы досканируются в режиме "continue", чтобы не потерять
+    сообщения, вышедшие, пока мониторинг не работал.
+    """
+
+    def __init__(self, telegram_client, db, configs, enqueue_transform=False, prompt=None, catch_up=True,
+                 on_message=None, health_check_interval=60):
+        self.telegram_client = telegram_client
+        self.db = db
+        self.configs = configs
+        self.enqueue_transform = enqueue_transform
+        self.prompt = prompt
+        self.catch_up = catch_up
+        self.on_message = on_message  # on_message(канал, сообщение, сохранено) — для отображения прогресса
+        self.health_check_interval = health_check_interval
+        self.found = 0
+
+        self._channels = {}  # ID чата Telegram -> (настройки канала, проверка ключевых слов)
+        self._client = None  # Клиент Telethon, на котором зарегистрированы обработчики
+        self._stopping = None
+        self._caught_up = False
+
+    async def run(self):
+        """
+        Запускает мониторинг и работает до вызова stop().
+        """
+        self._stopping = asyncio.Event()
+        # Обработчики живут, пока открыто соединение, поэтому соединение занято на все время мониторинга
+        await self.telegram_client.acquire()
+        try:
+            for config in self.configs:
+                channel = await self.telegram_client.get_channel(config.channel_name)
+                self._channels[get_peer_id(channel)] = (config, compile_matcher(config.keywords, config.exclude_words))
+            self._register()
+            logging.info(f"Мониторинг запущен: {len(self.configs)} каналов.")
+
+            if self.catch_up:
+                # Обработчики уже зарегистрированы, поэтому разрыва между досканированием и событиями нет
+                for config in self.configs:
+                    config.scan_mode = "continue"
+                await ScanEngine(self.telegram_client, self.db).run(self.configs)
+            self._caught_up = True
+
+            while not self._stopping.is_set():
+                try:
+                    await asyncio.wait_for(self._stopping.wait(), self.health_check_interval)
+                except asyncio.TimeoutError:
+                    # После переподключения клиент Telethon создается заново — переносим обработчики
+                    await self.telegram_client.connect()
+                    if self.telegram_client.client is not self._client:
+                        logging.warning("Клиент Telegram переподключен, обработчики мониторинга зарегистрированы заново.")
+                        self._register()
+        finally:
+            self._unregister()
+            await self.telegram_client.release()
+            logging.info(f"Мониторинг остановлен, найдено сообщений: {self.found}.")
+
+    def stop(self):
+        """
+        Останавливает мониторинг. Вызывается из потока цикла событий клиента.
+        """
+        if self._stopping is not None:
+            self._stopping.set()
+
+    def _register(self):
+        self._unregister()
+        self._client = self.telegram_client.client
+        chats = list(self._channels)
+        self._client.add_event_handler(self._on_new_message, events.NewMessage(chats=chats))
+        self._client.add_event_handler(self._on_edited_message, events.MessageEdited(chats=chats))
+
+    def _unregister(self):
+        if self._client is not None:
+            self._client.remove_event_handler(self._on_new_message)
+            self._client.remove_event_handler(self._on_edited_message)
+            self._client = None
+
+    async def _on_new_message(self, event):
+        await self._handle(event.message, edited=False)
+
+    async def _on_edited_message(self, event):
+        await self._handle(event.message, edited=True)
+
+    async def _handle(self, message, edited):
+        channel = self._channels.get(message.chat_id)
+        if channel is None:
+            return
+        config, matcher = channel
+
+        try:
+            valid = bool(message.text) and self.telegram_client.is_message_valid(
+                message.text, config.keywords, config.exclude_words, matcher)
+
+            # Контрольная точка сдвигается только новыми сообщениями и только после досканирования,
+            # иначе следующее сканирование "continue" пропустило бы недосканированную часть
+            advance = not edited and self._caught_up
+            if valid:
+                rows = [(message.text, message.date, message.chat_id, message.id)]
+                await resolve(self.db.save_messages(config.channel_name, rows, message.date if advance else None,
+                                                    message.id if advance else None))
+                if not edited:
+                    self.found += 1
+                if self.enqueue_transform and not edited:
+                    row_id = await resolve(self.db.find_message_row_id(message.chat_id, message.id))
+                    await resolve(self.db.enqueue_transform_jobs([row_id], self.prompt))
+                logging.info(f"[{config.channel_name}] {'Изменено' if edited else 'Новое'} сообщение {message.id} "
+                             f"сохранено.")
+            elif advance:
+                await resolve(self.db.update_last_scan_date(config.channel_name, message.date, message.id))
+        except Exception as e:
+            logging.error(f"[{config.channel_name}] Ошибка при обработке сообщения {message.id}: {e}")
+            return
+
+        if self.on_message:
+            try:
+                self.on_message(config.channel_name, message, valid)
+            except Exception as e:
+                logging.error(f"Ошибка в обработчике мониторинга: {e}")
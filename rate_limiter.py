@@ -0,0 +1,132 @@
+import os
+import time
+import asyncio
+import logging
+from telethon.errors import FloodWaitError
+
+# Бюджет запросов к Telegram API по умолчанию: 1 запрос в секунду и до 3 подряд
+DEFAULT_REQUESTS_PER_SECOND = 1.0
+DEFAULT_BURST = 3
+
+
+class RateLimiter:
+    """
+    Ограничитель частоты запросов к Telegram API.
+
+    Работает как "ведро токенов": каждый запрос к API забирает один токен,
+    токены восполняются со скоростью rate запросов в секунду, но не больше burst.
+    При FloodWaitError все запросы ждут указанное Telegram время, а скорость
+    снижается вдвое и затем плавно восстанавливается после успешных запросов.
+    """
+
+    def __init__(self, requests_per_second=DEFAULT_REQUESTS_PER_SECOND, burst=DEFAULT_BURST, min_rate=0.05, recovery_factor=1.05, max_retries=5):
+        if requests_per_second <= 0:
+            raise ValueError("requests_per_second должен быть больше нуля")
+        if burst < 1:
+            raise ValueError("burst должен быть не меньше 1")
+        self.max_rate = requests_per_second
+        self.rate = requests_per_second
+        self.burst = burst
+        self.min_rate = min(min_rate, requests_per_second)
+        self.recovery_factor = recovery_factor
+        self.max_retries = max_retries
+
+        self.tokens = float(burst)
+        self.updated_at = time.monotonic()
+        self.blocked_until = 0.0
+
+        # Статистика для настройки бюджета
+        self.total_requests = 0
+        self.total_wait = 0.0
+        self.flood_waits = 0
+        self.flood_wait_seconds = 0
+
+    def _refill(self, now):
+        elapsed = max(0.0, now - self.updated_at)
+        self.tokens = min(self.burst, self.tokens + elapsed * self.rate)
+        self.updated_at = now
+
+    async def acquire(self):
+        """
+        Ожидает разрешения на один запрос к API.
+        Место в очереди резервируется сразу, поэтому конкурентные вызовы не обгоняют друг друга.
+        """
+        now = time.monotonic()
+        self._refill(now)
+        self.tokens -= 1
+
+        wait = 0.0
+        if self.tokens < 0:
+            wait = -self.tokens / self.rate
+        wait = max(wait, self.blocked_until - now)
+
+        self.total_requests += 1
+        if wait > 0:
+            self.total_wait += wait
+            await asyncio.sleep(wait)
+
+    def on_success(self):
+        """
+        Плавно возвращает скорость к заданной после успешного запроса.
+        """
+        if self.rate < self.max_rate:
+            self.rate = min(self.max_rate, self.rate * self.recovery_factor)
+
+    def on_flood_wait(self, seconds):
+        """
+        Учитывает FloodWaitError: блокирует запросы на время, указанное Telegram, и снижает скорость.
+        """
+        now = time.monotonic()
+        self.blocked_until = max(self.blocked_until, now + seconds)
+        self.tokens = min(self.tokens, 0.0)
+        self.rate = max(self.min_rate, self.rate / 2)
+        self.flood_waits += 1
+        self.flood_wait_seconds += seconds
+        logging.warning(f"FloodWait на {seconds} с, скорость снижена до {self.rate:.2f} запросов/с")
+
+    async def call(self, func, *args, **kwargs):
+        """
+        Выполняет запрос к API с учетом лимита и повторяет его после FloodWaitError.
+        """
+        for attempt in range(self.max_retries + 1):
+            await self.acquire()
+            try:
+                result = await func(*args, **kwargs)
+                self.on_success()
+                return result
+            except FloodWaitError as e:
+                if attempt >= self.max_retries:
+                    raise
+                self.on_flood_wait(e.seconds)
+
+    @property
+    def budget(self):
+        """
+        Текущее состояние лимита и накопленная статистика.
+        """
+        now = time.monotonic()
+        return {
+            "requests_per_second": self.rate,
+            "max_requests_per_second": self.max_rate,
+            "burst": self.burst,
+            "available_tokens": max(0.0, min(self.burst, self.tokens + max(0.0, now - self.updated_at) * self.rate)),
+            "blocked_for": max(0.0, self.blocked_until - now),
+            "total_requests": self.total_requests,
+            "total_wait": self.total_wait,
+            "flood_waits": self.flood_waits,
+            "flood_wait_seconds": self.flood_wait_seconds,
+        }
+
+
+def create_rate_limiter(requests_per_second=None, burst=None):
+    """
+    Создает ограничитель с заданным бюджетом запросов. Не переданные значения берутся
+    из переменных окружения TELEGRAM_REQUESTS_PER_SECOND и TELEGRAM_BURST, а без них —
+    DEFAULT_REQUESTS_PER_SECOND и DEFAULT_BURST.
+    """
+    if requests_per_second is None:
+        requests_per_second = float(os.getenv("TELEGRAM_REQUESTS_PER_SECOND", DEFAULT_REQUESTS_PER_SECOND))
+    if burst is None:
+        burst = int(os.getenv("TELEGRAM_BURST", DEFAULT_BURST))
+    logging.info(f"Бюджет запросов к Telegram: {requests_per_second} в секунду, до {burst} подряд.")
+    return RateLimiter(requests_per_second, burst)
@@ -0,0 +1,239 @@
+import asyncio
+import logging
+from datetime import datetime
+
+from async_database import resolve
+
+
+def parse_words(words):
+    """
+    Преобразует строку слов через запятую в список (списки возвращаются как есть).
+    """
+    if isinstance(words, str):
+        return [word.strip() for word in words.split(',')]
+    return words
+
+
+class ChannelScanConfig:
+    """
+    Параметры сканирования одного канала.
+    scan_mode: "start" — с начала канала, "continue" — с последней даты, "specific_date" — с даты specific_date.
+    """
+
+    def __init__(self, channel_name, keywords=None, exclude_words=None, scan_mode="start", specific_date=None,
+                 limit=None, server_search=False):
+        self.channel_name = channel_name
+        self.keywords = parse_words(keywords)
+        self.exclude_words = parse_words(exclude_words)
+        self.scan_mode = scan_mode
+        self.specific_date = specific_date
+        self.limit = limit
+        # Искать ключевые слова поиском Telegram вместо чтения всей истории канала
+        self.server_search = server_search
+
+    @classmethod
+    def from_line(cls, line):
+        """
+        Разбирает строку вида "канал; ключевые слова; исключения; режим; лимит; поиск".
+        Режим: start, continue или дата в формате ГГГГ-ММ-ДД. Лимит необязателен.
+        Если последнее поле равно "server", ключевые слова ищутся на стороне Telegram.
+        """
+        parts = [part.strip() for part in line.split(';')]
+        if not parts[0]:
+            raise ValueError(f"Не указан канал в строке: {line}")
+        parts += [''] * (6 - len(parts))
+        channel_name, keywords, exclude_words, mode, limit, search = parts[:6]
+
+        specific_date = None
+        if not mode:
+            mode = "start"
+        elif mode not in ("start", "continue"):
+            specific_date = datetime.strptime(mode, "%Y-%m-%d")
+            mode = "specific_date"
+
+        return cls(channel_name, keywords, exclude_words, mode, specific_date, int(limit) if limit else None,
+                   search.lower() == "server")
+
+
+class ChannelScanResult:
+    """
+    Состояние и результат сканирования одного канала.
+    """
+
+    def __init__(self, channel_name):
+        self.channel_name = channel_name
+        self.status = "pending"  # pending, running, done, error
+        self.found = 0  # Сколько сообщений сохранено в базе
+        self.last_message_date = None
+        self.error = None
+
+    def __repr__(self):
+        return f"ChannelScanResult({self.channel_name!r}, status={self.status!r}, found={self.found})"
+
+
+class ScanEngine:
+    """
+    Сканирует несколько каналов одновременно через один клиент Telegram.
+    Число одновременно сканируемых каналов ограничено concurrency.
+
+    Каждый канал обрабатывается потоково: найденные сообщения через ограниченную
+    очередь (queue_size) попадают к записи в базу пачками по batch_size, а
+    контрольная точка канала сдвигается после каждой записанной пачки.
+    Если запись отстает, чтение канала приостанавливается, пока очередь заполнена.
+    db может быть Database или AsyncDatabase; с асинхронной базой запись пачек
+    не останавливает цикл событий, на котором читаются каналы.
+    """
+
+    def __init__(self, telegram_client, db, concurrency=5, batch_size=50, queue_size=200, flush_interval=2.0):
+        self.telegram_client = telegram_client
+        self.db = db
+        self.concurrency = concurrency
+        self.batch_size = batch_size
+        self.queue_size = queue_size
+        self.flush_interval = flush_interval
+
+    async def resolve_start(self, config):
+        """
+        Определяет начало сканирования по режиму: (дата, ID сообщения).
+        В режиме "continue" используется ID последнего обработанного сообщения,
+        а для контрольных точек без ID — дата последнего сообщения.
+        """
+        if config.scan_mode == "continue":
+            last_message_id = await resolve(self.db.get_last_scan_id(config.channel_name))
+            if last_message_id:
+                logging.info(f"[{config.channel_name}] Продолжение сканирования после сообщения {last_message_id}")
+                return None, last_message_id
+            last_message_date = await resolve(self.db.get_last_scan_date(config.channel_name))
+            logging.info(f"[{config.channel_name}] Продолжение сканирования с последней даты: {last_message_date}")
+            return last_message_date, None
+        if config.scan_mode == "specific_date":
+            logging.info(f"[{config.channel_name}] Сканирование с конкретной даты: {config.specific_date}")
+            return config.specific_date, None
+        return None, None
+
+    async def scan_one(self, config, result=None, progress_callback=None):
+        """
+        Сканирует один канал, сохраняет найденные сообщения и обновляет контрольную точку.
+        """
+        result = result or ChannelScanResult(config.channel_name)
+        result.status = "running"
+        self._report(progress_callback, result)
+
+        producer = None
+        try:
+            last_message_date, min_id = await self.resolve_start(config)
+
+            # Перед чтением истории проверяем одним запросом, есть ли в канале что-то новое
+            if min_id:
+                latest_id = await self.telegram_client.get_latest_message_id(config.channel_name)
+                if latest_id is None or latest_id <= min_id:
+                    logging.info(f"[{config.channel_name}] Новых сообщений нет.")
+                    result.status = "done"
+                    self._report(progress_callback, result)
+                    return result
+
+            queue = asyncio.Queue(maxsize=self.queue_size)
+            checkpoint = {}
+            producer = asyncio.ensure_future(self._produce(config, queue, last_message_date, min_id, checkpoint))
+            await self._consume(config, queue, result, progress_callback, checkpoint)
+            await producer
+            logging.info(f"[{config.channel_name}] Найдено {result.found} сообщений.")
+            result.status = "done"
+        except Exception as e:
+            logging.error(f"[{config.channel_name}] Ошибка при сканировании канала: {e}")
+            result.error = e
+            result.status = "error"
+        finally:
+            if producer is not None and not producer.done():
+                producer.cancel()
+
+        self._report(progress_callback, result)
+        return result
+
+    async def _produce(self, config, queue, last_message_date, min_id, checkpoint):
+        """
+        Читает канал и кладет найденные сообщения в очередь; в конце кладет None.
+        """
+        try:
+            async for message in self.telegram_client.iter_matching_messages(
+                    config.channel_name, last_message_date, config.keywords, config.exclude_words, config.limit,
+                    min_id=min_id, checkpoint=checkpoint, server_search=config.server_search):
+                await queue.put(message)
+        except Exception as e:
+            await queue.put(e)
+            return
+        await queue.put(None)
+
+    async def _consume(self, config, queue, result, progress_callback, checkpoint):
+        """
+        Забирает сообщения из очереди и записывает их в базу пачками.
+        Пачка записывается, когда набралось batch_size сообщений или новых не было flush_interval секунд.
+        """
+        batch = []
+        while True:
+            try:
+                item = await asyncio.wait_for(queue.get(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                await self._commit_batch(config, batch, result, progress_callback)
+                batch = []
+                continue
+
+            if item is None:
+                break
+            if isinstance(item, Exception):
+                # Сохраняем уже найденное, чтобы повторное сканирование продолжило с этого места
+                await self._commit_batch(config, batch, result, progress_callback)
+                raise item
+
+            batch.append(item)
+            if len(batch) >= self.batch_size:
+                await self._commit_batch(config, batch, result, progress_callback)
+                batch = []
+
+        # Канал прочитан до конца: контрольная точка сдвигается на последнее просмотренное
+        # сообщение, даже если оно не подошло, чтобы не читать его повторно
+        await self._commit_batch(config, batch, result, progress_callback, checkpoint)
+
+    async def _commit_batch(self, config, batch, result, progress_callback, checkpoint=None):
+        if checkpoint and checkpoint.get("message_id"):
+            last_message_date, last_message_id = checkpoint["message_date"], checkpoint["message_id"]
+        elif batch:
+            last_message_date, last_message_id = batch[-1].date, batch[-1].id
+        else:
+            return
+
+        # Пачка и контрольная точка канала пишутся одной транзакцией
+        rows = [(message.text, message.date, message.chat_id, message.id) for message in batch]
+        await resolve(self.db.save_messages(config.channel_name, rows, last_message_date, last_message_id))
+
+        if batch:
+            result.found += len(batch)
+            result.last_message_date = batch[-1].date
+            self._report(progress_callback, result)
+
+    async def run(self, configs, progress_callback=None):
+        """
+        Сканирует все каналы из configs и возвращает список ChannelScanResult в том же порядке.
+        Ошибка в одном канале не прерывает сканирование остальных.
+        """
+        results = [ChannelScanResult(config.channel_name) for config in configs]
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def scan_with_limit(config, result):
+            async with semaphore:
+                await self.scan_one(config, result, progress_callback)
+
+        # На время сканирования держим одно соединение для всех каналов
+        async with self.telegram_client.session():
+            await asyncio.gather(*(scan_with_limit(config, result) for config, result in zip(configs, results)))
+
+        done = sum(1 for result in results if result.status == "done")
+        logging.info(f"Сканирование завершено: успешно {done} из {len(results)} каналов.")
+        return results
+
+    def _report(self, progress_callback, result):
+        if progress_callback:
+            try:
+                progress_callback(result)
+            except Exception as e:
+                logging.error(f"Ошибка в обработчике прогресса сканирования: {e}")
@@ -1,93 +1,360 @@
 import re
 import asyncio
 import logging
+from contextlib import asynccontextmanager
+from datetime import timezone
 from telethon import TelegramClient
+from telethon.errors import FloodWaitError
+from rate_limiter import create_rate_limiter
+from keyword_matcher import compile_matcher
+
+# Telethon запрашивает историю канала страницами по 100 сообщений
+MESSAGES_PAGE_SIZE = 100
 
 class TelegramClientWrapper:
-    def __init__(self, api_id, api_hash):
+    def __init__(self, api_id, api_hash, persistent=False, connection_retries=3, retry_delay=2,
+                 rate_limiter=None, flood_sleep_threshold=0):
         self.client = None
         self.api_id = api_id
         self.api_hash = api_hash
         self.is_connected = False
+        # В постоянном режиме клиент подключается один раз и переиспользуется
+        # всеми вызовами scan_channel/upload_message до явного shutdown()
+        self.persistent = persistent
+        # Сколько вызовов и задач сейчас используют соединение (см. acquire/release)
+        self._users = 0
+        self.connection_retries = connection_retries
+        self.retry_delay = retry_delay
+        self._connect_lock = None
+        self._connect_lock_loop = None
+        # Все запросы к API проходят через общий ограничитель частоты; без rate_limiter
+        # бюджет берется из TELEGRAM_REQUESTS_PER_SECOND и TELEGRAM_BURST.
+        # flood_sleep_threshold=0 отключает внутренние ожидания Telethon,
+        # чтобы FloodWaitError всегда доходил до ограничителя
+        self.rate_limiter = rate_limiter or create_rate_limiter()
+        self.flood_sleep_threshold = flood_sleep_threshold
+        # Кэш найденных каналов: повторные сканирования не тратят запрос на get_entity
+        self._entities = {}
         self.loop = asyncio.get_event_loop()  # Получаем текущий цикл событий
 
+    def _get_connect_lock(self):
+        loop = asyncio.get_running_loop()
+        if self._connect_lock is None or self._connect_lock_loop is not loop:
+            self._connect_lock = asyncio.Lock()
+            self._connect_lock_loop = loop
+        return self._connect_lock
+
     async def connect(self):
-        if not self.is_connected:
-            self.client = TelegramClient('session_name', self.api_id, self.api_hash)
-            await self.client.start()
-            self.is_connected = True
-            logging.info("Подключение к Telegram успешно установлено")
+        # Блокировка не дает нескольким одновременным вызовам открыть две сессии
+        async with self._get_connect_lock():
+            if self.is_connected and await self.check_health():
+                return
+
+            if self.is_connected:
+                logging.warning("Соединение с Telegram потеряно, выполняется переподключение")
+                await self._drop_connection()
+
+            last_error = None
+            for attempt in range(1, self.connection_retries + 1):
+                try:
+                    if self.client is None:
+                        self.client = TelegramClient('session_name', self.api_id, self.api_hash,
+                                                     flood_sleep_threshold=self.flood_sleep_threshold)
+                    await self.client.start()
+                    self.is_connected = True
+                    logging.info("Подключение к Telegram успешно установлено")
+                    return
+                except Exception as e:
+                    last_error = e
+                    logging.error(f"Ошибка подключения к Telegram (попытка {attempt}): {e}")
+                    await self._drop_connection()
+                    if attempt < self.connection_retries:
+                        await asyncio.sleep(self.retry_delay * attempt)
+            raise last_error
+
+    async def check_health(self):
+        """
+        Проверяет, что соединение с Telegram живо и сессия авторизована.
+        """
+        if self.client is None or not self.client.is_connected():
+            return False
+        try:
+            return await self.client.is_user_authorized()
+        except Exception as e:
+            logging.warning(f"Проверка соединения с Telegram не прошла: {e}")
+            return False
+
+    async def _drop_connection(self):
+        if self.client is not None:
+            try:
+                await self.client.disconnect()
+            except Exception as e:
+                logging.warning(f"Ошибка при закрытии соединения с Telegram: {e}")
+        self.client = None
+        self.is_connected = False
 
     async def disconnect(self):
         if self.is_connected:
             await self.client.disconnect()
             self.is_connected = False
+            self.client = None
+
+    async def acquire(self):
+        """
+        Подключается (если нужно) и отмечает, что соединение используется.
+        Каждому acquire() соответствует один release().
+        """
+        self._users += 1
+        try:
+            await self.connect()
+        except Exception:
+            await self.release()
+            raise
+
+    async def release(self):
+        """
+        Освобождает соединение, полученное через acquire(). Соединение закрывается, только когда
+        его больше никто не использует; в постоянном режиме оно остается открытым.
+        """
+        self._users = max(0, self._users - 1)
+        if self.persistent or self._users:
+            return
+        async with self._get_connect_lock():
+            # Пока ждали блокировку, соединение мог занять новый вызов
+            if not self._users:
+                await self.disconnect()
+
+    @asynccontextmanager
+    async def session(self):
+        """
+        Держит соединение открытым на время блока async with (например, на все сканирование):
+        вложенные вызовы переиспользуют его, а не подключаются заново.
+        """
+        await self.acquire()
+        try:
+            yield self
+        finally:
+            await self.release()
+
+    async def shutdown(self):
+        """
+        Явно закрывает соединение, в том числе в постоянном режиме.
+        """
+        await self.disconnect()
+        logging.info("Соединение с Telegram закрыто")
+
+    async def get_channel(self, channel_name):
+        """
+        Возвращает сущность канала, запрашивая ее у Telegram только при первом обращении.
+        """
+        channel = self._entities.get(channel_name)
+        if channel is None:
+            channel = await self.rate_limiter.call(self.client.get_entity, channel_name)
+            self._entities[channel_name] = channel
+        return channel
+
+    async def get_latest_message_id(self, channel_name):
+        """
+        Возвращает ID последнего сообщения канала (одним легким запросом) или None для пустого канала.
+        """
+        await self.acquire()
+        try:
+            channel = await self.get_channel(channel_name)
+            messages = await self.rate_limiter.call(self.client.get_messages, channel, limit=1)
+            return messages[0].id if messages else None
+        finally:
+            await self.release()
 
     def contains_keywords(self, text, keywords):
         """
         Проверяет, есть ли в тексте хотя бы одно из ключевых слов.
         """
-        if not keywords:
-            return True  # Если ключевые слова не заданы, считаем, что условие выполнено
-        return any(keyword.strip().lower() in text.lower() for keyword in keywords)
+        return compile_matcher(keywords, None).matches(text)
 
     def contains_exclude_words(self, text, exclude_words):
         """
         Проверяет, есть ли в тексте хотя бы одно из исключаемых слов.
         """
-        if not exclude_words or exclude_words == ['']:
-            return False  # Если исключаемые слова не заданы, считаем, что условие не выполнено
-        return any(exclude_word.strip().lower() in text.lower() for exclude_word in exclude_words)
+        return not compile_matcher(None, exclude_words).matches(text)
 
-    def is_message_valid(self, text, keywords, exclude_words):
+    def is_message_valid(self, text, keywords, exclude_words, matcher=None):
         """
         Проверяет, соответствует ли сообщение условиям:
         - Если ключевые слова заданы, сообщение должно содержать хотя бы одно из них.
         - Если исключаемые слова заданы, сообщение не должно содержать ни одного из них.
         - Если оба поля пусты, сообщение считается валидным.
+        Слова компилируются в регулярные выражения один раз на список
+        (или передаются готовыми в matcher).
         """
-        # Проверяем, есть ли в сообщении ключевые слова (если они заданы)
-        if keywords and not self.contains_keywords(text, keywords):
-            return False
-
-        # Проверяем, есть ли в сообщении исключаемые слова (если они заданы)
-        if exclude_words and exclude_words != '' and self.contains_exclude_words(text, exclude_words):
-            return False
-
-        # Если все условия выполнены, сообщение валидно
-        return True
+        if matcher is None:
+            matcher = compile_matcher(keywords, exclude_words)
+        return matcher.matches(text)
 
-    async def scan_channel(self, channel_name, last_message_date=None, keywords=None, exclude_words=None, limit=5):
-
-        await self.connect()
+    async def iter_matching_messages(self, channel_name, last_message_date=None, keywords=None, exclude_words=None,
+                                     limit=None, min_id=None, checkpoint=None, server_search=False):
+        """
+        Асинхронный генератор: по мере чтения истории канала отдает подходящие сообщения
+        (объекты сообщений Telethon) в хронологическом порядке.
+        limit — максимальное число найденных сообщений (None — без ограничения).
+        min_id — читать только сообщения с ID больше указанного (приоритетнее last_message_date).
+        checkpoint — словарь, в котором обновляются "message_id" и "message_date" последнего
+        просмотренного сообщения, в том числе не подошедшего под условия.
+        server_search — искать кандидатов поиском Telegram по каждому ключевому слову
+        вместо чтения всей истории (см. _iter_search_results).
+        """
+        await self.acquire()
 
         try:
-            channel = await self.client.get_entity(channel_name)
-            messages_found = []
+            channel = await self.get_channel(channel_name)
             count = 0  # Добавляем счетчик
+            last_message_id = min_id or None
+            flood_retries = 0
+            # Автомат ключевых слов строится один раз на все сканирование
+            matcher = compile_matcher(keywords, exclude_words)
 
-            # Сканируем сообщения
-            async for message in self.client.iter_messages(channel, offset_date=last_message_date, reverse=True):
-                if count >= limit:  # Проверяем, не достигли ли лимита
-                    break
+            search_queries = self._search_queries(keywords) if server_search else None
+            if search_queries:
+                async for message in self._iter_search_results(channel, search_queries, last_message_date, min_id,
+                                                               keywords, exclude_words, matcher, limit, checkpoint):
+                    yield message
+                return
 
-                if message.text:
-                    # Проверяем, соответствует ли сообщение условиям
-                    if self.is_message_valid(message.text, keywords, exclude_words):
-                        # Сохраняем всё сообщение
-                        messages_found.append((message.text, message.date))
-                        print(f"Сообщение сохранено: {message.text[:500]}... (дата: {message.date})")
-                        count += 1  # Увеличиваем счетчик
+            while True:
+                # Если известен ID (min_id или последний обработанный после FloodWait), читаем после него
+                if last_message_id is None:
+                    iterator = self.client.iter_messages(channel, offset_date=last_message_date, reverse=True,
+                                                         wait_time=0)
+                else:
+                    iterator = self.client.iter_messages(channel, min_id=last_message_id, reverse=True, wait_time=0)
 
-                # Добавляем задержку, чтобы не нарушать лимиты Telegram API
-                await asyncio.sleep(1)
+                try:
+                    # Лимит расходуется на каждый запрос страницы, а не на каждое сообщение
+                    await self.rate_limiter.acquire()
+                    index = 0
+                    async for message in iterator:
+                        last_message_id = message.id
+                        if checkpoint is not None:
+                            checkpoint["message_id"] = message.id
+                            checkpoint["message_date"] = message.date
+                        if message.text:
+                            # Проверяем, соответствует ли сообщение условиям
+                            if self.is_message_valid(message.text, keywords, exclude_words, matcher):
+                                yield message
+                                count += 1  # Увеличиваем счетчик
+                                if limit is not None and count >= limit:  # Проверяем, не достигли ли лимита
+                                    return
 
-            return messages_found
+                        index += 1
+                        if index % MESSAGES_PAGE_SIZE == 0:
+                            # Следующая итерация запросит новую страницу
+                            self.rate_limiter.on_success()
+                            await self.rate_limiter.acquire()
+                    return
+                except FloodWaitError as e:
+                    flood_retries += 1
+                    if flood_retries > self.rate_limiter.max_retries:
+                        raise
+                    self.rate_limiter.on_flood_wait(e.seconds)
         except Exception as e:
             logging.error(f"Ошибка при сканировании канала: {e}")
             raise
         finally:
-            await self.disconnect()
+            await self.release()
+
+    @staticmethod
+    def _search_queries(keywords):
+        """
+        Возвращает поисковые запросы для поиска на стороне сервера или None, если поиск неприменим:
+        без ключевых слов или с пустым ключевым словом подходит любое сообщение.
+        """
+        if not keywords:
+            return None
+        queries = []
+        for keyword in keywords:
+            query = keyword.strip()
+            if not query:
+                return None
+            if query.lower() not in (existing.lower() for existing in queries):
+                queries.append(query)
+        return queries
+
+    async def _iter_search_results(self, channel, queries, last_message_date, min_id, keywords, exclude_words,
+                                   matcher, limit, checkpoint):
+        """
+        Отдает подходящие сообщения, найденные поиском Telegram: по одному поиску на ключевое слово,
+        результаты объединяются без повторов по ID и проверяются локально теми же условиями.
+        Поиск Telegram ищет слова и их начала, поэтому ключевое слово, встречающееся только
+        внутри другого слова, может быть не найдено.
+        """
+        # Последнее сообщение канала на момент поиска — граница поиска и итоговая контрольная точка
+        latest = await self.rate_limiter.call(self.client.get_messages, channel, limit=1)
+        if not latest or (min_id and latest[0].id <= min_id):
+            return
+        latest = latest[0]
+
+        date_from = last_message_date
+        if date_from is not None and date_from.tzinfo is None:
+            date_from = date_from.replace(tzinfo=timezone.utc)
+
+        candidates = {}
+        for query in queries:
+            await self._collect_search_results(channel, query, min_id, latest.id, date_from, candidates)
+        logging.info(f"Поиск на сервере нашел {len(candidates)} кандидатов по {len(queries)} запросам")
+
+        count = 0
+        for message_id in sorted(candidates):
+            message = candidates[message_id]
+            if checkpoint is not None:
+                checkpoint["message_id"] = message.id
+                checkpoint["message_date"] = message.date
+            if message.text and self.is_message_valid(message.text, keywords, exclude_words, matcher):
+                yield message
+                count += 1
+                if limit is not None and count >= limit:
+                    return
+
+        # Все сообщения до latest просмотрены поиском
+        if checkpoint is not None:
+            checkpoint["message_id"] = latest.id
+            checkpoint["message_date"] = latest.date
+
+    async def _collect_search_results(self, channel, query, min_id, max_id, date_from, candidates):
+        flood_retries = 0
+        while True:
+            try:
+                await self.rate_limiter.acquire()
+                index = 0
+                # Результаты идут от новых к старым; max_id не включается
+                async for message in self.client.iter_messages(channel, search=query, min_id=min_id or 0,
+                                                               max_id=max_id + 1, wait_time=0):
+                    if date_from is not None and message.date < date_from:
+                        break
+                    candidates[message.id] = message
+
+                    index += 1
+                    if index % MESSAGES_PAGE_SIZE == 0:
+                        self.rate_limiter.on_success()
+                        await self.rate_limiter.acquire()
+                return
+            except FloodWaitError as e:
+                # Повторяем запрос целиком: уже найденные сообщения не задублируются
+                flood_retries += 1
+                if flood_retries > self.rate_limiter.max_retries:
+                    raise
+                self.rate_limiter.on_flood_wait(e.seconds)
+
+    async def scan_channel(self, channel_name, last_message_date=None, keywords=None, exclude_words=None, limit=5):
+        """
+        Сканирует канал и возвращает список найденных сообщений (текст, дата), не больше limit
+        (None — без ограничения).
+        Для больших каналов используйте iter_matching_messages, чтобы не держать все в памяти.
+        """
+        messages_found = []
+        async for message in self.iter_matching_messages(channel_name, last_message_date, keywords, exclude_words,
+                                                         limit):
+            messages_found.append((message.text, message.date))
+            logging.debug(f"Найдено сообщение: {message.text[:500]}... (дата: {message.date})")
+        return messages_found
 
     # def contains_library_keyword(self, text):
     #     # Проверяем, есть ли в тексте слово "библиотека"
@@ -102,22 +369,50 @@ class TelegramClientWrapper:
     #     libraries = [match[0] or match[1] for match in matches if match[0] or match[1]]
     #     return libraries
 
-    async def upload_message(self, channel_name, text, image_path):
+    async def send_media(self, channel_name, captions, image_paths):
         """
-        Выгружает сообщение с изображением в Telegram.
+        Отправляет в канал одно изображение или альбом (несколько изображений одним сообщением).
+        captions — подписи к изображениям (HTML-разметка). Возвращает список ID отправленных сообщений.
+        Ошибки не перехватываются.
         """
+        await self.acquire()
         try:
-            await self.connect()  # Убедитесь, что клиент подключен
-            channel = await self.client.get_entity(channel_name)
-            # Отправляем изображение с текстом
-            await self.client.send_file(
+            channel = await self.get_channel(channel_name)
+            if len(image_paths) == 1:
+                files, caption = image_paths[0], captions[0]
+            else:
+                files, caption = list(image_paths), list(captions)
+            result = await self.rate_limiter.call(
+                self.client.send_file,
                 channel,
-                image_path,
-                caption=text,
+                files,
+                caption=caption,
                 parse_mode="html"  # Поддержка HTML-разметки в тексте
             )
+            messages = result if isinstance(result, list) else [result]
             logging.info(f"Сообщение выгружено в канал: {channel_name}")
+            return [message.id for message in messages]
+        finally:
+            await self.release()
+
+    async def upload_message(self, channel_name, text, image_path):
+        """
+        Выгружает сообщение с изображением в Telegram. Возвращает ID отправленного сообщения.
+        """
+        try:
+            return (await self.send_media(channel_name, [text], [image_path]))[0]
         except Exception as e:
             logging.error(f"Ошибка при выгрузке в Telegram: {e}")
+            raise
+
+    async def get_recent_outgoing_messages(self, channel_name, since, limit=50):
+        """
+        Возвращает последние отправленные этим аккаунтом сообщения канала, начиная с даты since.
+        """
+        await self.acquire()
+        try:
+            channel = await self.get_channel(channel_name)
+            messages = await self.rate_limiter.call(self.client.get_messages, channel, limit=limit)
+            return [message for message in messages if message.out and message.date >= since]
         finally:
-            await self.disconnect()
+            await self.release()
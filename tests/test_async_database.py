@@ -0,0 +1,74 @@
+import asyncio
+import sqlite3
+from datetime import datetime, timedelta
+
+import pytest
+
+from async_database import AsyncDatabase, resolve
+from database import Database
+
+
+def run_with_db(path, check):
+    async def run():
+        async with AsyncDatabase(path, readers=2) as db:
+            return await check(db)
+    return asyncio.run(run())
+
+
+def test_write_then_read_through_reader_pool(tmp_path):
+    start = datetime(2024, 1, 1)
+    rows = [(f"Сообщение {i}", start + timedelta(minutes=i), -100, i) for i in range(1, 6)]
+
+    async def check(db):
+        assert await db.save_messages("@channel", rows, rows[-1][1], 5) == 5
+        page, cursor = await db.get_messages_page(page_size=3)
+        history = await db.get_messages(limit=2)
+        return page, cursor, history, await db.get_last_scan_id("@channel")
+
+    page, cursor, history, last_id = run_with_db(str(tmp_path / "test.db"), check)
+    assert [row[2] for row in page] == ["Сообщение 5", "Сообщение 4", "Сообщение 3"]
+    assert cursor is not None
+    assert [row[1] for row in history] == ["Сообщение 5", "Сообщение 4"]
+    assert last_id == 5
+
+    # Записанное асинхронной базой видно синхронной
+    db = Database(str(tmp_path / "test.db"))
+    assert db.get_last_scan_id("@channel") == 5
+    assert len(db.get_messages()) == 5
+    db.close()
+
+
+def test_readers_are_query_only(tmp_path):
+    async def check(db):
+        async with db._reading() as reader:
+            await reader.execute("DELETE FROM messages")
+
+    with pytest.raises(sqlite3.OperationalError):
+        run_with_db(str(tmp_path / "test.db"), check)
+
+
+def test_queues_match_sync_database(tmp_path):
+    async def check(db):
+        job_id = await db.enqueue_upload_job("@channel", ["Подпись"], ["image.png"], [1])
+        claimed = await db.claim_upload_job()
+        await db.complete_upload_job(job_id, [10])
+        return job_id, claimed, await db.get_upload_job(job_id), await db.get_upload_job_counts()
+
+    job_id, claimed, job, counts = run_with_db(str(tmp_path / "test.db"), check)
+    assert claimed == (job_id, "@channel", ["Подпись"], ["image.png"], 1)
+    assert job == ("sent", [10], None)
+    assert counts["sent"] == 1
+
+    db = Database(str(tmp_path / "test.db"))
+    assert db.get_upload_job(job_id) == job
+    db.close()
+
+
+def test_resolve_accepts_sync_and_async_results():
+    async def value():
+        return 1
+
+    async def check():
+        return await resolve(value()), await resolve(2)
+
+    assert asyncio.run(check()) == (1, 2)
@@ -0,0 +1,199 @@
+import sqlite3
+from datetime import datetime, timedelta
+
+import pytest
+
+from database import Database, messages_page_query, search_query, search_term_stem
+
+
+@pytest.fixture
+def db(tmp_path):
+    database = Database(str(tmp_path / "test.db"))
+    yield database
+    database.conn.close()
+
+
+def count_messages(db):
+    return db.cursor.execute("SELECT COUNT(*) FROM messages").fetchone()[0]
+
+
+def create_old_database(path):
+    """
+    База в схеме до появления идентификаторов сообщений Telegram, с двумя одинаковыми сообщениями.
+    """
+    conn = sqlite3.connect(path)
+    conn.executescript('''
+        CREATE TABLE messages (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            channel_name TEXT,
+            message_text TEXT,
+            message_date DATETIME
+        );
+        CREATE TABLE last_scan (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            channel_name TEXT UNIQUE,
+            last_message_date DATETIME
+        );
+        INSERT INTO messages (channel_name, message_text, message_date)
+        VALUES ('@channel', 'Старая библиотека', '2023-01-01 00:00:00'),
+               ('@channel', 'Старая библиотека', '2023-01-01 00:00:00');
+        INSERT INTO last_scan (channel_name, last_message_date) VALUES ('@channel', '2023-01-01 00:00:00');
+    ''')
+    conn.close()
+
+
+def test_save_messages_upserts_by_telegram_ids(db):
+    date = datetime(2024, 3, 1)
+    db.save_messages("@channel", [("первый текст", date, 100, 1), ("второй текст", date, 100, 2)])
+    db.save_messages("@channel", [("исправленный текст", date, 100, 1)])
+    assert count_messages(db) == 2
+    texts = dict(db.cursor.execute("SELECT message_id, message_text FROM messages").fetchall())
+    assert texts == {1: "исправленный текст", 2: "второй текст"}
+
+    # Без идентификаторов Telegram каждое сохранение — новая строка
+    db.save_messages("@channel", [("без id", date)])
+    db.save_messages("@channel", [("без id", date)])
+    assert count_messages(db) == 4
+
+
+def test_migrates_messages_without_telegram_ids(tmp_path):
+    path = str(tmp_path / "old.db")
+    create_old_database(path)
+
+    db = Database(path)
+    try:
+        columns = {row[1] for row in db.cursor.execute("PRAGMA table_info(messages)")}
+        assert {"channel_id", "message_id"} <= columns
+        # Старые строки без идентификаторов не конфликтуют в уникальном индексе
+        assert count_messages(db) == 2
+        db.save_messages("@channel", [("Новая библиотека", datetime(2024, 1, 1), 100, 5)] * 2)
+        assert count_messages(db) == 3
+    finally:
+        db.conn.close()
+
+
+def test_checkpoint_keeps_previous_message_id(db):
+    db.save_messages("@channel", [("текст", datetime(2024, 3, 1), 100, 7)], datetime(2024, 3, 1), 7)
+    db.update_last_scan_date("@channel", datetime(2024, 3, 2))
+    assert db.get_last_scan_date("@channel") == datetime(2024, 3, 2)
+    assert db.get_last_scan_id("@channel") == 7
+
+
+def test_migrates_checkpoint_without_message_id(tmp_path):
+    path = str(tmp_path / "old.db")
+    create_old_database(path)
+
+    db = Database(path)
+    try:
+        assert db.get_last_scan_date("@channel") == datetime(2023, 1, 1)
+        assert db.get_last_scan_id("@channel") is None
+        db.save_messages("@channel", [("Новая библиотека", datetime(2024, 1, 1), 100, 5)],
+                         datetime(2024, 1, 1), 5)
+        assert db.get_last_scan_id("@channel") == 5
+    finally:
+        db.conn.close()
+
+
+def test_messages_page_query_keyset_cursor():
+    query, params = messages_page_query(page_size=20)
+    assert "WHERE" not in query
+    assert params == [20]
+
+    cursor = ("2024-03-01 10:00:00", 42)
+    query, params = messages_page_query("@channel", "2024-01-01", "2024-04-01", cursor, 20)
+    assert "(message_date, id) < (?, ?)" in query
+    assert query.endswith("ORDER BY message_date DESC, id DESC LIMIT ?")
+    assert params == ["@channel", "2024-01-01", "2024-04-01", "2024-03-01 10:00:00", 42, 20]
+
+
+def test_messages_page_walks_all_rows_once(db):
+    base = datetime(2024, 3, 1)
+    # Одинаковые даты: порядок внутри даты задает id
+    db.save_messages("@channel", [(f"сообщение {index}", base + timedelta(hours=index // 3), 100, index)
+                                  for index in range(25)])
+    seen = []
+    cursor = None
+    while True:
+        rows, cursor = db.get_messages_page(cursor=cursor, page_size=10)
+        seen.extend(rows)
+        if cursor is None:
+            break
+    assert len(seen) == 25
+    assert len({row[0] for row in seen}) == 25
+    keys = [(row[3], row[0]) for row in seen]
+    assert keys == sorted(keys, reverse=True)
+
+
+def test_messages_page_query_by_insertion_order():
+    query, params = messages_page_query("@channel", cursor=42, page_size=20, order="id")
+    assert "id < ?" in query
+    assert query.endswith("ORDER BY id DESC LIMIT ?")
+    assert params == ["@channel", 42, 20]
+
+
+def test_messages_page_by_insertion_order_ignores_dates(db):
+    # Сначала сохранены новые сообщения, потом досканированы старые
+    db.save_messages("@channel", [(f"новое {index}", datetime(2024, 5, 1) + timedelta(hours=index), 100, 100 + index)
+                                  for index in range(3)])
+    db.save_messages("@channel", [(f"старое {index}", datetime(2023, 1, 1) + timedelta(hours=index), 100, index)
+                                  for index in range(4)])
+
+    rows, cursor = db.get_messages_page(page_size=5, order="id")
+    assert [row[2] for row in rows] == ["старое 3", "старое 2", "старое 1", "старое 0", "новое 2"]
+    assert cursor == rows[-1][0]
+    rows, cursor = db.get_messages_page(cursor=cursor, page_size=5, order="id")
+    assert [row[2] for row in rows] == ["новое 1", "новое 0"]
+    assert cursor is None
+    # Так же, как прежний get_messages с ограничением
+    assert [row[1] for row in db.get_messages(limit=5)] == [
+        "старое 3", "старое 2", "старое 1", "старое 0", "новое 2"]
+
+
+@pytest.mark.parametrize("term, expected", [
+    ("библиотеки", "библиотек"),
+    ("Библиотеками", "Библиотек"),
+    ("кошки", "кошк"),
+    ("коты", "коты"),  # Основа была бы короче 4 букв — слово не меняется
+    ("python", "python"),
+    ("asyncio3", "asyncio3"),
+])
+def test_search_term_stem(term, expected):
+    assert search_term_stem(term) == expected
+
+
+def test_search_query_quotes_terms():
+    sql, params = search_query('библиотеки "OR" python*', channel_name="@channel", limit=10)
+    assert params == ['"библиотек"* "OR"* "python"*', "@channel", 10]
+    assert "m.channel_name = ?" in sql
+
+    _, params = search_query("библиотеки python", prefix=False)
+    assert params[0] == '"библиотеки" "python"'
+
+
+def test_search_query_without_words():
+    assert search_query(" -- !!! ") is None
+
+
+def test_search_follows_updates(db):
+    if not db.fts_enabled:
+        pytest.skip("SQLite собран без FTS5")
+    date = datetime(2024, 3, 1)
+    db.save_messages("@channel", [("Новые библиотеки для Python", date, 100, 1)])
+    assert [row[0] for row in db.search_messages("библиотека")]
+
+    db.save_messages("@channel", [("Обзор фреймворков", date, 100, 1)])
+    assert db.search_messages("библиотека") == []
+    assert len(db.search_messages("фреймворки")) == 1
+
+
+def test_search_index_covers_messages_saved_before_it(tmp_path):
+    path = str(tmp_path / "old.db")
+    create_old_database(path)
+
+    db = Database(path)
+    try:
+        if not db.fts_enabled:
+            pytest.skip("SQLite собран без FTS5")
+        assert len(db.search_messages("старая")) == 2
+    finally:
+        db.conn.close()
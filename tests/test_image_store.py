@@ -0,0 +1,91 @@
+import asyncio
+import os
+import threading
+
+import pytest
+
+from async_database import AsyncDatabase
+from database import Database
+from image_store import ImageStore
+
+
+@pytest.fixture
+def store(tmp_path):
+    image_store = ImageStore(str(tmp_path / "test.db"), str(tmp_path / "images"))
+    yield image_store
+    image_store.close()
+
+
+def make_old(file_path):
+    os.utime(file_path, (0, 0))
+
+
+def test_table_is_part_of_database_schema(tmp_path):
+    db = Database(str(tmp_path / "test.db"))
+    assert db.cursor.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'generated_images'").fetchone()
+    db.close()
+
+
+def test_put_and_get_reuse_request(store):
+    file_path = store.put("model", "кот", b"image")
+    assert store.get("model", "кот") == file_path
+    assert store.get("model", "собака") is None
+    # Одинаковое содержимое хранится одним файлом
+    assert store.put("model", "собака", b"image") == file_path
+    assert len(os.listdir(store.directory)) == 1
+
+
+def test_get_forgets_deleted_file(store):
+    os.remove(store.put("model", "кот", b"image"))
+    assert store.get("model", "кот") is None
+    assert store.db.get_generated_image_files() == []
+
+
+def test_store_uses_wal_and_works_from_threads(store):
+    assert store.db.cursor.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+    threads = [threading.Thread(target=store.put, args=("model", f"промт {i}", f"image {i}".encode()))
+               for i in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(store.db.get_generated_image_files()) == 8
+
+
+def test_async_database_sees_generated_images(tmp_path, store):
+    file_path = store.put("model", "кот", b"image")
+
+    async def run():
+        async with AsyncDatabase(str(tmp_path / "test.db")) as db:
+            return await db._fetchall("SELECT file_path FROM generated_images")
+
+    assert asyncio.run(run()) == [(file_path,)]
+
+
+def test_collect_garbage_keeps_referenced_images(tmp_path, store):
+    saved = store.put("model", "сохраненное", b"saved")
+    pending = store.put("model", "ожидает выгрузки", b"pending")
+    uploaded = store.put("model", "выгружено", b"uploaded")
+    unused = store.put("model", "не нужно", b"unused")
+    for file_path in (saved, pending, uploaded, unused):
+        make_old(file_path)
+
+    db = Database(str(tmp_path / "test.db"))
+    db.save_transformed_library("Библиотека", "Описание", "Текст", saved)
+    db.enqueue_upload_job("@channel", ["Подпись"], [pending])
+    db.complete_upload_job(db.enqueue_upload_job("@channel", ["Подпись"], [uploaded]), [1])
+    db.close()
+
+    assert store.collect_garbage() == 2
+    assert os.path.exists(saved) and os.path.exists(pending)
+    assert not os.path.exists(uploaded) and not os.path.exists(unused)
+    assert store.get("model", "ожидает выгрузки") == pending
+    assert store.get("model", "не нужно") is None
+    assert sorted(store.db.get_generated_image_files()) == sorted([saved, pending])
+
+
+def test_collect_garbage_keeps_recent_images(store):
+    file_path = store.put("model", "кот", b"image")
+    assert store.collect_garbage() == 0
+    assert os.path.exists(file_path)
@@ -0,0 +1,64 @@
+import random
+import re
+
+import pytest
+
+from benchmarks.fake_telegram import substring_is_message_valid
+from keyword_matcher import REGEX_MIN_WORDS, KeywordMatcher, compile_matcher, compile_words, trie_pattern
+
+ALPHABET = "абвгдеёжАБВЁabcdeABCDE -_.+*?()[]$^\\|"
+
+
+def random_word(rng, max_length=4):
+    return "".join(rng.choice(ALPHABET) for _ in range(rng.randint(1, max_length)))
+
+
+@pytest.mark.parametrize("count", [1, 3, 20, REGEX_MIN_WORDS, 3 * REGEX_MIN_WORDS])
+def test_matches_like_substring_check(count):
+    rng = random.Random(count)
+    for _ in range(300):
+        keywords = [random_word(rng) for _ in range(rng.randint(1, count))]
+        exclude_words = [random_word(rng) for _ in range(rng.randint(0, 3))]
+        # Пробелы вокруг слов, как после split(',') в интерфейсе
+        keywords = [f" {keyword} " if rng.random() < 0.2 else keyword for keyword in keywords]
+        matcher = KeywordMatcher(keywords, exclude_words)
+        for _ in range(10):
+            text = "".join(rng.choice(ALPHABET) for _ in range(rng.randint(0, 60)))
+            assert matcher.matches(text) == substring_is_message_valid(text, keywords, exclude_words), \
+                (text, keywords, exclude_words)
+
+
+@pytest.mark.parametrize("keywords, exclude_words, text, expected", [
+    (None, None, "что угодно", True),
+    ([], [], "что угодно", True),
+    (["Python"], None, "пишем на PYTHON", True),
+    (["python"], None, "пишем на go", False),
+    (["python", ""], None, "пишем на go", True),  # Пустое слово совпадает с любым текстом
+    (["python"], [""], "пишем на python", True),  # [''] — исключаемые слова не заданы
+    (["python"], ["реклама", ""], "пишем на python", False),  # Пустое исключаемое слово исключает все
+    (["python"], ["Реклама"], "python — РЕКЛАМА", False),
+    (["a.b"], None, "axb", False),  # Спецсимволы ищутся буквально
+    (["ёж"], None, "ЁЖИК", True),
+])
+def test_edge_cases(keywords, exclude_words, text, expected):
+    assert KeywordMatcher(keywords, exclude_words).matches(text) is expected
+    assert substring_is_message_valid(text, keywords, exclude_words) is expected
+
+
+def test_trie_pattern_groups_common_prefixes():
+    assert trie_pattern(["python", "pypi", "go"]) == "(?:go|py(?:pi|thon))"
+    # Достаточно более короткого слова
+    assert trie_pattern(["py", "python"]) == "py"
+    assert re.compile(trie_pattern(["a.b", "a*"])).search("a*") is not None
+
+
+def test_compile_words_uses_regex_for_long_lists():
+    words = [f"слово{index}" for index in range(REGEX_MIN_WORDS)]
+    search = compile_words(words)
+    assert search("текст со словом слово42 внутри")
+    assert not search("текст без совпадений")
+
+
+def test_compile_matcher_reuses_compiled_matchers():
+    assert compile_matcher(["python", "go"], ["реклама"]) is compile_matcher(("python", "go"), ("реклама",))
+    assert compile_matcher(["python"], [""]) is compile_matcher(["python"], None)
@@ -0,0 +1,116 @@
+import pytest
+
+import g4f_wrapper
+import llm_cache
+from llm_cache import LLMCache, cache_key
+
+
+class Clock:
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+class StubBackend:
+    """
+    Бэкенд нейросети, отвечающий номером запроса.
+    """
+
+    def __init__(self):
+        self.requests = []
+
+    def complete(self, model, content):
+        self.requests.append((model, content))
+        return f"Ответ {len(self.requests)}"
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(llm_cache.time, "time", clock)
+    return clock
+
+
+@pytest.fixture
+def cache(tmp_path):
+    cache = LLMCache(str(tmp_path / "llm_cache.db"), ttl=100, max_entries=3)
+    yield cache
+    cache.close()
+
+
+@pytest.fixture
+def backend(cache):
+    backend = StubBackend()
+    g4f_wrapper.set_backend(backend)
+    g4f_wrapper.set_llm_cache(cache)
+    yield backend
+    g4f_wrapper.set_backend(None)
+    g4f_wrapper.set_llm_cache(None)
+
+
+def test_key_depends_on_model_prompt_and_text(cache):
+    keys = {cache_key("gpt-4", "промт", "текст"), cache_key("gpt-3", "промт", "текст"),
+            cache_key("gpt-4", "другой промт", "текст"), cache_key("gpt-4", "промт", "другой текст"),
+            # Граница между частями учитывается: ("аб", "в") и ("а", "бв") — разные запросы
+            cache_key("gpt-4", "аб", "в"), cache_key("gpt-4", "а", "бв")}
+    assert len(keys) == 6
+
+    cache.set("gpt-4", "промт", "текст", "ответ")
+    assert cache.get("gpt-4", "промт", "текст") == "ответ"
+    assert cache.get("gpt-3", "промт", "текст") is None
+    assert cache.get("gpt-4", "другой промт", "текст") is None
+    assert cache.get("gpt-4", "промт", "другой текст") is None
+
+
+def test_entries_expire_after_ttl(cache, clock):
+    cache.set("gpt-4", "промт", "текст", "ответ")
+    clock.now += 99
+    assert cache.get("gpt-4", "промт", "текст") == "ответ"
+    # Обращение не продлевает срок хранения
+    clock.now += 2
+    assert cache.get("gpt-4", "промт", "текст") is None
+
+    cache.set("gpt-4", "промт", "текст", "новый ответ")
+    assert cache.get("gpt-4", "промт", "текст") == "новый ответ"
+
+
+def test_least_recently_used_entries_are_evicted(cache, clock):
+    for text in ("a", "b", "c"):
+        clock.now += 1
+        cache.set("gpt-4", "промт", text, f"ответ {text}")
+    clock.now += 1
+    assert cache.get("gpt-4", "промт", "a") == "ответ a"
+
+    clock.now += 1
+    cache.set("gpt-4", "промт", "d", "ответ d")
+
+    # Вытеснена запись "b": к ней обращались раньше всех
+    assert cache.get("gpt-4", "промт", "b") is None
+    assert [cache.get("gpt-4", "промт", text) for text in ("a", "c", "d")] == ["ответ a", "ответ c", "ответ d"]
+    assert cache.cursor.execute("SELECT COUNT(*) FROM llm_cache").fetchone()[0] == 3
+
+
+def test_chat_completion_uses_cache(backend):
+    assert g4f_wrapper.chat_completion("промт", "текст") == "Ответ 1"
+    assert g4f_wrapper.chat_completion("промт", "текст") == "Ответ 1"
+    assert backend.requests == [("gpt-4", "промт текст")]
+
+    assert g4f_wrapper.chat_completion("промт", "текст", model="gpt-3") == "Ответ 2"
+    assert len(backend.requests) == 2
+
+
+def test_chat_completion_without_cache_refreshes_answer(backend):
+    assert g4f_wrapper.chat_completion("промт", "текст") == "Ответ 1"
+    assert g4f_wrapper.chat_completion("промт", "текст", use_cache=False) == "Ответ 2"
+    assert len(backend.requests) == 2
+    # Новый ответ заменяет прежний в кэше
+    assert g4f_wrapper.chat_completion("промт", "текст") == "Ответ 2"
+    assert len(backend.requests) == 2
+
+
+def test_empty_answer_is_not_cached(backend):
+    backend.complete = lambda model, content: ""
+    assert g4f_wrapper.chat_completion("промт", "текст") == ""
+    assert g4f_wrapper.get_llm_cache().get("gpt-4", "промт", "текст") is None
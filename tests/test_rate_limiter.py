@@ -0,0 +1,137 @@
+import asyncio
+
+import pytest
+from telethon.errors import FloodWaitError
+
+import rate_limiter
+from rate_limiter import DEFAULT_BURST, DEFAULT_REQUESTS_PER_SECOND, RateLimiter, create_rate_limiter
+
+
+class FakeClock:
+    """
+    Время для RateLimiter: asyncio.sleep не ждет, а сдвигает часы.
+    """
+
+    def __init__(self):
+        self.now = 1000.0
+        self.sleeps = []
+
+    def monotonic(self):
+        return self.now
+
+    async def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(rate_limiter.time, "monotonic", clock.monotonic)
+    monkeypatch.setattr(rate_limiter.asyncio, "sleep", clock.sleep)
+    return clock
+
+
+def test_rejects_non_positive_rate():
+    with pytest.raises(ValueError):
+        RateLimiter(requests_per_second=0)
+    with pytest.raises(ValueError):
+        RateLimiter(burst=0)
+
+
+def test_burst_then_steady_rate(clock):
+    limiter = RateLimiter(requests_per_second=2.0, burst=3)
+
+    async def run():
+        for _ in range(5):
+            await limiter.acquire()
+
+    asyncio.run(run())
+    # Три запроса из запаса, затем по одному каждые 0,5 с
+    assert clock.sleeps == pytest.approx([0.5, 0.5])
+    assert limiter.budget["total_requests"] == 5
+    assert limiter.budget["total_wait"] == pytest.approx(1.0)
+
+
+def test_tokens_refill_while_idle(clock):
+    limiter = RateLimiter(requests_per_second=1.0, burst=2)
+
+    async def run():
+        await limiter.acquire()
+        await limiter.acquire()
+        clock.now += 10  # Простой восполняет запас, но не больше burst
+        for _ in range(2):
+            await limiter.acquire()
+
+    asyncio.run(run())
+    assert clock.sleeps == []
+
+
+def test_flood_wait_blocks_and_halves_rate(clock):
+    limiter = RateLimiter(requests_per_second=4.0, burst=5, min_rate=1.0)
+    calls = []
+
+    async def request():
+        calls.append(clock.now)
+        if len(calls) == 1:
+            raise FloodWaitError(request=None, capture=7)
+        return "ok"
+
+    assert asyncio.run(limiter.call(request)) == "ok"
+    assert len(calls) == 2
+    assert calls[1] - calls[0] == pytest.approx(7)
+    assert limiter.flood_waits == 1
+    assert limiter.flood_wait_seconds == 7
+    # Скорость снижена вдвое и после успешного запроса начала восстанавливаться
+    assert limiter.rate == pytest.approx(2.0 * limiter.recovery_factor)
+
+
+def test_rate_does_not_drop_below_minimum(clock):
+    limiter = RateLimiter(requests_per_second=1.0, min_rate=0.2)
+    for _ in range(10):
+        limiter.on_flood_wait(1)
+    assert limiter.rate == 0.2
+
+
+def test_rate_recovers_up_to_maximum(clock):
+    limiter = RateLimiter(requests_per_second=1.0)
+    limiter.on_flood_wait(1)
+    for _ in range(100):
+        limiter.on_success()
+    assert limiter.rate == 1.0
+
+
+def test_gives_up_after_max_retries(clock):
+    limiter = RateLimiter(requests_per_second=10.0, max_retries=2)
+    attempts = []
+
+    async def request():
+        attempts.append(clock.now)
+        raise FloodWaitError(request=None, capture=1)
+
+    with pytest.raises(FloodWaitError):
+        asyncio.run(limiter.call(request))
+    assert len(attempts) == 3
+
+
+def test_create_rate_limiter_defaults(monkeypatch):
+    monkeypatch.delenv("TELEGRAM_REQUESTS_PER_SECOND", raising=False)
+    monkeypatch.delenv("TELEGRAM_BURST", raising=False)
+    limiter = create_rate_limiter()
+    assert (limiter.max_rate, limiter.burst) == (DEFAULT_REQUESTS_PER_SECOND, DEFAULT_BURST)
+
+
+def test_create_rate_limiter_reads_environment(monkeypatch):
+    monkeypatch.setenv("TELEGRAM_REQUESTS_PER_SECOND", "0.5")
+    monkeypatch.setenv("TELEGRAM_BURST", "10")
+    limiter = create_rate_limiter()
+    assert (limiter.max_rate, limiter.burst, limiter.tokens) == (0.5, 10, 10.0)
+    # Явно переданные значения (флаги командной строки) важнее переменных окружения
+    limiter = create_rate_limiter(requests_per_second=4.0, burst=2)
+    assert (limiter.max_rate, limiter.burst) == (4.0, 2)
+
+
+def test_create_rate_limiter_rejects_invalid_environment(monkeypatch):
+    monkeypatch.setenv("TELEGRAM_REQUESTS_PER_SECOND", "быстро")
+    with pytest.raises(ValueError):
+        create_rate_limiter()
@@ -0,0 +1,201 @@
+import asyncio
+from datetime import datetime
+
+import pytest
+
+import telegram_client
+from benchmarks.fake_telegram import create_client_wrapper, make_channel
+from database import Database
+from scan_engine import ChannelScanConfig, ScanEngine, parse_words
+
+
+def test_parse_words():
+    assert parse_words("python, django ,") == ["python", "django", ""]
+    assert parse_words(["python"]) == ["python"]
+    assert parse_words(None) is None
+
+
+def test_from_line_channel_only():
+    config = ChannelScanConfig.from_line("  @channel  ")
+    assert config.channel_name == "@channel"
+    assert config.keywords == [""]
+    assert config.exclude_words == [""]
+    assert config.scan_mode == "start"
+    assert config.specific_date is None
+    assert config.limit is None
+    assert config.server_search is False
+
+
+def test_from_line_all_fields():
+    config = ChannelScanConfig.from_line("@channel; python, django; реклама; continue; 20; SERVER")
+    assert config.keywords == ["python", "django"]
+    assert config.exclude_words == ["реклама"]
+    assert config.scan_mode == "continue"
+    assert config.limit == 20
+    assert config.server_search is True
+
+
+def test_from_line_specific_date():
+    config = ChannelScanConfig.from_line("@channel;;;2024-03-01")
+    assert config.scan_mode == "specific_date"
+    assert config.specific_date == datetime(2024, 3, 1)
+    assert config.server_search is False
+
+
+@pytest.mark.parametrize("line", [
+    "; python",  # Нет канала
+    "@channel;;;вчера",  # Неверная дата
+    "@channel;;;start;много",  # Неверный лимит
+])
+def test_from_line_rejects_invalid_lines(line):
+    with pytest.raises(ValueError):
+        ChannelScanConfig.from_line(line)
+
+
+def test_overlapping_runs_share_one_connection(tmp_path, monkeypatch):
+    def forbidden(*args, **kwargs):
+        raise AssertionError("Соединение с Telegram было закрыто во время сканирования")
+
+    monkeypatch.setattr(telegram_client, "TelegramClient", forbidden)
+    channels = [make_channel("short", 200), make_channel("long", 600), make_channel("after", 200)]
+    db = Database(str(tmp_path / "scan.db"))
+
+    async def run():
+        # Непостоянный клиент: соединение закрывается, когда его освобождают все задачи
+        wrapper = create_client_wrapper(channels, page_latency=0.01)
+        wrapper.persistent = False
+        first = ScanEngine(wrapper, db)
+        # Второй запуск начинает канал "after" уже после того, как первый запуск завершился
+        second = ScanEngine(wrapper, db, concurrency=1)
+        results = await asyncio.gather(first.run([ChannelScanConfig("short", "python")]),
+                                       second.run([ChannelScanConfig("long", "python"),
+                                                   ChannelScanConfig("after", "python")]))
+        return results, wrapper
+
+    try:
+        results, wrapper = asyncio.run(run())
+    finally:
+        db.conn.close()
+    results = [result for run_results in results for result in run_results]
+    assert [result.status for result in results] == ["done", "done", "done"], [result.error for result in results]
+    assert all(result.found for result in results)
+    assert wrapper.persistent is False
+    assert wrapper.is_connected is False
+
+
+class SlowDatabase:
+    """
+    Асинхронная обертка над Database, записывающая медленнее чтения канала.
+    Запоминает каждую пачку: (число сообщений, ID контрольной точки, сколько сообщений прочитано к этому моменту).
+    """
+
+    def __init__(self, db, client, delay=0.005):
+        self.db = db
+        self.client = client
+        self.delay = delay
+        self.batches = []
+
+    async def save_messages(self, channel_name, messages, last_message_date=None, last_message_id=None):
+        await asyncio.sleep(self.delay)
+        self.batches.append((len(messages), last_message_id, self.client.read))
+        return self.db.save_messages(channel_name, messages, last_message_date, last_message_id)
+
+    def __getattr__(self, name):
+        return getattr(self.db, name)
+
+
+def count_reads(wrapper, fail_after=None):
+    """
+    Считает сообщения, прочитанные при чтении истории (reverse=True, без проверки последнего ID),
+    в client.read, а min_id этих чтений — в client.min_ids; при fail_after обрывает чтение ошибкой.
+    """
+    client = wrapper.client
+    client.read = 0
+    iter_messages = client.iter_messages
+
+    async def counting(*args, **kwargs):
+        if not kwargs.get("reverse"):
+            async for message in iter_messages(*args, **kwargs):
+                yield message
+            return
+        client.min_ids.append(kwargs.get("min_id"))
+        async for message in iter_messages(*args, **kwargs):
+            if fail_after is not None and client.read >= fail_after:
+                raise ConnectionError("Соединение разорвано")
+            client.read += 1
+            yield message
+
+    client.min_ids = []
+    client.iter_messages = counting
+    return client
+
+
+def scan_channel(db, channel, config, fail_after=None, slow=False, **engine_kwargs):
+    async def run():
+        wrapper = create_client_wrapper([channel])
+        client = count_reads(wrapper, fail_after)
+        target = SlowDatabase(db, client) if slow else db
+        result = (await ScanEngine(wrapper, target, **engine_kwargs).run([config]))[0]
+        return result, client, target
+
+    return asyncio.run(run())
+
+
+def saved_message_ids(db):
+    return [row[0] for row in db.cursor.execute("SELECT message_id FROM messages ORDER BY message_id")]
+
+
+@pytest.fixture
+def db(tmp_path):
+    database = Database(str(tmp_path / "scan.db"))
+    yield database
+    database.conn.close()
+
+
+def test_streaming_writes_bounded_batches_and_advances_checkpoint(db):
+    # Подходит каждое сообщение с текстом, поэтому очередь наполняется так быстро, как читается канал
+    channel = make_channel("stream", 1000, topic_ratio=1.0, exclude_ratio=0.0)
+    config = ChannelScanConfig("stream", "python, библиотека, фреймворк")
+    result, client, slow_db = scan_channel(db, channel, config, slow=True, batch_size=20, queue_size=40)
+
+    assert result.status == "done"
+    assert result.found == 900 == len(saved_message_ids(db))
+    batches = slow_db.batches
+    assert all(size <= 20 for size, _, _ in batches)
+    # Контрольная точка сдвигается после каждой пачки и в конце стоит на последнем сообщении канала,
+    # хотя оно без текста и не сохранено
+    checkpoints = [checkpoint for _, checkpoint, _ in batches]
+    assert checkpoints == sorted(checkpoints) and len(set(checkpoints)) == len(checkpoints)
+    assert checkpoints[-1] == 1000 == db.get_last_scan_id("stream")
+    # Чтение не уходит дальше заполненной очереди: прочитано не больше записанного плюс очередь и пачка
+    saved = 0
+    for size, _, read in batches:
+        saved += size
+        assert read - saved <= 40 + 20 + 2 + read // 10
+
+
+def test_interrupted_scan_resumes_from_last_committed_message(db):
+    channel = make_channel("resume", 600)
+    config = ChannelScanConfig("resume", "python, библиотека, фреймворк", "реклама, розыгрыш")
+    result, _, _ = scan_channel(db, channel, config, fail_after=250, batch_size=10, flush_interval=0.05)
+
+    assert result.status == "error"
+    assert isinstance(result.error, ConnectionError)
+    checkpoint = db.get_last_scan_id("resume")
+    saved = saved_message_ids(db)
+    # Найденное до обрыва сохранено, и контрольная точка стоит на последнем сохраненном сообщении
+    assert saved and checkpoint == saved[-1] <= 250
+
+    config.scan_mode = "continue"
+    result, client, _ = scan_channel(db, channel, config, batch_size=10)
+    assert result.status == "done"
+    # Продолжение читает канал только после контрольной точки
+    assert client.min_ids == [checkpoint]
+    assert client.read == 600 - checkpoint
+
+    reference = Database(":memory:")
+    reference_result, _, _ = scan_channel(reference, channel, ChannelScanConfig(
+        "resume", "python, библиотека, фреймворк", "реклама, розыгрыш"))
+    assert saved_message_ids(db) == saved_message_ids(reference)
+    assert len(saved) + result.found == reference_result.found
+    reference.conn.close()
@@ -0,0 +1,117 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+import telegram_client
+from benchmarks.fake_telegram import create_client_wrapper, make_channel
+from telegram_client import TelegramClientWrapper
+
+KEYWORDS = ["python", "Python ", "библиотека", "фреймворк"]
+EXCLUDE_WORDS = ["реклама"]
+
+
+def scan(channel, server_search, **kwargs):
+    """
+    Сканирует канал через FakeTelegramClient; возвращает (сообщения, контрольная точка, число запросов).
+    """
+    async def run():
+        wrapper = create_client_wrapper([channel])
+        checkpoint = {}
+        messages = [message async for message in wrapper.iter_matching_messages(
+            channel.name, keywords=kwargs.pop("keywords", KEYWORDS), exclude_words=EXCLUDE_WORDS,
+            checkpoint=checkpoint, server_search=server_search, **kwargs)]
+        return messages, checkpoint, wrapper.client.requests
+
+    return asyncio.run(run())
+
+
+@pytest.fixture(scope="module")
+def channel():
+    channel = make_channel("server_search", 1000, "ru", text_length=80, topic_ratio=0.2)
+    # Сообщения с несколькими ключевыми словами находятся несколькими поисковыми запросами
+    for message in channel.messages[::7]:
+        if message.text:
+            message.text = message.message = message.text + " python и библиотека"
+    return channel
+
+
+def test_search_queries():
+    assert TelegramClientWrapper._search_queries(KEYWORDS) == ["python", "библиотека", "фреймворк"]
+    # Без ключевых слов или с пустым словом подходит любое сообщение — поиск неприменим
+    assert TelegramClientWrapper._search_queries(None) is None
+    assert TelegramClientWrapper._search_queries(["python", " "]) is None
+
+
+def test_server_search_matches_local_scan(channel):
+    local, local_checkpoint, _ = scan(channel, server_search=False)
+    found, checkpoint, _ = scan(channel, server_search=True)
+
+    ids = [message.id for message in found]
+    assert ids
+    assert len(ids) == len(set(ids))  # Сообщение с несколькими ключевыми словами отдается один раз
+    assert ids == sorted(ids)
+    assert ids == [message.id for message in local]
+    assert checkpoint == local_checkpoint == {"message_id": 1000, "message_date": channel.messages[-1].date}
+
+
+def test_server_search_reads_only_candidates(channel):
+    _, _, local_requests = scan(channel, server_search=False)
+    _, _, search_requests = scan(channel, server_search=True, keywords=["фреймворк"])
+    assert search_requests < local_requests
+
+
+def test_server_search_date_cutoff(channel):
+    # Граница между сообщениями; дата без часового пояса считается UTC
+    cutoff = channel.messages[600].date + timedelta(seconds=30)
+    found, _, _ = scan(channel, server_search=True, last_message_date=cutoff.replace(tzinfo=None))
+    local, _, _ = scan(channel, server_search=False, last_message_date=cutoff)
+
+    assert found
+    assert all(message.date > cutoff for message in found)
+    assert [message.id for message in found] == [message.id for message in local]
+
+
+def test_server_search_min_id_and_limit(channel):
+    found, checkpoint, _ = scan(channel, server_search=True, min_id=900)
+    assert found and all(message.id > 900 for message in found)
+    assert checkpoint["message_id"] == 1000
+
+    limited, _, _ = scan(channel, server_search=True, limit=3)
+    assert [message.id for message in limited] == [message.id for message in scan(channel, False)[0][:3]]
+
+    # Нет новых сообщений после min_id — поиск не выполняется
+    assert scan(channel, server_search=True, min_id=1000)[0] == []
+
+
+@pytest.fixture
+def no_reconnect(monkeypatch):
+    # Переподключение означало бы вход в настоящий Telegram; в тестах его быть не должно
+    def forbidden(*args, **kwargs):
+        raise AssertionError("Соединение с Telegram было закрыто раньше времени")
+
+    monkeypatch.setattr(telegram_client, "TelegramClient", forbidden)
+
+
+def test_shared_sessions_disconnect_after_last_release(no_reconnect):
+    async def run():
+        wrapper = create_client_wrapper([make_channel("shared", 10)])
+        wrapper.persistent = False
+        async with wrapper.session():
+            async with wrapper.session():
+                # Отдельный вызов внутри сессии не закрывает соединение
+                assert await wrapper.get_latest_message_id("shared") == 10
+            assert wrapper.is_connected
+        return wrapper.is_connected
+
+    assert asyncio.run(run()) is False
+
+
+def test_persistent_client_stays_connected(no_reconnect):
+    async def run():
+        wrapper = create_client_wrapper([make_channel("persistent", 10)])
+        async with wrapper.session():
+            pass
+        return wrapper.is_connected
+
+    assert asyncio.run(run()) is True
@@ -0,0 +1,81 @@
+import os
+
+from PIL import Image
+
+import thumbnail_cache
+from thumbnail_cache import ThumbnailCache
+
+
+class FakeWorker:
+    """
+    Запоминает фоновые вызовы вместо их выполнения.
+    """
+
+    def __init__(self):
+        self.calls = []
+
+    def submit_blocking(self, func, *args, track=True, **kwargs):
+        self.calls.append((func, args, track))
+
+
+def make_image(path, size=(800, 600), color="red"):
+    Image.new("RGB", size, color).save(path)
+    return str(path)
+
+
+def make_cache(tmp_path, **kwargs):
+    worker = FakeWorker()
+    return ThumbnailCache(worker, str(tmp_path / "thumbnails"), **kwargs), worker
+
+
+def test_background_work_is_not_registered_as_jobs(tmp_path):
+    cache, worker = make_cache(tmp_path)
+    image_path = make_image(tmp_path / "image.png")
+    cache.request(image_path, lambda photo: None)
+    cache.request(image_path, lambda photo: None)
+
+    # Очистка папки при запуске и одна загрузка на оба запроса, обе без задачи в строке состояния
+    assert [call[0] for call in worker.calls] == [cache.prune_disk, cache.load]
+    assert all(track is False for _, _, track in worker.calls)
+    assert len(cache.pending[cache.cache_key(image_path, thumbnail_cache.THUMBNAIL_SIZE)]) == 2
+
+
+def test_load_reuses_thumbnail_on_disk(tmp_path):
+    cache, _ = make_cache(tmp_path)
+    image_path = make_image(tmp_path / "image.png")
+    key = cache.cache_key(image_path, (100, 100))
+
+    image = cache.load(image_path, key, (100, 100))
+    assert image.size == (100, 75)
+    [name] = os.listdir(cache.directory)
+    thumbnail_path = os.path.join(cache.directory, name)
+    os.utime(thumbnail_path, (0, 0))
+
+    # Исходный файл больше не нужен: миниатюра читается с диска и отмечается как использованная
+    os.remove(image_path)
+    assert cache.load(image_path, key, (100, 100)).size == (100, 75)
+    assert os.path.getmtime(thumbnail_path) > 0
+
+
+def test_prune_disk_removes_least_recently_used(tmp_path):
+    cache, _ = make_cache(tmp_path, max_disk=2500)
+    for index in range(5):
+        path = os.path.join(cache.directory, f"{index}.png")
+        with open(path, "wb") as f:
+            f.write(b"\0" * 1000)
+        os.utime(path, (index * 100, index * 100))
+
+    assert cache.prune_disk() == 3
+    assert sorted(os.listdir(cache.directory)) == ["3.png", "4.png"]
+    assert cache.prune_disk() == 0
+
+
+def test_new_thumbnails_trigger_pruning(tmp_path, monkeypatch):
+    monkeypatch.setattr(thumbnail_cache, "PRUNE_INTERVAL", 3)
+    cache, _ = make_cache(tmp_path, max_disk=1)
+    for index in range(4):
+        image_path = make_image(tmp_path / f"image{index}.png")
+        cache.load(image_path, cache.cache_key(image_path, (100, 100)), (100, 100))
+
+    # Третья миниатюра запустила очистку, четвертая записана после нее
+    assert len(os.listdir(cache.directory)) == 1
@@ -0,0 +1,140 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+
+import transform_queue
+from database import Database
+from g4f_wrapper import TransformResult
+from transform_queue import TransformQueue
+
+
+class FakePipeline:
+    """
+    Замена run_transform_pipeline: первые failures вызовов для каждого текста завершаются ошибкой.
+    """
+
+    def __init__(self, failures=0):
+        self.failures = failures
+        self.calls = []
+
+    async def __call__(self, message_text, message_prompt=None, image_prompt=None, name_prompt=None):
+        self.calls.append(message_text)
+        result = TransformResult()
+        if self.calls.count(message_text) <= self.failures:
+            result.error = RuntimeError("Нейросеть недоступна")
+            return result
+        result.library_name = f"Название: {message_text}"
+        result.text = f"Текст: {message_text}"
+        result.image = f"generated_images/{len(self.calls)}.png"
+        return result
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    return str(tmp_path / "queue.db")
+
+
+@pytest.fixture
+def db(db_path):
+    database = Database(db_path)
+    yield database
+    database.conn.close()
+
+
+def enqueue_messages(db, count):
+    for i in range(count):
+        db.save_message("@channel", f"Сообщение {i}", datetime(2024, 1, 1) + timedelta(minutes=i), -100, i + 1)
+    return db.enqueue_transform_jobs(channel_name="@channel")
+
+
+def job_rows(db):
+    return db.cursor.execute(
+        "SELECT status, attempts, last_error, next_attempt_at, library_id FROM transform_jobs ORDER BY id").fetchall()
+
+
+def test_processes_all_jobs(db, monkeypatch):
+    pipeline = FakePipeline()
+    monkeypatch.setattr(transform_queue, "run_transform_pipeline", pipeline)
+    assert enqueue_messages(db, 7) == 7
+
+    progress = []
+    counts = asyncio.run(TransformQueue(db, workers=3).run(progress_callback=progress.append))
+
+    assert counts == {"pending": 0, "running": 0, "done": 7, "failed": 0}
+    assert len(progress) == 7 and progress[-1]["done"] == 7
+    assert sorted(pipeline.calls) == sorted(f"Сообщение {i}" for i in range(7))
+    assert len(db.get_transformed_libraries()) == 7
+    assert all(row[0] == "done" and row[1] == 1 and row[4] for row in job_rows(db))
+
+
+def test_retries_failed_jobs_until_success(db, monkeypatch):
+    monkeypatch.setattr(transform_queue, "run_transform_pipeline", FakePipeline(failures=2))
+    enqueue_messages(db, 2)
+
+    counts = asyncio.run(TransformQueue(db, workers=2, base_delay=0, poll_interval=0.01).run())
+
+    assert counts["done"] == 2
+    assert [(row[0], row[1], row[2]) for row in job_rows(db)] == [("done", 3, None), ("done", 3, None)]
+
+
+def test_marks_job_failed_after_max_attempts(db, monkeypatch):
+    monkeypatch.setattr(transform_queue, "run_transform_pipeline", FakePipeline(failures=10))
+    enqueue_messages(db, 1)
+
+    counts = asyncio.run(TransformQueue(db, max_attempts=3, base_delay=0, poll_interval=0.01).run())
+
+    assert counts["failed"] == 1
+    status, attempts, last_error, _, library_id = job_rows(db)[0]
+    assert (status, attempts, library_id) == ("failed", 3, None)
+    assert "Нейросеть недоступна" in last_error
+    # Неудачные задачи можно вернуть в очередь вручную
+    assert db.retry_failed_transform_jobs() == 1
+    assert db.get_transform_job_counts()["pending"] == 1
+
+
+def test_retry_is_scheduled_with_exponential_backoff(db, monkeypatch):
+    monkeypatch.setattr(transform_queue, "run_transform_pipeline", FakePipeline(failures=10))
+    monkeypatch.setattr(transform_queue.random, "uniform", lambda low, high: 1.0)
+    queue = TransformQueue(db, base_delay=30, max_delay=100)
+    assert [queue.retry_delay(attempt) for attempt in range(1, 5)] == [30, 60, 100, 100]
+
+    enqueue_messages(db, 1)
+    before = datetime.now()
+    asyncio.run(queue._process(1, db.claim_transform_job()))
+
+    status, attempts, _, next_attempt_at, _ = job_rows(db)[0]
+    assert (status, attempts) == ("pending", 1)
+    retry_at = datetime.fromisoformat(next_attempt_at)
+    assert before + timedelta(seconds=30) <= retry_at <= datetime.now() + timedelta(seconds=30)
+    # До назначенного времени задача не выдается
+    assert db.claim_transform_job() is None
+
+
+def test_interrupted_jobs_resume_after_restart(db_path, monkeypatch):
+    db = Database(db_path)
+    enqueue_messages(db, 3)
+    # Программа закрылась, когда задача выполнялась
+    assert db.claim_transform_job() is not None
+    db.close()
+
+    monkeypatch.setattr(transform_queue, "run_transform_pipeline", FakePipeline())
+    db = Database(db_path)
+    try:
+        counts = asyncio.run(TransformQueue(db).run())
+        assert counts["done"] == 3
+        assert sorted(row[1] for row in job_rows(db)) == [1, 1, 2]
+    finally:
+        db.close()
+
+
+def test_deleted_message_fails_job(db, monkeypatch):
+    pipeline = FakePipeline()
+    monkeypatch.setattr(transform_queue, "run_transform_pipeline", pipeline)
+    enqueue_messages(db, 1)
+    db.delete_message(1)
+
+    counts = asyncio.run(TransformQueue(db).run())
+
+    assert counts["failed"] == 1
+    assert pipeline.calls == []
@@ -0,0 +1,175 @@
+import asyncio
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta
+
+import pytest
+from telethon.errors import FloodWaitError
+
+import upload_queue
+from benchmarks.fake_telegram import FakeMessage
+from database import Database
+from upload_queue import ALBUM_SIZE, UploadQueue, enqueue_libraries
+
+
+class FakeUploadClient:
+    """
+    Замена TelegramClientWrapper для выгрузки: запоминает отправленное и может падать первые failures раз.
+    """
+
+    def __init__(self, failures=0, error=None, outgoing=None):
+        self.failures = failures
+        self.error = error or ConnectionError("Нет соединения")
+        self.outgoing = outgoing or []  # Сообщения, которые вернет get_recent_outgoing_messages
+        self.sent = []
+        self.sessions = 0
+        self.next_id = 100
+
+    @asynccontextmanager
+    async def session(self):
+        self.sessions += 1
+        yield self
+
+    async def send_media(self, channel_name, captions, image_paths):
+        if self.failures:
+            self.failures -= 1
+            raise self.error
+        self.sent.append((channel_name, list(captions), list(image_paths)))
+        ids = list(range(self.next_id, self.next_id + len(image_paths)))
+        self.next_id += len(image_paths)
+        return ids
+
+    async def get_recent_outgoing_messages(self, channel_name, since):
+        return self.outgoing
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    return str(tmp_path / "upload.db")
+
+
+@pytest.fixture
+def db(db_path):
+    database = Database(db_path)
+    yield database
+    database.conn.close()
+
+
+def make_libraries(count):
+    return [(i, f"Библиотека {i}", f"<b>Библиотека {i}</b> описание", f"images/{i}.png") for i in range(1, count + 1)]
+
+
+def job_rows(db):
+    return db.cursor.execute(
+        "SELECT status, attempts, last_error, next_attempt_at, sent_message_ids FROM upload_jobs ORDER BY id"
+    ).fetchall()
+
+
+def test_enqueue_libraries_groups_albums(db):
+    libraries = make_libraries(2 * ALBUM_SIZE + 3)
+    job_ids = enqueue_libraries(db, "@channel", libraries, album=True)
+
+    assert len(job_ids) == 3
+    jobs = [db.claim_upload_job() for _ in job_ids]
+    assert [len(job[3]) for job in jobs] == [ALBUM_SIZE, ALBUM_SIZE, 3]
+    # Подписи, изображения и порядок библиотек сохраняются внутри альбома
+    assert jobs[0][2] == [library[2] for library in libraries[:ALBUM_SIZE]]
+    assert jobs[2][3] == [library[3] for library in libraries[-3:]]
+
+
+def test_enqueue_libraries_one_job_per_library(db):
+    libraries = make_libraries(3)
+    assert len(enqueue_libraries(db, "@channel", libraries)) == 3
+    assert [db.claim_upload_job()[3] for _ in libraries] == [[library[3]] for library in libraries]
+
+
+def test_run_sends_jobs_in_order_through_one_session(db):
+    enqueue_libraries(db, "@channel", make_libraries(12), album=True)
+    client = FakeUploadClient()
+
+    progress = []
+    counts = asyncio.run(UploadQueue(db, client).run(progress_callback=progress.append))
+
+    assert counts["sent"] == 2 and counts["pending"] == 0
+    assert [len(images) for _, _, images in client.sent] == [10, 2]
+    assert client.sessions == 1
+    assert len(progress) == 2
+    assert [row[4] for row in job_rows(db)] == ["[100, 101, 102, 103, 104, 105, 106, 107, 108, 109]", "[110, 111]"]
+
+
+def test_failed_send_is_retried(db):
+    enqueue_libraries(db, "@channel", make_libraries(1))
+    client = FakeUploadClient(failures=2)
+
+    counts = asyncio.run(UploadQueue(db, client, base_delay=0, poll_interval=0.01).run())
+
+    assert counts["sent"] == 1
+    status, attempts, last_error, _, _ = job_rows(db)[0]
+    assert (status, attempts, last_error) == ("sent", 3, None)
+
+
+def test_job_fails_after_max_attempts(db):
+    enqueue_libraries(db, "@channel", make_libraries(1))
+
+    counts = asyncio.run(UploadQueue(db, FakeUploadClient(failures=10), max_attempts=2, base_delay=0,
+                                     poll_interval=0.01).run())
+
+    assert counts["failed"] == 1
+    status, attempts, last_error, _, _ = job_rows(db)[0]
+    assert (status, attempts) == ("failed", 2)
+    assert "Нет соединения" in last_error
+
+
+def test_flood_wait_delays_retry_at_least_as_requested(db, monkeypatch):
+    monkeypatch.setattr(upload_queue.random, "uniform", lambda low, high: 1.0)
+    enqueue_libraries(db, "@channel", make_libraries(1))
+    queue = UploadQueue(db, FakeUploadClient(failures=1, error=FloodWaitError(request=None, capture=600)),
+                        base_delay=30)
+    assert [queue.retry_delay(attempt) for attempt in range(1, 4)] == [30, 60, 120]
+
+    before = datetime.now()
+    asyncio.run(queue._send(db.claim_upload_job()))
+
+    status, attempts, _, next_attempt_at, _ = job_rows(db)[0]
+    assert (status, attempts) == ("pending", 1)
+    assert datetime.fromisoformat(next_attempt_at) >= before + timedelta(seconds=600)
+    assert db.claim_upload_job() is None
+
+
+def test_interrupted_send_found_in_channel_is_not_repeated(db_path):
+    db = Database(db_path)
+    enqueue_libraries(db, "@channel", make_libraries(2), album=True)
+    # Программа упала после отправки альбома, но до отметки о ней
+    assert db.claim_upload_job() is not None
+    db.close()
+
+    now = datetime.now()
+    outgoing = [FakeMessage(7, "Другое сообщение", now, -100, out=True),
+                FakeMessage(9, "Библиотека 2 описание", now, -100, out=True),
+                FakeMessage(8, "Библиотека 1 описание", now, -100, out=True)]
+    client = FakeUploadClient(outgoing=outgoing)
+    db = Database(db_path)
+    try:
+        counts = asyncio.run(UploadQueue(db, client).run())
+        assert counts["sent"] == 1
+        assert client.sent == []
+        assert db.get_upload_job(1) == ("sent", [8, 9], None)
+    finally:
+        db.close()
+
+
+def test_interrupted_send_missing_from_channel_is_sent_again(db_path):
+    db = Database(db_path)
+    enqueue_libraries(db, "@channel", make_libraries(1))
+    assert db.claim_upload_job() is not None
+    db.close()
+
+    client = FakeUploadClient(outgoing=[FakeMessage(7, "Другое сообщение", datetime.now(), -100, out=True)])
+    db = Database(db_path)
+    try:
+        counts = asyncio.run(UploadQueue(db, client, base_delay=0).run())
+        assert counts["sent"] == 1
+        assert len(client.sent) == 1
+        status, attempts, _, _, sent_ids = job_rows(db)[0]
+        assert (status, attempts, sent_ids) == ("sent", 2, "[100]")
+    finally:
+        db.close()
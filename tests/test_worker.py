@@ -0,0 +1,61 @@
+import time
+
+import pytest
+
+from worker import AsyncWorker
+
+
+class FakeRoot:
+    """
+    Вместо таймера Tk: обработка очереди GUI вызывается тестом через poll().
+    """
+
+    def __init__(self):
+        self.callback = None
+
+    def after(self, interval, callback):
+        self.callback = callback
+
+    def poll(self):
+        self.callback()
+
+
+@pytest.fixture
+def worker():
+    root = FakeRoot()
+    changes = []
+    worker = AsyncWorker(root, on_jobs_changed=changes.append)
+    worker.changes = changes
+    yield worker
+    worker.stop()
+
+
+def wait_for(worker, condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+        worker.root.poll()
+
+
+def test_blocking_call_is_tracked_as_job(worker):
+    results = []
+    job_id = worker.submit_blocking(sum, [1, 2, 3], on_done=results.append, description="Сумма")
+    assert worker.jobs == {job_id: "Сумма"}
+
+    wait_for(worker, lambda: results)
+    assert results == [6]
+    assert worker.jobs == {}
+    assert worker.changes == [{job_id: "Сумма"}, {}]
+
+
+def test_untracked_call_does_not_touch_jobs(worker):
+    results, errors = [], []
+    assert worker.submit_blocking(sum, [1, 2], on_done=results.append, track=False) is None
+    assert worker.submit_blocking(int, "не число", on_error=errors.append, track=False) is None
+
+    wait_for(worker, lambda: results and errors)
+    assert results == [3]
+    assert isinstance(errors[0], ValueError)
+    assert worker.jobs == {}
+    assert worker.changes == []
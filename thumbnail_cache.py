@@ -0,0 +1,158 @@
+import hashlib
+import itertools
+import logging
+import os
+import tempfile
+from collections import OrderedDict
+
+from PIL import Image, ImageTk
+
+THUMBNAILS_DIR = 'thumbnails'
+THUMBNAIL_SIZE = (100, 100)
+# Наибольший размер папки миниатюр и через сколько новых миниатюр он проверяется
+MAX_DISK_BYTES = 200 * 1024 * 1024
+PRUNE_INTERVAL = 200
+
+
+class ThumbnailCache:
+    """
+    Кэш уменьшенных изображений для GUI.
+
+    Уровень в памяти — LRU из готовых ImageTk.PhotoImage, ограниченный max_memory байт
+    (оценка: ширина * высота * 4). Уровень на диске — папка directory с заранее
+    уменьшенными PNG, имя которых зависит от пути, времени изменения и размера исходного
+    файла, так что измененное изображение уменьшается заново. Папка ограничена max_disk
+    байт: при запуске и после каждых PRUNE_INTERVAL новых миниатюр удаляются давно не
+    использовавшиеся (время изменения файла обновляется при каждом чтении).
+    Чтение и уменьшение выполняются в фоновом потоке через worker без регистрации задачи,
+    чтобы прокрутка списка не засоряла строку состояния; PhotoImage создается в потоке Tk.
+    """
+
+    def __init__(self, worker, directory=THUMBNAILS_DIR, max_memory=64 * 1024 * 1024, max_disk=MAX_DISK_BYTES):
+        self.worker = worker
+        self.directory = directory
+        self.max_memory = max_memory
+        self.max_disk = max_disk
+        self.memory = 0
+        self.photos = OrderedDict()  # Ключ -> (PhotoImage, оценка размера в байтах)
+        self.pending = {}  # Ключ -> обработчики, ждущие загрузки
+        self._writes = itertools.count(1)
+        os.makedirs(directory, exist_ok=True)
+        self.worker.submit_blocking(self.prune_disk, track=False)
+
+    @staticmethod
+    def cache_key(image_path, size):
+        try:
+            modified = os.path.getmtime(image_path)
+        except OSError:
+            modified = 0
+        return f"{os.path.abspath(image_path)}|{modified}|{size[0]}x{size[1]}"
+
+    def request(self, image_path, callback, size=THUMBNAIL_SIZE):
+        """
+        Передает callback(photo) уменьшенное изображение: сразу, если оно есть в памяти,
+        иначе после загрузки в фоне. При ошибке загрузки callback получает None.
+        Вызывается из потока Tk.
+        """
+        key = self.cache_key(image_path, size)
+        if key in self.photos:
+            self.photos.move_to_end(key)
+            callback(self.photos[key][0])
+            return
+
+        if key in self.pending:
+            self.pending[key].append(callback)
+            return
+        self.pending[key] = [callback]
+
+        self.worker.submit_blocking(
+            self.load, image_path, key, size,
+            on_done=lambda image: self._loaded(key, image),
+            on_error=lambda error: self._loaded(key, None),
+            track=False
+        )
+
+    def load(self, image_path, key, size):
+        """
+        Возвращает уменьшенное изображение (PIL) из дискового кэша или создает его.
+        Выполняется в фоновом потоке.
+        """
+        thumbnail_path = os.path.join(self.directory, hashlib.sha256(key.encode("utf-8")).hexdigest() + ".png")
+        try:
+            image = Image.open(thumbnail_path)
+            image.load()
+            # Отмечаем использование, чтобы очистка удаляла давно не нужные миниатюры
+            os.utime(thumbnail_path)
+            return image
+        except FileNotFoundError:
+            pass
+
+        image = Image.open(image_path)
+        image.draft("RGB", size)
+        image.thumbnail(size)
+
+        # Сохраняем через временный файл, чтобы не оставить недописанную миниатюру
+        descriptor, temp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(descriptor, 'wb') as f:
+                image.save(f, format="PNG")
+            os.replace(temp_path, thumbnail_path)
+        except Exception as e:
+            logging.error(f"Не удалось сохранить миниатюру {image_path}: {e}")
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+        if next(self._writes) % PRUNE_INTERVAL == 0:
+            self.prune_disk()
+        return image
+
+    def prune_disk(self):
+        """
+        Удаляет самые давно использованные миниатюры, пока папка больше max_disk байт.
+        Выполняется в фоновом потоке. Возвращает число удаленных файлов.
+        """
+        entries = []
+        total = 0
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+            total += stat.st_size
+        if total <= self.max_disk:
+            return 0
+
+        removed = 0
+        for _, size, path in sorted(entries):
+            if total <= self.max_disk:
+                break
+            try:
+                os.remove(path)
+                total -= size
+                removed += 1
+            except OSError as e:
+                logging.error(f"Не удалось удалить миниатюру {path}: {e}")
+        logging.info(f"Удалено старых миниатюр: {removed}.")
+        return removed
+
+    def _loaded(self, key, image):
+        callbacks = self.pending.pop(key, [])
+        photo = None
+        if image is not None:
+            photo = ImageTk.PhotoImage(image)
+            size = photo.width() * photo.height() * 4
+            self.photos[key] = (photo, size)
+            self.memory += size
+            self._evict()
+
+        for callback in callbacks:
+            try:
+                callback(photo)
+            except Exception as e:
+                logging.error(f"Ошибка при отображении изображения: {e}")
+
+    def _evict(self):
+        while self.memory > self.max_memory and len(self.photos) > 1:
+            key, (photo, size) = self.photos.popitem(last=False)
+            self.memory -= size
@@ -0,0 +1,119 @@
+import asyncio
+import logging
+import random
+from datetime import datetime, timedelta
+
+from async_database import resolve
+from g4f_wrapper import run_transform_pipeline
+
+
+class TransformQueue:
+    """
+    Пакетное преобразование сообщений из очереди transform_jobs в базе данных.
+
+    Задачи выполняют workers параллельных обработчиков; каждый забирает следующую
+    готовую задачу, прогоняет ее через run_transform_pipeline и сохраняет результат
+    через Database.save_transformed_library. Неудачная задача возвращается в очередь
+    с экспоненциальной задержкой, после max_attempts попыток помечается как failed.
+    Очередь хранится в базе, поэтому переживает перезапуск программы: задачи,
+    прерванные во время выполнения, при следующем запуске возвращаются в очередь.
+
+    База данных (Database или AsyncDatabase) используется только из потока цикла событий,
+    в котором работает run().
+    """
+
+    def __init__(self, db, workers=3, max_attempts=5, base_delay=30, max_delay=1800, poll_interval=2.0):
+        self.db = db
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.poll_interval = poll_interval
+        self._stopping = None
+
+    def retry_delay(self, attempt):
+        """
+        Задержка перед следующей попыткой: base_delay * 2^(attempt-1) со случайным разбросом, не больше max_delay.
+        """
+        delay = min(self.max_delay, self.base_delay * 2 ** (attempt - 1))
+        return delay * random.uniform(0.8, 1.2)
+
+    async def run(self, stop_when_empty=True, progress_callback=None):
+        """
+        Обрабатывает очередь, пока она не опустеет (или до вызова stop(), если stop_when_empty=False).
+        progress_callback(counts) получает число задач по статусам после каждой задачи.
+        Возвращает итоговые счетчики задач.
+        """
+        self._stopping = asyncio.Event()
+        await resolve(self.db.reset_running_transform_jobs())
+        logging.info(f"Запуск очереди преобразования: обработчиков {self.workers}.")
+
+        await asyncio.gather(*(self._work(number, stop_when_empty, progress_callback)
+                               for number in range(1, self.workers + 1)))
+
+        counts = await resolve(self.db.get_transform_job_counts())
+        logging.info(f"Очередь преобразования остановлена: {counts}")
+        return counts
+
+    def stop(self):
+        """
+        Просит обработчики завершиться после текущих задач. Вызывается из потока цикла событий.
+        """
+        if self._stopping is not None:
+            self._stopping.set()
+
+    async def _work(self, number, stop_when_empty, progress_callback):
+        while not self._stopping.is_set():
+            job = await resolve(self.db.claim_transform_job())
+            if job is None:
+                counts = await resolve(self.db.get_transform_job_counts())
+                if stop_when_empty and not counts['pending'] and not counts['running']:
+                    break
+                # Готовых задач нет: ждем повторных попыток или новых задач
+                try:
+                    await asyncio.wait_for(self._stopping.wait(), self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            await self._process(number, job)
+            await self._report(progress_callback)
+
+    async def _process(self, number, job):
+        job_id, message_id, message_text, message_prompt, image_prompt, name_prompt, attempt = job
+        logging.info(f"[обработчик {number}] Задача {job_id}: сообщение {message_id}, попытка {attempt}.")
+
+        if message_text is None:
+            await resolve(self.db.fail_transform_job(job_id, "Сообщение удалено из базы данных."))
+            return
+
+        try:
+            result = await run_transform_pipeline(message_text, message_prompt, image_prompt, name_prompt)
+            if result.error is not None:
+                raise result.error
+            if not result.text or not result.image:
+                raise ValueError("Не удалось преобразовать текст или сгенерировать изображение.")
+
+            library_id = await resolve(self.db.save_transformed_library(result.library_name, message_text,
+                                                                        result.text, result.image))
+            if library_id is None:
+                raise RuntimeError("Не удалось сохранить преобразованное сообщение.")
+            await resolve(self.db.complete_transform_job(job_id, library_id))
+            logging.info(f"[обработчик {number}] Задача {job_id} выполнена: {result.library_name}")
+        except Exception as e:
+            if attempt >= self.max_attempts:
+                logging.error(f"[обработчик {number}] Задача {job_id} не выполнена после {attempt} попыток: {e}")
+                await resolve(self.db.fail_transform_job(job_id, e))
+            else:
+                delay = self.retry_delay(attempt)
+                logging.error(f"[обработчик {number}] Ошибка в задаче {job_id}: {e}. "
+                              f"Повтор через {delay:.0f} с.")
+                retry_at = datetime.now() + timedelta(seconds=delay)
+                await resolve(self.db.fail_transform_job(job_id, e, retry_at))
+
+    async def _report(self, progress_callback):
+        if progress_callback:
+            try:
+                progress_callback(await resolve(self.db.get_transform_job_counts()))
+            except Exception as e:
+                logging.error(f"Ошибка в обработчике прогресса очереди: {e}")
@@ -0,0 +1,149 @@
+import asyncio
+import logging
+import random
+from datetime import datetime, timedelta
+
+from telethon.errors import FloodWaitError
+from telethon.extensions import html
+
+from async_database import resolve
+
+# Telegram принимает в одном альбоме не больше 10 изображений
+ALBUM_SIZE = 10
+
+
+def enqueue_libraries(db, channel_name, libraries, album=False):
+    """
+    Ставит преобразованные сообщения [(id, название, текст, путь к изображению), ...] в очередь выгрузки:
+    каждое отдельным сообщением или, при album=True, альбомами по ALBUM_SIZE изображений.
+    Возвращает список id задач.
+    """
+    groups = [libraries[i:i + ALBUM_SIZE] for i in range(0, len(libraries), ALBUM_SIZE)] if album \
+        else [[library] for library in libraries]
+    return [db.enqueue_upload_job(channel_name, [library[2] for library in group], [library[3] for library in group],
+                                  [library[0] for library in group])
+            for group in groups]
+
+
+class UploadQueue:
+    """
+    Выгрузка сообщений в Telegram из очереди upload_jobs в базе данных.
+
+    Все задачи отправляются последовательно через один постоянный клиент, каналы
+    запрашиваются у Telegram один раз (кэш сущностей клиента), а частоту запросов
+    ограничивает общий RateLimiter. После FloodWait или другой ошибки задача
+    возвращается в очередь с экспоненциальной задержкой (не меньше времени,
+    указанного Telegram), после max_attempts попыток помечается как failed.
+
+    Задача помечается как sending до отправки и как sent сразу после нее. Если программа
+    упала между этими шагами, при следующем запуске последние сообщения канала
+    сверяются с подписями задачи: найденное считается отправленным, иначе задача
+    возвращается в очередь. Так сбой не приводит ни к повторной публикации, ни к потере поста.
+    """
+
+    def __init__(self, db, telegram_client, max_attempts=5, base_delay=30, max_delay=1800, poll_interval=2.0):
+        self.db = db
+        self.telegram_client = telegram_client
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.poll_interval = poll_interval
+        self._stopping = None
+
+    def retry_delay(self, attempt, minimum=0):
+        delay = min(self.max_delay, self.base_delay * 2 ** (attempt - 1))
+        return max(minimum, delay * random.uniform(0.8, 1.2))
+
+    async def run(self, stop_when_empty=True, progress_callback=None):
+        """
+        Выгружает задачи из очереди, пока она не опустеет (или до stop(), если stop_when_empty=False).
+        Возвращает итоговые счетчики задач.
+        """
+        self._stopping = asyncio.Event()
+        async with self.telegram_client.session():
+            await self.reconcile()
+
+            while not self._stopping.is_set():
+                job = await resolve(self.db.claim_upload_job())
+                if job is None:
+                    counts = await resolve(self.db.get_upload_job_counts())
+                    if stop_when_empty and not counts['pending']:
+                        break
+                    try:
+                        await asyncio.wait_for(self._stopping.wait(), self.poll_interval)
+                    except asyncio.TimeoutError:
+                        pass
+                    continue
+
+                await self._send(job)
+                await self._report(progress_callback)
+
+        counts = await resolve(self.db.get_upload_job_counts())
+        logging.info(f"Очередь выгрузки остановлена: {counts}")
+        return counts
+
+    def stop(self):
+        """
+        Останавливает выгрузку после текущей задачи. Вызывается из потока цикла событий.
+        """
+        if self._stopping is not None:
+            self._stopping.set()
+
+    async def reconcile(self):
+        """
+        Разбирает задачи, оставшиеся в состоянии sending после сбоя.
+        """
+        jobs = await resolve(self.db.get_sending_upload_jobs())
+        for job_id, channel_name, captions, image_paths, started_at in jobs:
+            try:
+                message_ids = await self._find_sent(channel_name, captions, len(image_paths), started_at)
+            except Exception as e:
+                logging.error(f"Не удалось проверить выгрузку {job_id} в канале {channel_name}: {e}")
+                continue
+            if message_ids:
+                logging.info(f"Выгрузка {job_id} уже опубликована (сообщения {message_ids}), повтор не нужен.")
+                await resolve(self.db.complete_upload_job(job_id, message_ids))
+            else:
+                logging.info(f"Выгрузка {job_id} не была опубликована, задача возвращена в очередь.")
+                await resolve(self.db.fail_upload_job(job_id, "Отправка прервана", datetime.now()))
+
+    async def _find_sent(self, channel_name, captions, count, started_at):
+        if started_at is None:
+            return []
+        # Небольшой запас на расхождение часов с сервером Telegram
+        since = started_at - timedelta(minutes=1)
+        messages = await self.telegram_client.get_recent_outgoing_messages(channel_name, since)
+        expected = [html.parse(caption or "")[0] for caption in captions]
+
+        # Ищем подряд идущие сообщения (альбом) с теми же подписями
+        messages = sorted(messages, key=lambda message: message.id)
+        for start in range(len(messages) - count + 1):
+            candidate = messages[start:start + count]
+            if [message.message or "" for message in candidate] == expected:
+                return [message.id for message in candidate]
+        return []
+
+    async def _send(self, job):
+        job_id, channel_name, captions, image_paths, attempt = job
+        try:
+            message_ids = await self.telegram_client.send_media(channel_name, captions, image_paths)
+            await resolve(self.db.complete_upload_job(job_id, message_ids))
+            logging.info(f"Выгрузка {job_id} в канал {channel_name} выполнена.")
+        except Exception as e:
+            # FloodWait, не снятый повторами ограничителя, откладывает задачу не меньше чем на указанное время
+            minimum = e.seconds if isinstance(e, FloodWaitError) else 0
+            if attempt >= self.max_attempts:
+                logging.error(f"Выгрузка {job_id} не выполнена после {attempt} попыток: {e}")
+                await resolve(self.db.fail_upload_job(job_id, e))
+            else:
+                delay = self.retry_delay(attempt, minimum)
+                logging.error(f"Ошибка выгрузки {job_id}: {e}. Повтор через {delay:.0f} с.")
+                retry_at = datetime.now() + timedelta(seconds=delay)
+                await resolve(self.db.fail_upload_job(job_id, e, retry_at))
+
+    async def _report(self, progress_callback):
+        if progress_callback:
+            try:
+                progress_callback(await resolve(self.db.get_upload_job_counts()))
+            except Exception as e:
+                logging.error(f"Ошибка в обработчике прогресса выгрузки: {e}")
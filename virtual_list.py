@@ -0,0 +1,160 @@
+import logging
+import tkinter as tk
+from bisect import bisect_right
+from collections import OrderedDict
+from tkinter import ttk
+
+
+class VirtualListView(tk.Frame):
+    """
+    Список с виртуальной прокруткой для больших выборок из базы данных.
+
+    Виджеты создаются только для строк, помещающихся в окно (плюс запас), и
+    переиспользуются при прокрутке: строке просто передается другая запись.
+    Записи подгружаются страницами через fetch_page(cursor) -> (записи, следующий курсор)
+    по мере того, как пользователь прокручивает список вниз. В памяти хранятся только
+    max_pages последних использованных страниц; для остальных запоминаются курсор и
+    положение, и при возврате к ним страница загружается заново по тому же курсору.
+    """
+
+    def __init__(self, parent, fetch_page, create_row, update_row, row_height=110, limit=None, max_pages=5,
+                 **kwargs):
+        super().__init__(parent, **kwargs)
+        self.fetch_page = fetch_page
+        self.create_row = create_row
+        self.update_row = update_row
+        self.row_height = row_height
+        self.limit = limit
+        self.max_pages = max_pages
+
+        self.pages = OrderedDict()  # Номер страницы -> записи (только недавно использованные страницы)
+        self.page_cursors = [None]  # Курсор, по которому загружается каждая страница
+        self.page_starts = [0]  # Индекс первой записи каждой страницы; последний элемент — число записей
+        self.has_more = True
+        self.rows = []  # Пул переиспользуемых строк: (виджет, id окна на canvas)
+        self.row_indexes = []  # Индекс записи, показанной в каждой строке пула
+
+        self.canvas = tk.Canvas(self, highlightthickness=0)
+        self.canvas.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        self.scrollbar = ttk.Scrollbar(self, orient=tk.VERTICAL, command=self.canvas.yview)
+        self.scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        self.canvas.configure(yscrollcommand=self._on_scroll)
+
+        self.canvas.bind("<Configure>", self._on_configure)
+        self._bind_mousewheel(self.canvas)
+
+        self.load_more()
+
+    def _bind_mousewheel(self, widget):
+        widget.bind("<MouseWheel>", lambda e: self.canvas.yview_scroll(int(-1 * (e.delta / 120)), "units"))
+        widget.bind("<Button-4>", lambda e: self.canvas.yview_scroll(-1, "units"))
+        widget.bind("<Button-5>", lambda e: self.canvas.yview_scroll(1, "units"))
+
+    @property
+    def count(self):
+        """
+        Число записей во всех прочитанных страницах.
+        """
+        return self.page_starts[-1]
+
+    def _fetch(self, number):
+        try:
+            return self.fetch_page(self.page_cursors[number])
+        except Exception as e:
+            logging.error(f"Ошибка при загрузке страницы списка: {e}")
+            return [], None
+
+    def _store_page(self, number, records):
+        self.pages[number] = records
+        self.pages.move_to_end(number)
+        while len(self.pages) > self.max_pages:
+            self.pages.popitem(last=False)
+
+    def load_more(self):
+        """
+        Подгружает следующую страницу записей, если она есть.
+        """
+        if not self.has_more:
+            return
+        number = len(self.page_starts) - 1
+        records, cursor = self._fetch(number)
+
+        if self.limit is not None and self.count + len(records) >= self.limit:
+            records = records[:self.limit - self.count]
+            cursor = None
+        self._store_page(number, records)
+        self.page_starts.append(self.count + len(records))
+        self.has_more = cursor is not None and bool(records)
+        if self.has_more:
+            self.page_cursors.append(cursor)
+        self._update_scrollregion()
+
+    def get_record(self, index):
+        """
+        Возвращает запись по индексу, при необходимости заново загружая ее страницу.
+        """
+        number = bisect_right(self.page_starts, index) - 1
+        records = self.pages.get(number)
+        if records is None:
+            # Страница была вытеснена: загружаем ее по сохраненному курсору
+            records, _ = self._fetch(number)
+            records = records[:self.page_starts[number + 1] - self.page_starts[number]]
+            self._store_page(number, records)
+        else:
+            self.pages.move_to_end(number)
+        offset = index - self.page_starts[number]
+        return records[offset] if offset < len(records) else None
+
+    def _update_scrollregion(self):
+        # Пока есть непрочитанные страницы, оставляем место еще на одну
+        count = self.count + (len(self.rows) if self.has_more else 0)
+        self.canvas.configure(scrollregion=(0, 0, self.canvas.winfo_width(), count * self.row_height))
+
+    def _on_configure(self, event):
+        # Количество строк в пуле зависит от высоты окна
+        needed = event.height // self.row_height + 2
+        while len(self.rows) < needed:
+            row = self.create_row(self.canvas)
+            row.configure(height=self.row_height)
+            row.pack_propagate(False)
+            self._bind_mousewheel(row)
+            for child in row.winfo_children():
+                self._bind_mousewheel(child)
+            window = self.canvas.create_window(0, 0, window=row, anchor="nw", state="hidden")
+            self.rows.append((row, window))
+            self.row_indexes.append(None)
+
+        for row, window in self.rows:
+            self.canvas.itemconfigure(window, width=event.width)
+        self._update_scrollregion()
+        self.refresh()
+
+    def _on_scroll(self, first, last):
+        self.scrollbar.set(first, last)
+        self.refresh()
+
+    def refresh(self):
+        """
+        Раздает видимым строкам записи, соответствующие текущему положению прокрутки.
+        """
+        if not self.rows:
+            return
+        first_index = max(0, int(self.canvas.canvasy(0) // self.row_height))
+
+        # Подгружаем следующую страницу заранее, когда видимая часть подходит к концу загруженного
+        if self.has_more and first_index + len(self.rows) * 2 >= self.count:
+            self.load_more()
+
+        for offset, (row, window) in enumerate(self.rows):
+            index = first_index + offset
+            if self.row_indexes[offset] == index:
+                continue
+            record = self.get_record(index) if index < self.count else None
+            if record is None:
+                self.canvas.itemconfigure(window, state="hidden")
+                self.row_indexes[offset] = None
+            else:
+                self.update_row(row, record)
+                self.canvas.coords(window, 0, index * self.row_height)
+                self.canvas.itemconfigure(window, state="normal")
+                self.row_indexes[offset] = index
@@ -0,0 +1,136 @@
+import asyncio
+import itertools
+import logging
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+
+class AsyncWorker:
+    """
+    Фоновый цикл asyncio в отдельном потоке для долгих операций GUI.
+
+    Корутины (сканирование, выгрузка) выполняются в цикле рабочего потока, а блокирующие
+    функции (запросы к нейросети) — в пуле потоков этого цикла. Результаты, ошибки и
+    сообщения о прогрессе передаются в поток Tk через очередь, которую GUI забирает
+    по таймеру after(), поэтому виджеты трогаются только из главного потока.
+    """
+
+    def __init__(self, root, poll_interval=50, on_jobs_changed=None, max_threads=32):
+        self.root = root
+        self.poll_interval = poll_interval
+        self.on_jobs_changed = on_jobs_changed
+        self.jobs = {}  # Активные задачи: id -> описание (текущий прогресс)
+
+        self._job_ids = itertools.count(1)
+        self._ui_queue = queue.Queue()
+        self.loop = asyncio.new_event_loop()
+        # Пул потоков для блокирующих вызовов; потоки создаются по мере надобности
+        self.loop.set_default_executor(ThreadPoolExecutor(max_workers=max_threads, thread_name_prefix="async-worker"))
+        self.thread = threading.Thread(target=self._run_loop, name="async-worker", daemon=True)
+        self.thread.start()
+        self._poll()
+
+    def _run_loop(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+    def new_job(self, description="Задача"):
+        """
+        Регистрирует задачу и возвращает ее id. Нужен, когда корутина сообщает о прогрессе
+        по id задачи: id должен быть известен до того, как корутина начнет выполняться.
+        """
+        job_id = next(self._job_ids)
+        self.jobs[job_id] = description
+        self._notify_jobs_changed()
+        return job_id
+
+    def submit(self, coro, on_done=None, on_error=None, description="Задача", job_id=None, track=True):
+        """
+        Запускает корутину в фоновом цикле и возвращает id задачи
+        (job_id, полученный от new_job, или новый).
+        on_done(result) или on_error(exception) вызываются в потоке Tk.
+        track=False не регистрирует задачу (и возвращает None) — для мелких частых операций
+        вроде загрузки миниатюр, которые не должны появляться в строке состояния.
+        """
+        if job_id is None and track:
+            job_id = self.new_job(description)
+
+        future = asyncio.run_coroutine_threadsafe(coro, self.loop)
+        future.add_done_callback(
+            lambda f: self._ui_queue.put((self._finish_job, (job_id, f, on_done, on_error)))
+        )
+        return job_id
+
+    def submit_blocking(self, func, *args, on_done=None, on_error=None, description="Задача", track=True,
+                        **kwargs):
+        """
+        Запускает блокирующую функцию в пуле потоков фонового цикла.
+        """
+        async def run():
+            return await asyncio.to_thread(func, *args, **kwargs)
+
+        return self.submit(run(), on_done, on_error, description, track=track)
+
+    def call_in_ui(self, func, *args):
+        """
+        Выполняет func(*args) в потоке Tk; можно вызывать из любого потока.
+        """
+        self._ui_queue.put((func, args))
+
+    def report_progress(self, job_id, description):
+        """
+        Обновляет описание задачи (прогресс); можно вызывать из любого потока.
+        """
+        self.call_in_ui(self._set_job_description, job_id, description)
+
+    def run_sync(self, coro, timeout=None):
+        """
+        Выполняет корутину в фоновом цикле и ждет результат (блокирует вызывающий поток).
+        """
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result(timeout)
+
+    def stop(self, timeout=5):
+        """
+        Останавливает фоновый цикл и дожидается завершения потока.
+        """
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join(timeout)
+
+    def _set_job_description(self, job_id, description):
+        if job_id in self.jobs:
+            self.jobs[job_id] = description
+            self._notify_jobs_changed()
+
+    def _finish_job(self, job_id, future, on_done, on_error):
+        if job_id is not None:
+            self.jobs.pop(job_id, None)
+            self._notify_jobs_changed()
+
+        if future.cancelled():
+            logging.info(f"Задача {job_id} отменена.")
+            return
+        error = future.exception()
+        if error is not None:
+            logging.error(f"Ошибка в фоновой задаче {job_id}: {error}" if job_id is not None
+                          else f"Ошибка в фоновой операции: {error}")
+            if on_error:
+                on_error(error)
+        elif on_done:
+            on_done(future.result())
+
+    def _notify_jobs_changed(self):
+        if self.on_jobs_changed:
+            self.on_jobs_changed(dict(self.jobs))
+
+    def _poll(self):
+        while True:
+            try:
+                func, args = self._ui_queue.get_nowait()
+            except queue.Empty:
+                break
+            try:
+                func(*args)
+            except Exception as e:
+                logging.error(f"Ошибка в обработчике фоновой задачи: {e}")
+        self.root.after(self.poll_interval, self._poll)